@@ -0,0 +1,284 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Near-duplicate filter for generated Alpaca QA (MinHash + LSH banding).
+
+Shingles `instruction` + `output` into character k-grams, builds MinHash
+signatures in batched NumPy, buckets them with LSH bands and drops records whose
+estimated Jaccard similarity to an earlier kept record is >= threshold.
+Records are assigned greedily in corpus order, each one compared only against
+kept records, so a drop is always backed by a direct match to the record that
+stays (no A~B~C chains where A and C are not near-duplicates). Works on
+.jsonl (one record per line) and .json (list of records) files, e.g. the
+alpaca_output directories of data_gen_from_keywords_v4-Deepseek.py or the
+tcad_coder augmentation outputs.
+
+Usage:
+  python common/alpaca_dedup_minhash.py --in-dir data/sources/elmer/alpaca_output \
+      --out-dir data/sources/elmer/alpaca_output_dedup --threshold 0.8
+  python common/alpaca_dedup_minhash.py --self-check   # A~B~C chain regression check
+"""
+
+import os
+import sys
+import json
+import argparse
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+CONFIG = {
+    "THRESHOLD": 0.8,
+    "NUM_PERM": 128,
+    "SHINGLE": 5,
+    "SEED": 20250104,
+    "BATCH_SHINGLES": 1 << 16,
+    "REPORT_NAME": "dedup_report.jsonl",
+}
+
+_PRIME_MUL = np.uint64(1000003)
+
+
+def list_corpus_files(root: str) -> List[str]:
+    out = []
+    for dp, _, fns in os.walk(root):
+        for fn in fns:
+            if fn.endswith((".jsonl", ".json")):
+                out.append(os.path.join(dp, fn))
+    return sorted(out)
+
+
+def load_records(path: str) -> Tuple[List[Any], bool]:
+    """Return (records, is_jsonl). Unparseable jsonl lines are kept verbatim as strings."""
+    if path.endswith(".jsonl"):
+        recs: List[Any] = []
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                try:
+                    recs.append(json.loads(line))
+                except Exception:
+                    recs.append(line.rstrip("\n"))
+        return recs, True
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    return (data if isinstance(data, list) else [data]), False
+
+
+def record_text(rec: Any) -> Optional[str]:
+    if not isinstance(rec, dict):
+        return None
+    text = f"{rec.get('instruction') or ''}\n{rec.get('output') or ''}"
+    text = " ".join(text.lower().split())
+    return text or None
+
+
+def shingle_hashes(text: str, k: int) -> np.ndarray:
+    """Unique 64-bit rolling hashes of the character k-grams of text."""
+    codes = np.frombuffer(text.encode("utf-32-le"), dtype=np.uint32).astype(np.uint64)
+    n = len(codes) - k + 1
+    if n <= 0:
+        n, k = 1, len(codes)
+    h = np.zeros(n, dtype=np.uint64)
+    for j in range(k):
+        h = h * _PRIME_MUL + codes[j:j + n]
+    return np.unique(h)
+
+
+class MinHasher:
+    def __init__(self, num_perm: int, seed: int) -> None:
+        rng = np.random.default_rng(seed)
+        # Multiply-shift hashing: top 32 bits of (a*x + b) mod 2^64, a odd.
+        self.a = (rng.integers(1, 2 ** 63, size=(num_perm, 1), dtype=np.uint64) << np.uint64(1)) | np.uint64(1)
+        self.b = rng.integers(0, 2 ** 63, size=(num_perm, 1), dtype=np.uint64)
+        self.num_perm = num_perm
+
+    def signatures(self, shingle_sets: List[np.ndarray]) -> np.ndarray:
+        """Signatures (len(shingle_sets), num_perm) uint32 for one batch."""
+        lengths = np.array([len(s) for s in shingle_sets])
+        offsets = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+        flat = np.concatenate(shingle_sets)[None, :]
+        with np.errstate(over="ignore"):
+            hv = ((self.a * flat + self.b) >> np.uint64(32)).astype(np.uint32)
+        return np.minimum.reduceat(hv, offsets, axis=1).T.copy()
+
+
+def choose_bands(num_perm: int, threshold: float) -> Tuple[int, int]:
+    """(bands, rows) with bands*rows == num_perm whose S-curve midpoint is closest to threshold."""
+    best = (num_perm, 1)
+    best_err = float("inf")
+    for r in range(1, num_perm + 1):
+        if num_perm % r:
+            continue
+        b = num_perm // r
+        err = abs((1.0 / b) ** (1.0 / r) - threshold)
+        if err < best_err:
+            best, best_err = (b, r), err
+    return best
+
+
+def build_signatures(texts: List[str], hasher: MinHasher, k: int, batch_shingles: int) -> np.ndarray:
+    sigs = np.empty((len(texts), hasher.num_perm), dtype=np.uint32)
+    batch: List[np.ndarray] = []
+    start = 0
+    size = 0
+    for i, t in enumerate(texts):
+        sh = shingle_hashes(t, k)
+        if batch and size + len(sh) > batch_shingles:
+            sigs[start:start + len(batch)] = hasher.signatures(batch)
+            start += len(batch)
+            batch, size = [], 0
+        batch.append(sh)
+        size += len(sh)
+    if batch:
+        sigs[start:start + len(batch)] = hasher.signatures(batch)
+    return sigs
+
+
+def find_clusters(sigs: np.ndarray, threshold: float) -> List[int]:
+    """Greedy keep-first: owner[i] is the earlier kept record i duplicates, or i itself if kept.
+
+    Only kept records enter the LSH buckets, and a candidate is dropped only if its
+    full-signature similarity to that kept record is >= threshold.
+    """
+    n, num_perm = sigs.shape
+    bands, rows = choose_bands(num_perm, threshold)
+    keys = [np.ascontiguousarray(sigs[:, b * rows:(b + 1) * rows]) for b in range(bands)]
+    buckets: List[Dict[bytes, List[int]]] = [{} for _ in range(bands)]
+    owner = list(range(n))
+    for i in range(n):
+        cands = set()
+        for b in range(bands):
+            cands.update(buckets[b].get(keys[b][i].tobytes(), ()))
+        if cands:
+            reps = sorted(cands)
+            sims = np.mean(sigs[reps] == sigs[i], axis=1)
+            best = int(np.argmax(sims))  # ties go to the earliest kept record
+            if sims[best] >= threshold:
+                owner[i] = reps[best]
+                continue
+        for b in range(bands):
+            buckets[b].setdefault(keys[b][i].tobytes(), []).append(i)
+    return owner
+
+
+def dedup_corpus(in_dir: str, out_dir: str, threshold: float, num_perm: int, k: int, report_path: str) -> None:
+    files = list_corpus_files(in_dir)
+    if not files:
+        print(f"[Error] no .jsonl/.json files in {in_dir}")
+        return
+
+    corpus: List[Tuple[str, List[Any], bool]] = []
+    refs: List[Tuple[int, int]] = []
+    texts: List[str] = []
+    for fi, path in enumerate(files):
+        recs, is_jsonl = load_records(path)
+        corpus.append((path, recs, is_jsonl))
+        for ri, rec in enumerate(recs):
+            t = record_text(rec)
+            if t is not None:
+                refs.append((fi, ri))
+                texts.append(t)
+    print(f"[Load] files={len(files)} records={len(texts)}")
+
+    hasher = MinHasher(num_perm, CONFIG["SEED"])
+    sigs = build_signatures(texts, hasher, k, CONFIG["BATCH_SHINGLES"])
+    owner = find_clusters(sigs, threshold)
+
+    clusters: Dict[int, List[int]] = {}
+    for i in range(len(texts)):
+        clusters.setdefault(owner[i], []).append(i)
+
+    drop = set()
+    os.makedirs(os.path.dirname(report_path) or ".", exist_ok=True)
+    n_clusters = 0
+    with open(report_path, "w", encoding="utf-8") as rep:
+        for root, members in clusters.items():
+            if len(members) < 2:
+                continue
+            n_clusters += 1
+            keep = root
+            removed = [m for m in members if m != keep]
+            drop.update(removed)
+
+            def _ref(i: int) -> Dict[str, Any]:
+                fi, ri = refs[i]
+                rec = corpus[fi][1][ri]
+                return {
+                    "file": os.path.relpath(corpus[fi][0], in_dir),
+                    "index": ri,
+                    "instruction": (rec.get("instruction") or "")[:120],
+                    "est_jaccard": round(float(np.mean(sigs[i] == sigs[keep])), 3),
+                }
+
+            rep.write(json.dumps({"kept": _ref(keep), "removed": [_ref(m) for m in removed]}, ensure_ascii=False) + "\n")
+
+    drop_refs = {refs[i] for i in drop}
+    for fi, (path, recs, is_jsonl) in enumerate(corpus):
+        kept = [r for ri, r in enumerate(recs) if (fi, ri) not in drop_refs]
+        out_path = os.path.join(out_dir, os.path.relpath(path, in_dir))
+        os.makedirs(os.path.dirname(out_path), exist_ok=True)
+        with open(out_path, "w", encoding="utf-8") as f:
+            if is_jsonl:
+                for r in kept:
+                    f.write((r if isinstance(r, str) else json.dumps(r, ensure_ascii=False)) + "\n")
+            else:
+                json.dump(kept, f, ensure_ascii=False, indent=2)
+
+    print(f"[Done] records={len(texts)} clusters={n_clusters} removed={len(drop)} "
+          f"kept={len(texts) - len(drop)} -> {out_dir}")
+    print(f"[Report] {report_path}")
+
+
+def self_check(threshold: float = CONFIG["THRESHOLD"], num_perm: int = CONFIG["NUM_PERM"],
+               k: int = CONFIG["SHINGLE"]) -> bool:
+    """A~B and B~C are near-duplicates but A~C is not: C must survive, B must go."""
+    # Fixture seed chosen so that C shares an LSH band with B but not with A: the old
+    # union-find merge dropped C as a duplicate of A at est_jaccard ~0.72.
+    rng = np.random.default_rng(2)
+    words = [f"w{x}" for x in rng.integers(0, 10 ** 6, size=400)]
+    a = list(words)
+    b = list(a)
+    b[:36] = [f"b{x}" for x in range(36)]      # edit the head
+    c = list(b)
+    c[-36:] = [f"c{x}" for x in range(36)]     # then the tail
+    texts = [" ".join(t) for t in (a, b, c)]
+    sigs = build_signatures(texts, MinHasher(num_perm, CONFIG["SEED"]), k, CONFIG["BATCH_SHINGLES"])
+
+    def est(i: int, j: int) -> float:
+        return float(np.mean(sigs[i] == sigs[j]))
+
+    print(f"[Check] est_jaccard A~B={est(0, 1):.3f} B~C={est(1, 2):.3f} A~C={est(0, 2):.3f} threshold={threshold}")
+    if not (est(0, 1) >= threshold and est(1, 2) >= threshold and est(0, 2) < threshold):
+        print("[Error] fixture is not an A~B~C chain at this threshold")
+        return False
+    owner = find_clusters(sigs, threshold)
+    ok = owner == [0, 0, 2] and all(est(i, o) >= threshold for i, o in enumerate(owner) if o != i)
+    print(f"[{'OK' if ok else 'Error'}] owner={owner} (expected [0, 0, 2])")
+    return ok
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--in-dir")
+    ap.add_argument("--out-dir")
+    ap.add_argument("--threshold", type=float, default=CONFIG["THRESHOLD"], help="Jaccard threshold")
+    ap.add_argument("--num-perm", type=int, default=CONFIG["NUM_PERM"])
+    ap.add_argument("--shingle", type=int, default=CONFIG["SHINGLE"], help="character k-gram size")
+    ap.add_argument("--report", default=None, help=f"default: <out-dir>/{CONFIG['REPORT_NAME']}")
+    ap.add_argument("--self-check", action="store_true", help="run the A~B~C chain regression check and exit")
+    args = ap.parse_args()
+
+    if args.self_check:
+        sys.exit(0 if self_check(args.threshold, args.num_perm, args.shingle) else 1)
+    if not args.in_dir or not args.out_dir:
+        ap.error("--in-dir and --out-dir are required")
+
+    report = args.report or os.path.join(args.out_dir, CONFIG["REPORT_NAME"])
+    dedup_corpus(args.in_dir, args.out_dir, args.threshold, args.num_perm, args.shingle, report)
+
+
+if __name__ == "__main__":
+    main()
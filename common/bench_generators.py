@@ -0,0 +1,259 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Throughput benchmark for the LLM-driven generators against the offline mock
+server (common/mock_llm_server.py).
+
+Each stage runs in its own spawned process on synthetic input, with
+DEEPSEEK_BASE_URL pointed at the mock, and reports output records/sec, API
+requests/sec, peak RSS and peak thread count. Use it to measure the pipelines'
+own overhead and to regression-test concurrency changes without a live API.
+The `cache` column is the mock's simulated prompt-prefix cache hit rate.
+
+Stages: tcad_code_split, tcad_line_qa (batched), tcad_line_qa_single (one request
+per line), elmer_keyword_qa, tcad_keyword_qa, elmer_llm_instructions
+
+Note: the scripts' own retry back-off (up to 30 s in 0-code_split.py) applies to
+injected 429/5xx errors, so keep --p429/--p5xx small when timing.
+
+Usage:
+  python common/bench_generators.py --n 200 --latency lognormal:-2.5,0.5
+  python common/bench_generators.py --stages tcad_line_qa --n 50 --p429 0.05 --json-out bench.json
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import tempfile
+import argparse
+import resource
+import threading
+import importlib.util
+import multiprocessing
+import urllib.request
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+
+CONFIG = {
+    "N": 100,
+    "LATENCY": "uniform:0.02,0.08",
+    "WORKERS": 64,
+    "THREAD_SAMPLE_SECONDS": 0.02,
+}
+
+
+def load_module(name: str, rel_path: str):
+    spec = importlib.util.spec_from_file_location(name, os.path.join(ROOT, rel_path))
+    mod = importlib.util.module_from_spec(spec)
+    assert spec and spec.loader, f"Cannot load module: {rel_path}"
+    spec.loader.exec_module(mod)  # type: ignore
+    return mod
+
+
+def _write_json(path: str, obj: Any) -> None:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(obj, f, ensure_ascii=False)
+
+
+def _count_jsonl_lines(folder: str, suffix: str) -> int:
+    n = 0
+    for fn in os.listdir(folder):
+        if fn.endswith(suffix):
+            with open(os.path.join(folder, fn), "r", encoding="utf-8") as f:
+                n += sum(1 for line in f if line.strip())
+    return n
+
+
+# ---------------- stages: (setup, run) ----------------
+
+def _code_split(tmp: str, n: int, workers: int) -> int:
+    src, out = os.path.join(tmp, "cmd"), os.path.join(tmp, "code_block")
+    os.makedirs(src)
+    for i in range(n):
+        with open(os.path.join(src, f"dev{i:05d}.cmd"), "w", encoding="utf-8") as f:
+            f.write("File {\n  Grid = \"n1_msh.tdr\"\n}\n\nPhysics {\n  Mobility(DopingDep)\n}\n\n"
+                    "Solve {\n  Coupled { Poisson Electron }\n}\n")
+    mod = load_module("tcad_code_split", "tcad/IR_DPO/tcad_coder/0-code_split.py")
+    mod.process_cmd_files_in_directory(src, out)
+    total = 0
+    for fn in os.listdir(out):
+        if fn.endswith(".json"):
+            with open(os.path.join(out, fn), "r", encoding="utf-8") as f:
+                total += len(json.load(f).get("logical_blocks", []))
+    return total
+
+
+def _line_qa(batch_size: Optional[int]) -> Callable[[str, int, int], int]:
+    def _run(tmp: str, n: int, workers: int) -> int:
+        src, out = os.path.join(tmp, "code_line"), os.path.join(tmp, "line_qa")
+        for i in range(n):
+            lines = [{"code_line": f"Electrode {{ Name=\"c{j}\" Voltage={j}.0 }}", "explanation": "x"} for j in range(30)]
+            _write_json(os.path.join(src, f"dev{i:05d}.json"), {"annotated_blocks": [{"annotated_lines": lines}]})
+        mod = load_module("tcad_line_qa", "tcad/IR_DPO/tcad_coder/1-line_level_generation.py")
+        mod.input_folder, mod.output_folder = src, out
+        mod.process_all(max_workers=workers, batch_size=batch_size or mod.BATCH_SIZE)
+        return _count_jsonl_lines(out, "_lineqa.jsonl")
+    return _run
+
+
+def _keyword_qa(rel_path: str) -> Callable[[str, int, int], int]:
+    def _run(tmp: str, n: int, workers: int) -> int:
+        src, out = os.path.join(tmp, "keyword_pair.jsonl"), os.path.join(tmp, "alpaca.jsonl")
+        with open(src, "w", encoding="utf-8") as f:
+            for i in range(n):
+                rec = {"text": f"段落 {i}：Solver 段中 Linear System Solver = Iterative。", "keywords": ["Solver", "Iterative"],
+                       "success": True}
+                f.write(json.dumps(rec, ensure_ascii=False) + "\n")
+        mod = load_module("keyword_qa", rel_path)
+        mod.process_jsonl_file(src, out, {"total_all": 2 * n, "total_done": 0})
+        with open(out, "r", encoding="utf-8") as f:
+            return sum(1 for line in f if line.strip())
+    return _run
+
+
+def _llm_instructions(tmp: str, n: int, workers: int) -> int:
+    src, out = os.path.join(tmp, "cot"), os.path.join(tmp, "inst")
+    for i in range(n):
+        _write_json(os.path.join(src, f"case{i:05d}.json"), {
+            "alpaca_records": [{"instruction": f"编写一个稳态传热算例 {i}，温度 300 K。", "input": "", "output": ""}],
+            "dpo_pairs": {"code": [{"chosen": "", "rejected": ""}]},
+            "meta": {},
+        })
+    mod = load_module("elmer_llm_instructions", "elmer/IR_DPO_ELMER/5.LLM_instructions.py")
+    mod.MAX_WORKERS = workers
+    mod.run(src, out)
+    return len([fn for fn in os.listdir(out) if fn.endswith(".json")])
+
+
+STAGES: Dict[str, Callable[[str, int, int], int]] = {
+    "tcad_code_split": _code_split,
+    "tcad_line_qa": _line_qa(None),
+    "tcad_line_qa_single": _line_qa(1),
+    "elmer_keyword_qa": _keyword_qa("elmer/scripts/data_gen_from_keywords_v4-Deepseek.py"),
+    "tcad_keyword_qa": _keyword_qa("tcad/scripts/data_gen_from_keywords_v4-Deepseek.py"),
+    "elmer_llm_instructions": _llm_instructions,
+}
+
+
+# ---------------- child process ----------------
+
+def _child(stage: str, base_url: str, n: int, workers: int, verbose: bool, q: "multiprocessing.Queue") -> None:
+    os.environ["DEEPSEEK_BASE_URL"] = base_url
+    os.environ["DEEPSEEK_API_KEY"] = "sk-mock"
+    if not verbose:
+        devnull = os.open(os.devnull, os.O_WRONLY)
+        os.dup2(devnull, 1)
+        sys.stdout = open(os.devnull, "w")
+
+    peak_threads = [threading.active_count()]
+    stop = threading.Event()
+
+    def _sample() -> None:
+        while not stop.wait(CONFIG["THREAD_SAMPLE_SECONDS"]):
+            peak_threads[0] = max(peak_threads[0], threading.active_count())
+
+    threading.Thread(target=_sample, daemon=True).start()
+    tmp = tempfile.mkdtemp(prefix=f"bench_{stage}_")
+    cwd = os.getcwd()
+    os.chdir(tmp)  # stages write relative paths (fail logs, ...) under the scratch dir
+    try:
+        start = time.perf_counter()
+        records = STAGES[stage](tmp, n, workers)
+        seconds = time.perf_counter() - start
+        error = None
+    except BaseException as e:
+        records, seconds, error = 0, 0.0, f"{type(e).__name__}: {e}"
+    finally:
+        stop.set()
+        os.chdir(cwd)
+        shutil.rmtree(tmp, ignore_errors=True)
+    q.put({
+        "records": records,
+        "seconds": seconds,
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "peak_threads": peak_threads[0],
+        "error": error,
+    })
+
+
+def _server_stats(base_url: str) -> Dict[str, Any]:
+    with urllib.request.urlopen(base_url + "/stats", timeout=10) as r:
+        return json.loads(r.read())
+
+
+def _total(stats: Dict[str, Any]) -> Tuple[int, int, int, int]:
+    counts = stats["stages"]
+    ok = sum(v.get("200", 0) for v in counts.values())
+    all_ = sum(sum(v.values()) for v in counts.values())
+    cache = stats.get("cache") or {}
+    return ok, all_, cache.get("prompt_tokens", 0), cache.get("hit_tokens", 0)
+
+
+def run_stage(stage: str, base_url: str, n: int, workers: int, verbose: bool) -> Dict[str, Any]:
+    ctx = multiprocessing.get_context("spawn")
+    q = ctx.Queue()
+    before = _total(_server_stats(base_url))
+    p = ctx.Process(target=_child, args=(stage, base_url, n, workers, verbose, q))
+    p.start()
+    res = q.get()
+    p.join()
+    after = _total(_server_stats(base_url))
+    res["stage"] = stage
+    res["requests"] = after[1] - before[1]
+    res["errors_injected"] = (after[1] - after[0]) - (before[1] - before[0])
+    prompt_tokens = after[2] - before[2]
+    res["cache_hit_rate"] = (after[3] - before[3]) / prompt_tokens if prompt_tokens else 0.0
+    res["records_per_s"] = res["records"] / res["seconds"] if res["seconds"] else 0.0
+    res["requests_per_s"] = res["requests"] / res["seconds"] if res["seconds"] else 0.0
+    return res
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--stages", default=",".join(STAGES), help="comma-separated subset")
+    ap.add_argument("--n", type=int, default=CONFIG["N"], help="synthetic input units per stage")
+    ap.add_argument("--workers", type=int, default=CONFIG["WORKERS"], help="for stages with a workers knob")
+    ap.add_argument("--base-url", default=None, help="use an already running mock server")
+    ap.add_argument("--latency", default=CONFIG["LATENCY"])
+    ap.add_argument("--p429", type=float, default=0.0)
+    ap.add_argument("--p5xx", type=float, default=0.0)
+    ap.add_argument("--verbose", action="store_true", help="keep the stages' own output")
+    ap.add_argument("--json-out", default=None)
+    args = ap.parse_args()
+
+    base_url = args.base_url
+    if base_url is None:
+        spec = importlib.util.spec_from_file_location("mock_llm_server", os.path.join(HERE, "mock_llm_server.py"))
+        mock = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(mock)  # type: ignore
+        _, base_url = mock.start_in_thread(port=0, latency=args.latency, p429=args.p429, p5xx=args.p5xx)
+        print(f"[OK] mock server {base_url} latency={args.latency} p429={args.p429} p5xx={args.p5xx}")
+
+    results: List[Dict[str, Any]] = []
+    print(f"{'stage':<24}{'records':>9}{'sec':>9}{'rec/s':>9}{'req':>7}{'req/s':>9}{'errs':>6}{'cache':>7}{'rss_mb':>9}{'threads':>9}")
+    for stage in [s.strip() for s in args.stages.split(",") if s.strip()]:
+        if stage not in STAGES:
+            print(f"[Error] unknown stage {stage}")
+            continue
+        r = run_stage(stage, base_url, args.n, args.workers, args.verbose)
+        results.append(r)
+        if r["error"]:
+            print(f"{stage:<24} [Error] {r['error']}")
+            continue
+        print(f"{stage:<24}{r['records']:>9}{r['seconds']:>9.2f}{r['records_per_s']:>9.1f}{r['requests']:>7}"
+              f"{r['requests_per_s']:>9.1f}{r['errors_injected']:>6}{r['cache_hit_rate']:>7.0%}{r['peak_rss_mb']:>9.1f}{r['peak_threads']:>9}")
+
+    if args.json_out:
+        with open(args.json_out, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print(f"[Done] -> {args.json_out}")
+
+
+if __name__ == "__main__":
+    main()
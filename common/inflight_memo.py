@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Single-flight memo for expensive, thread-pooled LLM calls.
+
+The first thread asking for a key runs compute(); concurrent threads asking for
+the same key wait on its Future instead of issuing another call, later ones
+reuse the result. A result for which failed(result) is true, or a raised
+exception, is handed to the current waiters but not kept, so the next request
+for that key retries.
+
+Usage:
+  memo = InflightMemo()
+  out = memo.get(text_key(code), lambda: call_model(code), failed=lambda r: not r)
+  print(f"lookups={memo.lookups} calls={memo.calls} saved={memo.saved}")
+"""
+
+import hashlib
+import threading
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, Hashable, Optional
+
+
+def text_key(*parts: str) -> str:
+    """sha1 over the parts with trailing whitespace and surrounding blank lines ignored."""
+    norm = ["\n".join(line.rstrip() for line in (p or "").strip().splitlines()) for p in parts]
+    return hashlib.sha1("\x00".join(norm).encode("utf-8")).hexdigest()
+
+
+class InflightMemo:
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._entries: Dict[Hashable, Future] = {}
+        self.lookups = 0
+        self.calls = 0
+
+    @property
+    def saved(self) -> int:
+        return self.lookups - self.calls
+
+    @property
+    def saved_rate(self) -> float:
+        return self.saved / self.lookups if self.lookups else 0.0
+
+    def get(self, key: Hashable, compute: Callable[[], Any],
+            failed: Optional[Callable[[Any], bool]] = None) -> Any:
+        with self._lock:
+            self.lookups += 1
+            fut = self._entries.get(key)
+            owner = fut is None
+            if owner:
+                fut = self._entries[key] = Future()
+                self.calls += 1
+        if not owner:
+            return fut.result()  # re-raises the owner's exception
+        try:
+            result = compute()
+        except BaseException as e:
+            with self._lock:
+                self._entries.pop(key, None)
+            fut.set_exception(e)
+            raise
+        if failed is not None and failed(result):
+            with self._lock:
+                self._entries.pop(key, None)
+        fut.set_result(result)
+        return result
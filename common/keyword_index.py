@@ -0,0 +1,267 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Keyword index and budgeted request scheduler for keyword-driven QA generation.
+
+`build` reads the keyword_pair JSONL written by kaywords_gen_V6.py
+({"text", "keywords", "success"} per paragraph), canonicalizes every keyword
+(NFKC width folding, case, whitespace/dash variants, CJK-Latin spacing, generic
+CJK suffixes such as 模型/命令, "中文（English）" aliases) and records each
+(file, paragraph) occurrence.
+
+`schedule` caps the requests per canonical keyword, picking the most informative
+paragraphs (most mentions of the keyword, longer text, spread over files), and
+writes a keyword_pair directory in the same format, so
+data_gen_from_keywords_v4-Deepseek.py can consume it unchanged.
+
+Usage:
+  python common/keyword_index.py build --in-dir data/sources/elmer/keyword_pair --index keyword_index.jsonl
+  python common/keyword_index.py schedule --in-dir data/sources/elmer/keyword_pair --index keyword_index.jsonl \
+      --out-dir data/sources/elmer/keyword_pair_scheduled --per-keyword 3
+"""
+
+import os
+import re
+import json
+import math
+import argparse
+import unicodedata
+from collections import Counter, defaultdict
+from typing import Any, Dict, List, Optional, Tuple
+
+CONFIG = {
+    "PER_KEYWORD": 3,
+    "MIN_CANONICAL_LEN": 2,
+}
+
+CJK = r"㐀-鿿"
+GENERIC_CJK_SUFFIXES = ["模型", "方程", "命令", "指令", "参数", "关键字", "关键词", "选项", "模块", "函数", "语句"]
+ALIAS_RE = re.compile(r"^(?P<head>.+?)\s*[（(]\s*(?P<alias>[^()（）]+?)\s*[)）]$")
+DASH_RE = re.compile(r"[‐-―−_]+")
+SPACE_RE = re.compile(r"\s+")
+CJK_LATIN_GAP_RE = re.compile(rf"(?<=[{CJK}])\s+(?=[A-Za-z0-9])|(?<=[A-Za-z0-9])\s+(?=[{CJK}])")
+QUOTES = "\"'`“”‘’「」『』《》"
+
+
+def _has_cjk(s: str) -> bool:
+    return re.search(f"[{CJK}]", s) is not None
+
+
+def _fold(s: str) -> str:
+    s = unicodedata.normalize("NFKC", s).strip().strip(QUOTES).strip()
+    # "band-to-band", "band_to_band" and "band to band" are the same term.
+    s = DASH_RE.sub(" ", s).replace("-", " ")
+    s = SPACE_RE.sub(" ", s).strip()
+    s = CJK_LATIN_GAP_RE.sub("", s)
+    return s.casefold()
+
+
+def canonicalize(keyword: str) -> Optional[str]:
+    if not isinstance(keyword, str):
+        return None
+    s = _fold(keyword)
+    m = ALIAS_RE.match(s)
+    if m:
+        head, alias = m.group("head"), m.group("alias")
+        # "带-带隧穿（Band-to-Band Tunneling）" -> the Latin alias, which is what other files use.
+        if _has_cjk(head) and not _has_cjk(alias):
+            s = alias
+        else:
+            s = head
+    for suf in GENERIC_CJK_SUFFIXES:
+        if s.endswith(suf) and len(s) > len(suf) and not _has_cjk(s[: -len(suf)]):
+            s = s[: -len(suf)].strip()
+            break
+    s = s.strip(" :：,，;；.。")
+    if len(s) < CONFIG["MIN_CANONICAL_LEN"]:
+        return None
+    return s
+
+
+def iter_paragraphs(in_dir: str):
+    """Yield (file_rel, para_idx, record) for every keyword_pair line."""
+    files = []
+    for dp, _, fns in os.walk(in_dir):
+        for fn in fns:
+            if fn.endswith(".jsonl"):
+                files.append(os.path.join(dp, fn))
+    for path in sorted(files):
+        rel = os.path.relpath(path, in_dir)
+        with open(path, "r", encoding="utf-8") as f:
+            for idx, line in enumerate(f):
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    rec = json.loads(line)
+                except Exception:
+                    continue
+                yield rel, idx, rec
+
+
+def build_index(in_dir: str) -> Tuple[Dict[str, Dict[str, Any]], int]:
+    index: Dict[str, Dict[str, Any]] = {}
+    total = 0
+    for rel, idx, rec in iter_paragraphs(in_dir):
+        for kw in rec.get("keywords") or []:
+            total += 1
+            canon = canonicalize(kw)
+            if not canon:
+                continue
+            ent = index.setdefault(canon, {"canonical": canon, "variants": Counter(), "occurrences": []})
+            ent["variants"][kw] += 1
+            occ = [rel, idx]
+            if not ent["occurrences"] or ent["occurrences"][-1] != occ:
+                ent["occurrences"].append(occ)
+    return index, total
+
+
+def write_index(index: Dict[str, Dict[str, Any]], path: str) -> None:
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        for ent in sorted(index.values(), key=lambda e: -len(e["occurrences"])):
+            row = {
+                "canonical": ent["canonical"],
+                "variants": dict(ent["variants"].most_common()),
+                "occurrences": ent["occurrences"],
+            }
+            f.write(json.dumps(row, ensure_ascii=False) + "\n")
+
+
+def read_index(path: str) -> List[Dict[str, Any]]:
+    with open(path, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def surface_form(variants: Dict[str, int]) -> str:
+    """Most frequent NFKC-normalized variant; ties prefer forms written that way natively, then shorter."""
+    counts: Counter = Counter()
+    native = set()
+    for v, n in variants.items():
+        norm = unicodedata.normalize("NFKC", v).strip()
+        counts[norm] += n
+        if norm == v:
+            native.add(norm)
+    return min(counts.items(), key=lambda kv: (-kv[1], kv[0] not in native, len(kv[0]), kv[0]))[0]
+
+
+def mention_forms(canonical: str, variants: Dict[str, int]) -> List[str]:
+    forms = {_fold(v) for v in variants} | {canonical}
+    return sorted(f for f in forms if f)
+
+
+def paragraph_score(text: str, forms: List[str]) -> float:
+    low = _fold(text)
+    mentions = sum(low.count(f) for f in forms)
+    # Mentions dominate; length breaks ties toward fuller explanations.
+    return mentions + 0.1 * math.log1p(len(text))
+
+
+def schedule(
+    entries: List[Dict[str, Any]],
+    texts: Dict[Tuple[str, int], str],
+    per_keyword: int,
+    budget: Optional[int] = None,
+) -> Dict[Tuple[str, int], List[str]]:
+    """Return {(file, para_idx): [keyword surface forms to request]}."""
+    picks: List[Tuple[int, str, Tuple[str, int]]] = []
+    for ent in entries:
+        surface = surface_form(ent["variants"])
+        forms = mention_forms(ent["canonical"], ent["variants"])
+        scored = []
+        for rel, idx in ent["occurrences"]:
+            text = texts.get((rel, idx))
+            if text:
+                scored.append((paragraph_score(text, forms), rel, idx))
+        scored.sort(key=lambda x: (-x[0], x[1], x[2]))
+        chosen: List[Tuple[str, int]] = []
+        used_files = set()
+        # First pass prefers distinct files, second pass fills remaining slots.
+        for _, rel, idx in scored:
+            if len(chosen) >= per_keyword:
+                break
+            if rel not in used_files:
+                chosen.append((rel, idx))
+                used_files.add(rel)
+        for _, rel, idx in scored:
+            if len(chosen) >= per_keyword:
+                break
+            if (rel, idx) not in chosen:
+                chosen.append((rel, idx))
+        for rank, key in enumerate(chosen):
+            picks.append((rank, surface, key))
+
+    # Under a global budget, every keyword gets its best paragraph before any gets a second one.
+    picks.sort(key=lambda p: p[0])
+    if budget is not None:
+        picks = picks[:budget]
+
+    plan: Dict[Tuple[str, int], List[str]] = defaultdict(list)
+    for _, surface, key in picks:
+        plan[key].append(surface)
+    return plan
+
+
+def cmd_build(args) -> None:
+    index, total = build_index(args.in_dir)
+    write_index(index, args.index)
+    occ = sum(len(e["occurrences"]) for e in index.values())
+    print(f"[Done] keywords={total} canonical={len(index)} occurrences={occ} -> {args.index}")
+    for ent in sorted(index.values(), key=lambda e: -len(e["occurrences"]))[:10]:
+        print(f"  {ent['canonical']}: {len(ent['occurrences'])} paragraphs, {len(ent['variants'])} variants")
+
+
+def cmd_schedule(args) -> None:
+    if not os.path.exists(args.index):
+        index, _ = build_index(args.in_dir)
+        write_index(index, args.index)
+    entries = read_index(args.index)
+    records: Dict[Tuple[str, int], Dict[str, Any]] = {}
+    total_requests = 0
+    for rel, idx, rec in iter_paragraphs(args.in_dir):
+        records[(rel, idx)] = rec
+        total_requests += len(rec.get("keywords") or [])
+    texts = {k: (v.get("text") or "") for k, v in records.items()}
+
+    plan = schedule(entries, texts, args.per_keyword, args.budget)
+
+    by_file: Dict[str, List[Tuple[int, List[str]]]] = defaultdict(list)
+    for (rel, idx), kws in plan.items():
+        by_file[rel].append((idx, kws))
+    for rel, items in by_file.items():
+        out_path = os.path.join(args.out_dir, rel)
+        os.makedirs(os.path.dirname(out_path), exist_ok=True)
+        with open(out_path, "w", encoding="utf-8") as f:
+            for idx, kws in sorted(items):
+                f.write(json.dumps({"text": records[(rel, idx)].get("text") or "", "keywords": kws, "success": True},
+                                   ensure_ascii=False) + "\n")
+
+    scheduled = sum(len(v) for v in plan.values())
+    saved = 1.0 - scheduled / max(1, total_requests)
+    print(f"[Done] requests: {total_requests} -> {scheduled} ({saved:.1%} fewer), "
+          f"paragraphs={len(plan)} files={len(by_file)} -> {args.out_dir}")
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    b = sub.add_parser("build", help="build the canonical keyword index")
+    b.add_argument("--in-dir", required=True)
+    b.add_argument("--index", required=True)
+    s = sub.add_parser("schedule", help="write a budgeted keyword_pair directory")
+    s.add_argument("--in-dir", required=True)
+    s.add_argument("--index", required=True, help="built from --in-dir if missing")
+    s.add_argument("--out-dir", required=True)
+    s.add_argument("--per-keyword", type=int, default=CONFIG["PER_KEYWORD"])
+    s.add_argument("--budget", type=int, default=None, help="global cap on requests")
+    args = ap.parse_args()
+
+    if args.cmd == "build":
+        cmd_build(args)
+    else:
+        cmd_schedule(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Streaming markdown sectionizer shared by the document-driven generators
+(kaywords_gen_V6.py, data_gen_parallel_v6-general.py).
+
+Reads a markdown export line by line, drops image/figure lines, splits at `#`
+headings and yields sections from a generator. Small sections are merged with
+their neighbours up to a token budget instead of being discarded, and an
+oversized section is cut at line boundaries, so memory stays bounded by
+`max_tokens` no matter how large the export is.
+
+Usage:
+  python common/md_sectionizer.py manual.md --min-tokens 256 --max-tokens 2000
+"""
+
+import re
+import argparse
+from typing import Callable, Iterable, Iterator, List, Optional
+
+CONFIG = {
+    "MIN_TOKENS": 32,
+    "MAX_TOKENS": 1500,
+    # Pieces shorter than this carry nothing (a bare "#", page numbers).
+    "DROP_BELOW_CHARS": 10,
+}
+
+_CJK_RE = re.compile(r"[぀-ヿ㐀-䶿一-鿿가-힯＀-￯]")
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough BPE-style count: one token per CJK char, ~4 chars per token otherwise."""
+    cjk = len(_CJK_RE.findall(text))
+    rest = len(text) - cjk
+    return cjk + (rest + 3) // 4
+
+
+def iter_md_lines(file_path: str) -> Iterator[str]:
+    with open(file_path, "r", encoding="utf-8") as f:
+        for line in f:
+            if line.startswith("![]") or line.startswith("Figure"):
+                continue
+            yield line
+
+
+def iter_raw_sections(
+    lines: Iterable[str],
+    max_tokens: int,
+    token_len: Callable[[str], int] = estimate_tokens,
+) -> Iterator[str]:
+    """Split at headings; a section larger than max_tokens is emitted in line-aligned pieces."""
+    buf: List[str] = []
+    size = 0
+    for line in lines:
+        s = line.strip()
+        if line.startswith("#") and buf:
+            yield " ".join(buf).strip()
+            buf, size = [], 0
+        n = token_len(s) + 1
+        if buf and size + n > max_tokens:
+            yield " ".join(buf).strip()
+            buf, size = [], 0
+        buf.append(s)
+        size += n
+    if buf:
+        yield " ".join(buf).strip()
+
+
+def merge_sections(
+    sections: Iterable[str],
+    min_tokens: int,
+    max_tokens: int,
+    token_len: Callable[[str], int] = estimate_tokens,
+    drop_below_chars: int = CONFIG["DROP_BELOW_CHARS"],
+) -> Iterator[str]:
+    """Merge adjacent sections until each holds >= min_tokens (never exceeding max_tokens)."""
+    pending: List[str] = []
+    pending_tokens = 0
+    # The last full chunk is held back one step so a short tail can be folded into it.
+    held: Optional[str] = None
+    held_tokens = 0
+
+    def _flush() -> Optional[str]:
+        nonlocal pending, pending_tokens
+        text = "\n".join(pending)
+        pending, pending_tokens = [], 0
+        return text if len(text) >= drop_below_chars else None
+
+    for sec in sections:
+        if not sec:
+            continue
+        n = token_len(sec)
+        if pending and pending_tokens + n > max_tokens:
+            text = _flush()
+            if text is not None:
+                if held is not None:
+                    yield held
+                held, held_tokens = text, token_len(text)
+        pending.append(sec)
+        pending_tokens += n
+        if pending_tokens >= min_tokens:
+            text = _flush()
+            if text is not None:
+                if held is not None:
+                    yield held
+                held, held_tokens = text, token_len(text)
+
+    tail = "\n".join(pending)
+    if tail:
+        tail_tokens = token_len(tail)
+        if held is not None and tail_tokens < min_tokens and held_tokens + tail_tokens <= max_tokens:
+            held = held + "\n" + tail
+        else:
+            if held is not None:
+                yield held
+            held = tail if len(tail) >= drop_below_chars else None
+    if held is not None:
+        yield held
+
+
+def iter_sections(
+    file_path: str,
+    min_tokens: int = CONFIG["MIN_TOKENS"],
+    max_tokens: int = CONFIG["MAX_TOKENS"],
+    token_len: Callable[[str], int] = estimate_tokens,
+) -> Iterator[str]:
+    raw = iter_raw_sections(iter_md_lines(file_path), max_tokens, token_len)
+    return merge_sections(raw, min_tokens, max_tokens, token_len)
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("md_path")
+    ap.add_argument("--min-tokens", type=int, default=CONFIG["MIN_TOKENS"])
+    ap.add_argument("--max-tokens", type=int, default=CONFIG["MAX_TOKENS"])
+    args = ap.parse_args()
+
+    count = 0
+    total = 0
+    largest = 0
+    for sec in iter_sections(args.md_path, args.min_tokens, args.max_tokens):
+        n = estimate_tokens(sec)
+        count += 1
+        total += n
+        largest = max(largest, n)
+    print(f"[Done] sections={count} tokens={total} avg={total / max(1, count):.0f} max={largest}")
+
+
+if __name__ == "__main__":
+    main()
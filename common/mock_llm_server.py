@@ -0,0 +1,298 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Offline OpenAI-compatible mock server for the generation scripts.
+
+Serves POST /chat/completions (and /v1/chat/completions) with canned content in
+the JSON shape each stage expects, after a latency drawn from a configurable
+distribution, and injects 429 / 5xx errors at configurable rates. Prefix caching
+is simulated DeepSeek-style (usage.prompt_cache_hit_tokens), so prompt layout
+changes show up offline. GET /stats returns request counts per stage and status
+and the cache totals.
+
+Point a stage at it with the env vars the scripts read:
+  DEEPSEEK_BASE_URL=http://127.0.0.1:8765 DEEPSEEK_API_KEY=sk-mock python tcad/IR_DPO/tcad_coder/1-line_level_generation.py
+
+Latency specs:
+  fixed:0.2  uniform:0.1,0.8  lognormal:-1.5,0.6  exp:0.3   (seconds)
+
+Usage:
+  python common/mock_llm_server.py --port 8765 --latency lognormal:-1.5,0.6 --p429 0.02 --p5xx 0.01
+"""
+
+import re
+import json
+import time
+import hashlib
+import random
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+CONFIG = {
+    "HOST": "127.0.0.1",
+    "PORT": 8765,
+    "LATENCY": "fixed:0",
+    "P429": 0.0,
+    "P5XX": 0.0,
+    "SEED": 0,
+    # Prefix cache simulation: DeepSeek caches in 64-token units (~192 chars here).
+    "CACHE_UNIT_CHARS": 192,
+    "CACHE_MAX_ENTRIES": 1_000_000,
+}
+
+
+def parse_latency(spec: str) -> Callable[[random.Random], float]:
+    kind, _, args = spec.partition(":")
+    vals = [float(x) for x in args.split(",") if x]
+    if kind == "fixed":
+        return lambda rng: vals[0] if vals else 0.0
+    if kind == "uniform":
+        return lambda rng: rng.uniform(vals[0], vals[1])
+    if kind == "lognormal":
+        return lambda rng: rng.lognormvariate(vals[0], vals[1])
+    if kind == "exp":
+        return lambda rng: rng.expovariate(1.0 / vals[0])
+    raise ValueError(f"unknown latency spec: {spec}")
+
+
+# ---------------- canned outputs per stage ----------------
+
+def _code_split(msgs: List[Dict[str, str]], rng: random.Random) -> str:
+    code = msgs[-1]["content"]
+    chunks = [c for c in re.split(r"\n\s*\n", code) if c.strip()] or [code]
+    blocks = [{"block_content": c, "description": f"逻辑块 {i + 1}"} for i, c in enumerate(chunks)]
+    return json.dumps({"logical_blocks": blocks, "original_file": "mock.cmd"}, ensure_ascii=False)
+
+
+def _code_lines(msgs: List[Dict[str, str]], rng: random.Random) -> str:
+    m = re.search(r"代码块如下：\n\n(.*?)\n\n请将", msgs[-1]["content"], re.S)
+    lines = [ln.strip() for ln in (m.group(1) if m else "").splitlines() if ln.strip() and not ln.strip().startswith(";")]
+    return json.dumps([{"code_line": ln, "explanation": "模拟解释"} for ln in lines], ensure_ascii=False)
+
+
+def _line_qa_batch(msgs: List[Dict[str, str]], rng: random.Random) -> str:
+    body = msgs[-1]["content"].split("代码行（按编号）：", 1)[-1]
+    idx = [int(m) for m in re.findall(r"^\[(\d+)\] ", body, re.M)]
+    return json.dumps([{"index": i, "instruction": f"模拟指令 {i}", "input": "", "output": "模拟输出"} for i in idx],
+                      ensure_ascii=False)
+
+
+def _line_qa(msgs: List[Dict[str, str]], rng: random.Random) -> str:
+    return json.dumps({"instruction": "模拟指令", "input": "", "output": "模拟输出"}, ensure_ascii=False)
+
+
+def _keyword_qa(msgs: List[Dict[str, str]], rng: random.Random) -> str:
+    n = rng.randint(1, 3)
+    return json.dumps([{"instruction": f"模拟问题 {i}", "input": "", "output": "模拟回答"} for i in range(n)],
+                      ensure_ascii=False)
+
+
+def _instruction_variants(msgs: List[Dict[str, str]], rng: random.Random) -> str:
+    return json.dumps([f"模拟改写指令 {i}" for i in range(3)], ensure_ascii=False)
+
+
+def _keywords(msgs: List[Dict[str, str]], rng: random.Random) -> str:
+    return json.dumps({"keywords": ["Solver", "Mesh DB"]}, ensure_ascii=False)
+
+
+def _judge(msgs: List[Dict[str, str]], rng: random.Random) -> str:
+    return json.dumps({"correct": rng.random() < 0.5, "reason": "模拟判定"}, ensure_ascii=False)
+
+
+def _default(msgs: List[Dict[str, str]], rng: random.Random) -> str:
+    return "mock response"
+
+
+# (stage, regex over system+user text, generator); first match wins.
+STAGE_RULES: List[Tuple[str, "re.Pattern[str]", Callable[[List[Dict[str, str]], random.Random], str]]] = [
+    ("judge", re.compile(r"评测裁判"), _judge),  # first: judged answers may quote any other stage's markers
+    ("code_split", re.compile(r'"logical_blocks"'), _code_split),
+    ("code_split_line", re.compile(r'"code_line"'), _code_lines),
+    ("line_qa_batch", re.compile(r"代码行（按编号）："), _line_qa_batch),
+    ("line_qa", re.compile(r"Alpaca 格式的问答对"), _line_qa),
+    ("instruction_variants", re.compile(r"指令改写助手"), _instruction_variants),
+    ("keywords", re.compile(r'"keywords"'), _keywords),
+    ("keyword_qa", re.compile(r"关键词"), _keyword_qa),
+]
+
+
+def route(messages: List[Dict[str, str]]) -> Tuple[str, Callable[[List[Dict[str, str]], random.Random], str]]:
+    text = "\n".join(str(m.get("content") or "") for m in messages)
+    for name, pat, fn in STAGE_RULES:
+        if pat.search(text):
+            return name, fn
+    return "default", _default
+
+
+def _rough_tokens(text: str) -> int:
+    return max(1, len(text) // 3)
+
+
+class MockState:
+    def __init__(self, latency: str, p429: float, p5xx: float, seed: int) -> None:
+        self.latency = parse_latency(latency)
+        self.p429 = p429
+        self.p5xx = p5xx
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.counts: Dict[str, Dict[str, int]] = {}
+        self.prefixes: set = set()
+        self.prompt_tokens = 0
+        self.hit_tokens = 0
+
+    def cache_lookup(self, text: str) -> int:
+        """Characters of text covered by the longest previously seen unit-aligned prefix."""
+        unit = CONFIG["CACHE_UNIT_CHARS"]
+        h = hashlib.sha1()
+        digests = []
+        for i in range(0, len(text) - unit + 1, unit):
+            h.update(text[i:i + unit].encode("utf-8"))
+            digests.append(h.digest())
+        with self.lock:
+            hit = 0
+            for k, d in enumerate(digests):
+                if d not in self.prefixes:
+                    break
+                hit = (k + 1) * unit
+            if len(self.prefixes) > CONFIG["CACHE_MAX_ENTRIES"]:
+                self.prefixes.clear()
+            self.prefixes.update(digests)
+        return hit
+
+    def count_tokens(self, prompt: int, hit: int) -> None:
+        with self.lock:
+            self.prompt_tokens += prompt
+            self.hit_tokens += hit
+
+    def draw(self) -> Tuple[float, float, random.Random]:
+        with self.lock:
+            return self.latency(self.rng), self.rng.random(), random.Random(self.rng.random())
+
+    def count(self, stage: str, status: int) -> None:
+        with self.lock:
+            per = self.counts.setdefault(stage, {})
+            per[str(status)] = per.get(str(status), 0) + 1
+
+
+class Handler(BaseHTTPRequestHandler):
+    state: MockState = None  # set by make_server
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, fmt: str, *args: Any) -> None:
+        pass
+
+    def _send(self, status: int, obj: Dict[str, Any], headers: Optional[Dict[str, str]] = None) -> None:
+        body = json.dumps(obj, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self) -> None:
+        if self.path.rstrip("/") == "/stats":
+            with self.state.lock:
+                self._send(200, {"stages": self.state.counts,
+                                 "cache": {"prompt_tokens": self.state.prompt_tokens,
+                                           "hit_tokens": self.state.hit_tokens}})
+        elif self.path.rstrip("/") in ("/models", "/v1/models"):
+            self._send(200, {"object": "list", "data": [{"id": "mock", "object": "model"}]})
+        else:
+            self._send(404, {"error": {"message": "not found"}})
+
+    def do_POST(self) -> None:
+        length = int(self.headers.get("Content-Length") or 0)
+        try:
+            req = json.loads(self.rfile.read(length) or b"{}")
+        except ValueError:
+            self._send(400, {"error": {"message": "invalid json"}})
+            return
+        if self.path.rstrip("/") not in ("/chat/completions", "/v1/chat/completions"):
+            self._send(404, {"error": {"message": "not found"}})
+            return
+
+        messages = req.get("messages") or []
+        stage, gen = route(messages)
+        delay, roll, rng = self.state.draw()
+        time.sleep(delay)
+
+        if roll < self.state.p429:
+            self.state.count(stage, 429)
+            self._send(429, {"error": {"message": "rate limited (mock)", "type": "rate_limit_error"}},
+                       {"Retry-After": "1"})
+            return
+        if roll < self.state.p429 + self.state.p5xx:
+            status = rng.choice([500, 502, 503])
+            self.state.count(stage, status)
+            self._send(status, {"error": {"message": "server error (mock)", "type": "server_error"}})
+            return
+
+        content = gen(messages, rng)
+        prompt_text = "".join(f"<{m.get('role')}>{m.get('content') or ''}" for m in messages)
+        prompt_tokens = _rough_tokens(prompt_text)
+        hit_tokens = min(prompt_tokens, self.state.cache_lookup(prompt_text) // 3)
+        self.state.count_tokens(prompt_tokens, hit_tokens)
+        completion_tokens = _rough_tokens(content)
+        n = int(req.get("n") or 1)
+        self.state.count(stage, 200)
+        self._send(200, {
+            "id": f"mock-{int(time.time() * 1000)}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": req.get("model") or "mock",
+            "choices": [
+                {"index": i, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}
+                for i in range(n)
+            ],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "prompt_cache_hit_tokens": hit_tokens,
+                "prompt_cache_miss_tokens": prompt_tokens - hit_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+            },
+        })
+
+
+def make_server(host: str = CONFIG["HOST"], port: int = CONFIG["PORT"], latency: str = CONFIG["LATENCY"],
+                p429: float = CONFIG["P429"], p5xx: float = CONFIG["P5XX"], seed: int = CONFIG["SEED"]) -> ThreadingHTTPServer:
+    """Build a server (port 0 picks a free port); run it with serve_forever() in a thread."""
+    handler = type("BoundHandler", (Handler,), {"state": MockState(latency, p429, p5xx, seed)})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+
+def start_in_thread(**kwargs: Any) -> Tuple[ThreadingHTTPServer, str]:
+    server = make_server(**kwargs)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    host, port = server.server_address[:2]
+    return server, f"http://{host}:{port}"
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--host", default=CONFIG["HOST"])
+    ap.add_argument("--port", type=int, default=CONFIG["PORT"])
+    ap.add_argument("--latency", default=CONFIG["LATENCY"])
+    ap.add_argument("--p429", type=float, default=CONFIG["P429"])
+    ap.add_argument("--p5xx", type=float, default=CONFIG["P5XX"])
+    ap.add_argument("--seed", type=int, default=CONFIG["SEED"])
+    args = ap.parse_args()
+
+    server = make_server(args.host, args.port, args.latency, args.p429, args.p5xx, args.seed)
+    print(f"[OK] mock LLM server on http://{args.host}:{server.server_address[1]} "
+          f"(latency={args.latency}, p429={args.p429}, p5xx={args.p5xx})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Prompt templates with a byte-identical static prefix, plus prompt-cache accounting.
+
+Provider prompt caching (DeepSeek context caching, OpenAI cached input) bills and
+serves the longest previously seen prefix much cheaper. A PromptTemplate always
+renders [system, user] messages in which the system text and the instruction
+block are fixed strings and the variable payload is appended last, fields ordered
+from most shared to least shared (e.g. paragraph before keyword, so all keywords
+of one paragraph share the paragraph in their cached prefix).
+
+CacheStats reads cache-hit tokens from `usage`:
+  DeepSeek: usage.prompt_cache_hit_tokens / prompt_cache_miss_tokens
+  OpenAI:   usage.prompt_tokens_details.cached_tokens
+"""
+
+import hashlib
+import threading
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+
+class PromptTemplate:
+    def __init__(self, name: str, system: str, instruction: str, fields: Sequence[Tuple[str, str]],
+                 sep: str = "\n\n") -> None:
+        """fields: (label, payload key) pairs, most shared first; labels are static text too."""
+        self.name = name
+        self.system = system
+        self.instruction = instruction
+        self.fields = list(fields)
+        self.sep = sep
+        self.prefix_sha1 = hashlib.sha1((system + "\x00" + instruction).encode("utf-8")).hexdigest()[:12]
+
+    def render_user(self, **payload: Any) -> str:
+        missing = [key for _, key in self.fields if key not in payload]
+        if missing:
+            raise KeyError(f"template {self.name}: missing payload fields {missing}")
+        parts = [self.instruction]
+        for label, key in self.fields:
+            parts.append(f"{label}\n{payload[key]}")
+        return self.sep.join(parts)
+
+    def messages(self, **payload: Any) -> List[Dict[str, str]]:
+        return [
+            {"role": "system", "content": self.system},
+            {"role": "user", "content": self.render_user(**payload)},
+        ]
+
+
+def _get(obj: Any, name: str) -> Any:
+    if obj is None:
+        return None
+    if isinstance(obj, dict):
+        return obj.get(name)
+    return getattr(obj, name, None)
+
+
+class CacheStats:
+    """Thread-safe accumulator of prompt-cache usage across calls."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.prompt_tokens = 0
+        self.hit_tokens = 0
+
+    def record(self, usage: Any) -> Optional[int]:
+        """Add one response's usage; returns its cache-hit tokens (None if not reported)."""
+        if usage is None:
+            return None
+        prompt = _get(usage, "prompt_tokens") or 0
+        hit = _get(usage, "prompt_cache_hit_tokens")
+        if hit is None:
+            hit = _get(_get(usage, "prompt_tokens_details"), "cached_tokens")
+        with self._lock:
+            self.calls += 1
+            self.prompt_tokens += prompt
+            self.hit_tokens += hit or 0
+        return hit
+
+    def summary(self) -> str:
+        with self._lock:
+            rate = self.hit_tokens / self.prompt_tokens if self.prompt_tokens else 0.0
+            return (f"[Cache] calls={self.calls} prompt_tokens={self.prompt_tokens} "
+                    f"cache_hit_tokens={self.hit_tokens} hit_rate={rate:.1%}")
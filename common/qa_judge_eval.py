@@ -0,0 +1,407 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+LLM-as-judge evaluation for the Elmer / TCAD QA test sets.
+
+Joins each model's answers to the gold set by question text (TCAD falls back to
+the numeric id), judges every (question, gold, answer) concurrently, and reports
+per-model accuracy with a bootstrap confidence interval. Judgements are cached in
+an append-only JSONL keyed by sha1(question, gold, answer, judge model, judge
+prompt), so re-scoring a new checkpoint only sends the answers that changed.
+
+Gold sets:
+  Elmer: Elmer_QA_testset.txt   question line followed by "答案：..." / "答：..."
+  TCAD:  TCAD_QA_testset.xlsx   columns 编号 / 问题 / 参考答案 (requires `openpyxl`)
+Answer files:
+  *.jsonl  {"question", "answer": {"text"} | str}     (elmer/QA_test/elmer_*.jsonl)
+  *.json   [{"id", "question", "answer"}]             (tcad/QA_test/*.json)
+
+Output rows match elmer_deepseek_judge_v2.jsonl:
+  {"key": "041:gpt4o", "question", "gold", "model", "answer", "correct", "reason"}
+
+Usage:
+  python common/qa_judge_eval.py --gold elmer/QA_test/Elmer_QA_testset.txt \
+      --answers elmer/QA_test/elmer_gpt4o.jsonl elmer_gradio=elmer/QA_test/elmer_gradio.jsonl \
+      --out elmer/QA_test/elmer_judge.jsonl
+  python common/qa_judge_eval.py --gold tcad/QA_test/TCAD_QA_testset.xlsx --answers tcad/QA_test/*.json --out tcad_judge.jsonl
+  python common/qa_judge_eval.py --from-judged elmer/QA_test/elmer_deepseek_judge_v2.jsonl   # accuracy only
+"""
+
+import os
+import re
+import json
+import time
+import hashlib
+import argparse
+import threading
+import importlib.util
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+CONFIG = {
+    "JUDGE_MODEL": "deepseek-chat",
+    "WORKERS": 32,
+    "MAX_RETRIES": 3,
+    "BOOTSTRAP": 2000,
+    "CI": 0.95,
+    "SEED": 0,
+    "CACHE": "qa_judge_cache.jsonl",
+}
+
+
+def load_module(name: str, path: str):
+    spec = importlib.util.spec_from_file_location(name, path)
+    mod = importlib.util.module_from_spec(spec)
+    assert spec and spec.loader, f"Cannot load module: {path}"
+    spec.loader.exec_module(mod)  # type: ignore
+    return mod
+
+
+prompt_templates = load_module("prompt_templates", os.path.join(HERE, "prompt_templates.py"))
+
+JUDGE_INSTRUCTION = """
+你是一个严格的仿真软件问答评测裁判。消息末尾依次给出问题、标准答案和待评测回答。
+
+判定规则：
+- 待评测回答包含标准答案中的关键信息（关键字名称、section 名称、取值、文件名、公式或结论）且没有与之矛盾的说法，判为正确；
+- 表述方式、语言、详略不同不影响判定；多出的正确补充信息不扣分；
+- 遗漏关键信息、给出错误的关键字/数值、答非所问或把软件理解成别的东西，判为错误。
+
+只输出一个 JSON 对象：{"correct": true 或 false, "reason": "一句中文理由"}
+"""
+
+JUDGE_TEMPLATE = prompt_templates.PromptTemplate(
+    name="qa_judge",
+    system="你是一个评测裁判，输出必须是结构化 JSON。",
+    instruction=JUDGE_INSTRUCTION,
+    fields=[("问题：", "question"), ("标准答案：", "gold"), ("待评测回答：", "answer")],
+)
+
+
+# ---------------- gold sets ----------------
+
+def _norm_q(text: str) -> str:
+    return re.sub(r"\s+", " ", text or "").strip()
+
+
+def load_elmer_gold(path: str) -> List[Dict[str, Any]]:
+    gold, question = [], None
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            s = line.strip()
+            if not s:
+                continue
+            m = re.match(r"^(答案|答)\s*[：:]\s*(.*)$", s)
+            if m and question is not None:
+                gold.append({"id": len(gold) + 1, "question": question, "gold": m.group(2).strip()})
+                question = None
+            else:
+                question = s
+    return gold
+
+
+def load_tcad_gold(path: str) -> List[Dict[str, Any]]:
+    try:
+        import openpyxl
+    except ImportError:
+        raise SystemExit("[Error] reading the TCAD xlsx test set requires `openpyxl` (pip install openpyxl)")
+    ws = openpyxl.load_workbook(path, read_only=True, data_only=True).worksheets[0]
+    rows = ws.iter_rows(values_only=True)
+    header = [str(c).strip() if c is not None else "" for c in next(rows)]
+    col = {name: header.index(name) for name in ("编号", "问题", "参考答案")}
+    gold = []
+    for row in rows:
+        q, a = row[col["问题"]], row[col["参考答案"]]
+        if not q or a is None:
+            continue
+        idx = row[col["编号"]]
+        gold.append({"id": int(idx) if idx is not None else len(gold) + 1, "question": str(q).strip(),
+                     "gold": str(a).strip()})
+    return gold
+
+
+def load_gold(path: str) -> List[Dict[str, Any]]:
+    return load_tcad_gold(path) if path.lower().endswith((".xlsx", ".xlsm")) else load_elmer_gold(path)
+
+
+# ---------------- answer files ----------------
+
+def parse_answer_spec(spec: str) -> Tuple[str, str]:
+    """'name=path' or 'path' (name = file stem, without the elmer_ prefix)."""
+    if "=" in spec and not os.path.exists(spec):
+        name, path = spec.split("=", 1)
+        return name, path
+    stem = os.path.splitext(os.path.basename(spec))[0]
+    return re.sub(r"^elmer_", "", stem), spec
+
+
+def load_answers(path: str) -> List[Dict[str, Any]]:
+    with open(path, "r", encoding="utf-8") as f:
+        if path.endswith(".jsonl"):
+            items = [json.loads(line) for line in f if line.strip()]
+        else:
+            items = json.load(f)
+    out = []
+    for it in items:
+        ans = it.get("answer")
+        if isinstance(ans, dict):
+            ans = ans.get("text", "")
+        out.append({"id": it.get("id"), "question": it.get("question", ""), "answer": str(ans or "").strip()})
+    return out
+
+
+def join_answers(gold: List[Dict[str, Any]], answers: List[Dict[str, Any]]) -> Tuple[Dict[int, str], int]:
+    """gold id -> answer; matches on question text, then on id. Returns (joined, unmatched count)."""
+    by_q: Dict[str, List[int]] = {}
+    for g in gold:
+        by_q.setdefault(_norm_q(g["question"]), []).append(g["id"])  # the TCAD set repeats a few questions
+    ids = {g["id"] for g in gold}
+    joined: Dict[int, str] = {}
+    unmatched = 0
+    for a in answers:
+        aid = int(a["id"]) if a["id"] is not None else None
+        free = [gid for gid in by_q.get(_norm_q(a["question"]), []) if gid not in joined]
+        if free:
+            gid = aid if aid in free else free[0]
+        elif aid in ids and aid not in joined:
+            gid = aid
+        else:
+            unmatched += 1
+            continue
+        joined[gid] = a["answer"]
+    return joined, unmatched
+
+
+# ---------------- judge + cache ----------------
+
+class JudgeCache:
+    """Append-only JSONL cache: {"ck", "correct", "reason"}."""
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.lock = threading.Lock()
+        self.data: Dict[str, Dict[str, Any]] = {}
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        rec = json.loads(line)
+                        self.data[rec["ck"]] = rec
+                    except (ValueError, KeyError):
+                        continue  # torn last line after a crash
+
+    def get(self, ck: str) -> Optional[Dict[str, Any]]:
+        return self.data.get(ck)
+
+    def put(self, ck: str, correct: bool, reason: str) -> None:
+        rec = {"ck": ck, "correct": correct, "reason": reason}
+        with self.lock:
+            self.data[ck] = rec
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(rec, ensure_ascii=False) + "\n")
+
+
+def cache_key(question: str, gold: str, answer: str, judge_model: str) -> str:
+    h = hashlib.sha1()
+    for part in (question, gold, answer, judge_model, JUDGE_TEMPLATE.system, JUDGE_TEMPLATE.instruction):
+        h.update(part.encode("utf-8"))
+        h.update(b"\x00")
+    return h.hexdigest()
+
+
+def _parse_verdict(text: str) -> Tuple[bool, str]:
+    text = re.sub(r"```(json)?", "", text, flags=re.IGNORECASE).strip()
+    m = re.search(r"\{.*\}", text, re.S)
+    obj = json.loads(m.group(0) if m else text)
+    correct = obj.get("correct")
+    if isinstance(correct, str):
+        correct = correct.strip().lower() in ("true", "yes", "1", "正确", "是")
+    if not isinstance(correct, bool):
+        raise ValueError(f"bad verdict: {text[:200]}")
+    return correct, str(obj.get("reason", "")).strip()
+
+
+def make_judge(judge_model: str, cache_stats: Any):
+    import openai
+
+    # DEEPSEEK_BASE_URL / DEEPSEEK_API_KEY 可覆盖（例如指向 common/mock_llm_server.py）
+    client = openai.Client(api_key=os.environ.get("DEEPSEEK_API_KEY", "sk-REDACTED"),
+                           base_url=os.environ.get("DEEPSEEK_BASE_URL", "https://api.deepseek.com"))
+
+    def judge(question: str, gold: str, answer: str) -> Tuple[bool, str]:
+        last: Optional[Exception] = None
+        for attempt in range(CONFIG["MAX_RETRIES"]):
+            try:
+                response = client.chat.completions.create(
+                    model=judge_model,
+                    messages=JUDGE_TEMPLATE.messages(question=question, gold=gold, answer=answer),
+                    temperature=0,
+                )
+                cache_stats.record(getattr(response, "usage", None))
+                return _parse_verdict(response.choices[0].message.content or "")
+            except Exception as e:
+                last = e
+                time.sleep(2 * (2 ** attempt))
+        raise RuntimeError(f"judge failed after {CONFIG['MAX_RETRIES']} attempts: {last}")
+
+    return judge
+
+
+# ---------------- accuracy ----------------
+
+def bootstrap_ci(correct: np.ndarray, n_boot: int, ci: float, seed: int) -> Tuple[float, float]:
+    if len(correct) == 0:
+        return 0.0, 0.0
+    rng = np.random.default_rng(seed)
+    idx = rng.integers(0, len(correct), size=(n_boot, len(correct)))
+    means = correct[idx].mean(axis=1)
+    alpha = (1.0 - ci) / 2
+    return float(np.quantile(means, alpha)), float(np.quantile(means, 1 - alpha))
+
+
+def report(rows: List[Dict[str, Any]], n_boot: int = CONFIG["BOOTSTRAP"], ci: float = CONFIG["CI"],
+           seed: int = CONFIG["SEED"]) -> List[Dict[str, Any]]:
+    by_model: Dict[str, List[bool]] = {}
+    for r in rows:
+        if isinstance(r.get("correct"), bool):
+            by_model.setdefault(r["model"], []).append(r["correct"])
+    table = []
+    print(f"{'model':<28}{'n':>6}{'acc':>8}   {int(ci * 100)}% CI")
+    for model in sorted(by_model, key=lambda m: -np.mean(by_model[m])):
+        arr = np.asarray(by_model[model], dtype=np.float64)
+        lo, hi = bootstrap_ci(arr, n_boot, ci, seed)
+        table.append({"model": model, "n": len(arr), "accuracy": float(arr.mean()), "ci_low": lo, "ci_high": hi})
+        print(f"{model:<28}{len(arr):>6}{arr.mean():>8.3f}   [{lo:.3f}, {hi:.3f}]")
+    return table
+
+
+# ---------------- main ----------------
+
+def apply_prejudge(todo: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Decide clear passes/fails locally (common/qa_prejudge.py); returns the ambiguous jobs."""
+    if not todo:
+        return todo
+    qa_prejudge = load_module("qa_prejudge", os.path.join(HERE, "qa_prejudge.py"))
+    decision, rules, _ = qa_prejudge.score([(j["gold"], j["answer"]) for j in todo])
+    rest = []
+    for job, d, rule in zip(todo, decision, rules):
+        if d < 0:
+            rest.append(job)
+        else:
+            job["correct"], job["reason"] = bool(d), f"[prejudge:{rule}]"
+    print(f"[OK] prejudge decided {len(todo) - len(rest)}/{len(todo)} locally")
+    return rest
+
+
+def evaluate(gold_path: str, answer_specs: List[str], out_path: str, cache_path: str,
+             judge_model: str = CONFIG["JUDGE_MODEL"], workers: int = CONFIG["WORKERS"],
+             prejudge: bool = False) -> List[Dict[str, Any]]:
+    gold = load_gold(gold_path)
+    gold_by_id = {g["id"]: g for g in gold}
+    print(f"[OK] gold set {gold_path}: {len(gold)} questions")
+
+    jobs: List[Dict[str, Any]] = []
+    for spec in answer_specs:
+        model, path = parse_answer_spec(spec)
+        joined, unmatched = join_answers(gold, load_answers(path))
+        print(f"[OK] {model:<24} answers={len(joined)} unmatched={unmatched} missing={len(gold) - len(joined)}")
+        for gid, answer in joined.items():
+            g = gold_by_id[gid]
+            jobs.append({"key": f"{gid:03d}:{model}", "question": g["question"], "gold": g["gold"],
+                         "model": model, "answer": answer, "correct": None, "reason": ""})
+
+    cache = JudgeCache(cache_path)
+    todo = []
+    for job in jobs:
+        job["_ck"] = cache_key(job["question"], job["gold"], job["answer"], judge_model)
+        hit = cache.get(job["_ck"])
+        if hit:
+            job["correct"], job["reason"] = hit["correct"], hit["reason"]
+        else:
+            todo.append(job)
+    print(f"[OK] {len(jobs)} answers, {len(jobs) - len(todo)} cached, {len(todo)} to judge ({judge_model})")
+    if prejudge:
+        todo = apply_prejudge(todo)
+
+    errors = cache_errors = 0
+    if todo:
+        cache_stats = prompt_templates.CacheStats()
+        judge = make_judge(judge_model, cache_stats)
+        with ThreadPoolExecutor(max_workers=workers) as ex:
+            futures = {ex.submit(judge, j["question"], j["gold"], j["answer"]): j for j in todo}
+            for done, fut in enumerate(as_completed(futures), 1):
+                job = futures[fut]
+                try:
+                    job["correct"], job["reason"] = fut.result()
+                except Exception as e:
+                    errors += 1
+                    print(f"[Error] {job['key']}: {e}")
+                else:
+                    try:
+                        cache.put(job["_ck"], job["correct"], job["reason"])
+                    except OSError as e:  # verdict is kept, it is just not cached
+                        cache_errors += 1
+                        print(f"[Error] cache write {job['key']}: {e}")
+                if done % 50 == 0 or done == len(todo):
+                    print(f"  judged {done}/{len(todo)}")
+        print(cache_stats.summary())
+        if cache_errors:
+            print(f"[Error] {cache_errors} verdicts could not be written to {cache_path}")
+
+    rows = []
+    for job in sorted(jobs, key=lambda j: (j["model"], j["key"])):
+        job.pop("_ck")
+        rows.append(job)
+    if out_path:
+        os.makedirs(os.path.dirname(os.path.abspath(out_path)), exist_ok=True)
+        with open(out_path, "w", encoding="utf-8") as f:
+            for r in rows:
+                if r["correct"] is not None:
+                    f.write(json.dumps(r, ensure_ascii=False) + "\n")
+        print(f"[Done] {len(rows) - errors} judged rows -> {out_path} (errors={errors})")
+    return rows
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--gold", help="Elmer_QA_testset.txt or TCAD_QA_testset.xlsx")
+    ap.add_argument("--answers", nargs="+", default=[], help="answer files, optionally name=path")
+    ap.add_argument("--out", default=None, help="judged JSONL (judge_v2 format)")
+    ap.add_argument("--cache", default=None, help=f"judgement cache (default: {CONFIG['CACHE']} next to --out)")
+    ap.add_argument("--judge-model", default=CONFIG["JUDGE_MODEL"])
+    ap.add_argument("--workers", type=int, default=CONFIG["WORKERS"])
+    ap.add_argument("--prejudge", action="store_true", help="decide clear cases locally (common/qa_prejudge.py)")
+    ap.add_argument("--bootstrap", type=int, default=CONFIG["BOOTSTRAP"])
+    ap.add_argument("--ci", type=float, default=CONFIG["CI"])
+    ap.add_argument("--report-json", default=None, help="write the accuracy table as JSON")
+    ap.add_argument("--from-judged", nargs="+", default=None, help="only report accuracy of existing judged JSONL files")
+    args = ap.parse_args()
+
+    if args.from_judged:
+        rows = []
+        for path in args.from_judged:
+            with open(path, "r", encoding="utf-8") as f:
+                rows.extend(json.loads(line) for line in f if line.strip())
+    else:
+        if not args.gold or not args.answers:
+            ap.error("--gold and --answers are required unless --from-judged is given")
+        cache_path = args.cache or os.path.join(os.path.dirname(os.path.abspath(args.out)) if args.out else ".",
+                                                CONFIG["CACHE"])
+        rows = evaluate(args.gold, args.answers, args.out, cache_path, args.judge_model, args.workers,
+                        args.prejudge)
+
+    table = report(rows, args.bootstrap, args.ci)
+    if args.report_json:
+        with open(args.report_json, "w", encoding="utf-8") as f:
+            json.dump(table, f, ensure_ascii=False, indent=2)
+        print(f"[Done] -> {args.report_json}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,269 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Local fast-path scorer for the QA test sets, run before the LLM judge.
+
+Many gold answers are single facts (`Mesh DB`, `End`, `Check Keywords "Warn"`,
+`TEST.PASSED`). For those, a normalized exact / contains match, key-term and
+CJK-bigram overlap and numeric consistency against `gold` decide most clear
+passes and fails locally; only the ambiguous rest needs the judge model.
+
+Features are extracted once per text; recall against each gold is computed for
+all (gold, answer) pairs at once with numpy incidence matrices over the gold
+feature vocabulary, so scoring every model's answers is one batched pass.
+
+Decisions: 1 = pass, 0 = fail, -1 = ambiguous (send to the LLM judge).
+
+CONFIG thresholds and the typed_keyword rule were tuned on
+elmer/QA_test/elmer_deepseek_judge_v2.jsonl, so agreement on that file is
+optimistic; quote the --holdout figure (rows of models left out of tuning) or
+a newly judged file.
+
+Usage:
+  python common/qa_prejudge.py --judged elmer/QA_test/elmer_deepseek_judge_v2.jsonl   # agreement report
+  python common/qa_prejudge.py --judged new_judge.jsonl --holdout gpt4o               # held-out split
+  python common/qa_judge_eval.py ... --prejudge                                       # skip decided cases
+"""
+
+import re
+import json
+import argparse
+import unicodedata
+from typing import Dict, List, Sequence, Tuple
+
+import numpy as np
+
+CONFIG = {
+    # contains-match only for short golds: long golds are explanations, not facts
+    "SHORT_GOLD_CHARS": 32,
+    "PASS_TERM_RECALL": 1.0,
+    "PASS_BIGRAM_RECALL": 0.8,
+    "FAIL_TERM_RECALL": 0.0,
+    "FAIL_BIGRAM_RECALL": 0.2,
+    # overlap-based passes only for answers not much longer than gold (long answers bury wrong facts)
+    "PASS_MAX_LEN_RATIO": 3.0,
+    "PASS_MAX_LEN_SLACK": 60,
+    # characters before / after a gold match searched for a negation cue
+    "NEGATION_WINDOW_BEFORE": 16,
+    "NEGATION_WINDOW_AFTER": 8,
+}
+
+STOP_TERMS = {"elmer", "the", "a", "an", "of", "to", "and", "or", "in", "on", "is", "be", "by", "for", "with",
+              "use", "using", "file", "etc"}
+
+_TERM_RE = re.compile(r"[a-z][a-z0-9_]*(?:\.[a-z0-9_]+)*")
+_NUM_RE = re.compile(r"(?<![a-z0-9_.])[-+]?\d+(?:\.\d+)?(?:e[-+]?\d+)?(?![a-z0-9_])")
+_CJK_RUN_RE = re.compile(r"[一-鿿]+")
+_NON_WORD_RE = re.compile(r"[^0-9a-z一-鿿]+")
+
+
+def normalize(text: str) -> str:
+    """NFKC (full-width -> half-width), lower case, markdown emphasis/quotes dropped."""
+    text = unicodedata.normalize("NFKC", text or "").lower()
+    return re.sub(r"[`*\"'“”‘’]", "", text)
+
+
+def compact(text: str) -> str:
+    return _NON_WORD_RE.sub("", normalize(text))
+
+
+def spaced(text: str) -> str:
+    return _NON_WORD_RE.sub(" ", normalize(text)).strip()
+
+
+# "不要使用 Mesh DB", "而不是 Header", "not End": the answer names the gold only to reject it.
+_NEGATION_RE = re.compile(r"不是|不要|不用|不能|不应|不需要|无需|不必|而非|并非|避免|取代|代替|"
+                          r"(?<![a-z])(?:not|no|never|instead of|rather than|avoid|don t|doesn t)(?![a-z])")
+
+
+def negated_match(gold: str, answer: str) -> bool:
+    """Some occurrence of gold in answer has a negation cue right before or after it."""
+    g, a = spaced(gold), spaced(answer)
+    if not g:
+        return False
+    wb, wa = CONFIG["NEGATION_WINDOW_BEFORE"], CONFIG["NEGATION_WINDOW_AFTER"]
+    for m in re.finditer(r"(?<![0-9a-z])" + re.escape(g) + r"(?![0-9a-z])", a):
+        if _NEGATION_RE.search(a[max(0, m.start() - wb):m.start()]) or _NEGATION_RE.search(a[m.end():m.end() + wa]):
+            return True
+    return False
+
+
+# A keyword followed by its SIF value type ("Calculate Strains Logical") is judged inconsistently; defer it.
+_TYPE_SUFFIX_RE = re.compile(r"\s*(logical|string|integer|real|file)\b")
+
+
+def contains_term(gold: str, answer: str) -> int:
+    """Short gold found in answer on word boundaries (`Variable DOFs` does not match `Pressure Variable DOFs`).
+
+    Returns 2 for a clean match, 1 if every match carries a SIF type suffix, 0 for no match.
+    """
+    g, a = spaced(gold), spaced(answer)
+    if not g or len(compact(gold)) > CONFIG["SHORT_GOLD_CHARS"]:
+        return 0
+    found = 0
+    for m in re.finditer(r"(?<![0-9a-z])" + re.escape(g) + r"(?![0-9a-z])", a):
+        if _TYPE_SUFFIX_RE.match(a, m.end()):
+            found = 1
+        else:
+            return 2
+    return found
+
+
+def _num_key(s: str) -> str:
+    try:
+        return repr(float(s))
+    except ValueError:
+        return s
+
+
+def features(text: str) -> Dict[str, List[str]]:
+    t = normalize(text)
+    terms = [w for w in _TERM_RE.findall(t) if len(w) > 1 and w not in STOP_TERMS]
+    nums = [_num_key(n) for n in _NUM_RE.findall(t)]
+    bigrams = [run[i:i + 2] for run in _CJK_RUN_RE.findall(t) for i in range(len(run) - 1)]
+    return {"t": terms, "n": nums, "b": bigrams}
+
+
+def _incidence(feats: Sequence[Dict[str, List[str]]], vocab: Dict[str, int]) -> np.ndarray:
+    m = np.zeros((len(feats), len(vocab)), dtype=bool)
+    for i, f in enumerate(feats):
+        cols = [vocab[f"{kind}:{x}"] for kind, xs in f.items() for x in xs if f"{kind}:{x}" in vocab]
+        m[i, cols] = True
+    return m
+
+
+def score(pairs: Sequence[Tuple[str, str]]) -> Tuple[np.ndarray, List[str], Dict[str, np.ndarray]]:
+    """pairs: (gold, answer). Returns (decision per pair, rule name per pair, feature arrays)."""
+    golds = sorted({g for g, _ in pairs})
+    gold_row = {g: i for i, g in enumerate(golds)}
+    gold_feats = [features(g) for g in golds]
+    vocab: Dict[str, int] = {}
+    kind_of: List[str] = []
+    for f in gold_feats:
+        for kind, xs in f.items():
+            for x in xs:
+                if f"{kind}:{x}" not in vocab:
+                    vocab[f"{kind}:{x}"] = len(vocab)
+                    kind_of.append(kind)
+
+    G = _incidence(gold_feats, vocab)[[gold_row[g] for g, _ in pairs]]
+    A = _incidence([features(a) for _, a in pairs], vocab)
+    hit = G & A
+    kinds = np.asarray(kind_of)
+
+    def recall(kind: str) -> Tuple[np.ndarray, np.ndarray]:
+        cols = kinds == kind
+        total = G[:, cols].sum(axis=1)
+        return np.where(total > 0, hit[:, cols].sum(axis=1) / np.maximum(total, 1), np.nan), total > 0
+
+    term_r, has_t = recall("t")
+    num_r, has_n = recall("n")
+    bi_r, has_b = recall("b")
+
+    cg = [compact(g) for g, _ in pairs]
+    ca = [compact(a) for _, a in pairs]
+    exact = np.array([g == a and g != "" for g, a in zip(cg, ca)])
+    match = np.array([contains_term(g, a) for g, a in pairs])
+    short = np.array([len(a) <= CONFIG["PASS_MAX_LEN_RATIO"] * len(g) + CONFIG["PASS_MAX_LEN_SLACK"]
+                      for g, a in zip(cg, ca)])
+    negated = np.array([m > 0 and negated_match(g, a) for m, (g, a) in zip(match, pairs)])
+
+    num_ok = ~has_n | (num_r == 1.0)
+    num_miss = has_n & (num_r == 0.0)
+    terms_full = has_t & (term_r >= CONFIG["PASS_TERM_RECALL"])
+    terms_none = has_t & (term_r <= CONFIG["FAIL_TERM_RECALL"])
+    bi_high = ~has_b | (bi_r >= CONFIG["PASS_BIGRAM_RECALL"])
+    bi_low = ~has_b | (bi_r < CONFIG["FAIL_BIGRAM_RECALL"])
+
+    # first matching rule wins; verdict -1 claims the pair for the LLM judge
+    rules = [
+        ("exact", exact, 1),
+        ("negated_match", negated, -1),
+        ("contains", (match == 2) & num_ok & short, 1),
+        ("typed_keyword", match == 1, -1),
+        ("numbers_missing", num_miss & ~terms_full, 0),
+        ("terms_and_bigrams", terms_full & bi_high & num_ok & short, 1),
+        ("no_key_terms", terms_none & bi_low, 0),
+        ("no_overlap", ~has_t & has_b & (bi_r < CONFIG["FAIL_BIGRAM_RECALL"] / 2), 0),
+    ]
+    decision = np.full(len(pairs), -1, dtype=np.int8)
+    rule = np.full(len(pairs), "ambiguous", dtype=object)
+    claimed = np.zeros(len(pairs), dtype=bool)
+    for name, mask, verdict in rules:
+        sel = mask & ~claimed
+        decision[sel] = verdict
+        rule[sel] = name
+        claimed |= sel
+    return decision, list(rule), {"term_recall": term_r, "bigram_recall": bi_r, "num_recall": num_r}
+
+
+def _split_stats(sel: np.ndarray, decision: np.ndarray, truth: np.ndarray) -> Dict[str, float]:
+    decided = sel & (decision >= 0)
+    agree = decided & (decision.astype(bool) == truth)
+    n, n_dec = int(sel.sum()), int(decided.sum())
+    return {
+        "rows": n,
+        "decided": n_dec,
+        "coverage": n_dec / n if n else 0.0,
+        "agreement": float(agree.sum()) / n_dec if n_dec else 0.0,
+        "false_pass": int((decided & (decision == 1) & ~truth).sum()),
+        "false_fail": int((decided & (decision == 0) & truth).sum()),
+    }
+
+
+def agreement_report(rows: List[Dict], holdout: Sequence[str] = ()) -> Dict[str, float]:
+    """Compare local decisions with the `correct` field of an existing judged file.
+
+    holdout: models whose rows were not used to tune CONFIG; their agreement is reported separately.
+    """
+    decision, rules, _ = score([(r["gold"], r["answer"]) for r in rows])
+    truth = np.array([bool(r["correct"]) for r in rows])
+    decided = decision >= 0
+    agree = decided & (decision.astype(bool) == truth)
+    models = np.array([r.get("model", "") for r in rows])
+    splits = {"all": np.ones(len(rows), dtype=bool)}
+    if holdout:
+        held = np.isin(models, list(holdout))
+        splits = {"tuning": ~held, "held_out": held}
+    out: Dict[str, float] = {}
+    for name, sel in splits.items():
+        st = _split_stats(sel, decision, truth)
+        print(f"[Prejudge:{name}] rows={st['rows']} decided={st['decided']} ({st['coverage']:.1%}) "
+              f"agreement={st['agreement']:.1%} false_pass={st['false_pass']} false_fail={st['false_fail']}")
+        out.update(st if name in ("all", "held_out") else {f"{name}_{k}": v for k, v in st.items()})
+    print(f"{'rule':<20}{'n':>6}{'agree':>8}")
+    rules_arr = np.asarray(rules, dtype=object)
+    for name in dict.fromkeys(rules):
+        sel = rules_arr == name
+        if name in ("ambiguous", "typed_keyword", "negated_match"):
+            print(f"{name:<20}{int(sel.sum()):>6}{'-':>8}")
+        else:
+            print(f"{name:<20}{int(sel.sum()):>6}{agree[sel].mean():>8.1%}")
+    for m in sorted(set(models)):
+        sel = (models == m) & decided
+        if sel.any():
+            print(f"  {m:<24} decided={int(sel.sum()):>4}/{int((models == m).sum())} agreement={agree[sel].mean():.1%}")
+    return out
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--judged", nargs="+", required=True, help="judged JSONL files (judge_v2 format)")
+    ap.add_argument("--holdout", nargs="+", default=[], help="models not used for tuning (reported separately)")
+    ap.add_argument("--report-json", default=None)
+    args = ap.parse_args()
+
+    rows = []
+    for path in args.judged:
+        with open(path, "r", encoding="utf-8") as f:
+            rows.extend(json.loads(line) for line in f if line.strip())
+    out = agreement_report(rows, args.holdout)
+    if args.report_json:
+        with open(args.report_json, "w", encoding="utf-8") as f:
+            json.dump(out, f, ensure_ascii=False, indent=2)
+        print(f"[Done] -> {args.report_json}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,373 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Lease-based task table (SQLite) for splitting long generation runs across
+processes and hosts that share a filesystem.
+
+Workers claim tasks under a time-limited lease, renew it with heartbeats while
+working and mark the task done with a fencing check (owner + attempt), so a
+worker whose lease expired and was taken over cannot overwrite the new owner's
+result. Tasks whose lease expires (crashed worker, lost host) go back to the
+pool automatically; tasks failing MAX_ATTEMPTS times are parked as `failed`.
+
+The database uses the rollback journal (not WAL) because WAL needs shared memory
+and does not work over network filesystems.
+
+Usage:
+  python common/task_table.py status --db shard.sqlite
+  python common/task_table.py requeue --db shard.sqlite            # failed -> pending
+  python common/task_table.py simulate --db /tmp/sim.sqlite --tasks 300 --procs 4 --kill-one
+"""
+
+import os
+import json
+import time
+import uuid
+import signal
+import socket
+import random
+import sqlite3
+import argparse
+import threading
+import multiprocessing
+from dataclasses import dataclass
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+CONFIG = {
+    "LEASE_SECONDS": 300.0,
+    "MAX_ATTEMPTS": 3,
+    "BUSY_TIMEOUT_MS": 60000,
+    "IDLE_POLL_SECONDS": 5.0,
+}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS tasks (
+    task_id     TEXT PRIMARY KEY,
+    grp         TEXT,
+    payload     TEXT NOT NULL,
+    status      TEXT NOT NULL DEFAULT 'pending',
+    owner       TEXT,
+    attempt     INTEGER NOT NULL DEFAULT 0,
+    lease_until REAL NOT NULL DEFAULT 0,
+    updated     REAL NOT NULL DEFAULT 0,
+    error       TEXT
+);
+CREATE INDEX IF NOT EXISTS tasks_status ON tasks(status, lease_until);
+CREATE INDEX IF NOT EXISTS tasks_grp ON tasks(grp, status);
+"""
+
+
+def make_owner_id() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+
+@dataclass
+class Task:
+    task_id: str
+    grp: Optional[str]
+    payload: Dict[str, Any]
+    attempt: int
+
+
+class TaskTable:
+    """One connection per thread; safe to share across threads and processes."""
+
+    def __init__(self, db_path: str, lease_seconds: float = CONFIG["LEASE_SECONDS"],
+                 max_attempts: int = CONFIG["MAX_ATTEMPTS"]) -> None:
+        self.db_path = db_path
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        self._con().executescript(SCHEMA)
+
+    def _con(self) -> sqlite3.Connection:
+        con = getattr(self._local, "con", None)
+        if con is None:
+            con = sqlite3.connect(self.db_path, timeout=CONFIG["BUSY_TIMEOUT_MS"] / 1000, isolation_level=None)
+            con.execute(f"PRAGMA busy_timeout={CONFIG['BUSY_TIMEOUT_MS']}")
+            con.execute("PRAGMA journal_mode=DELETE")
+            self._local.con = con
+        return con
+
+    class _Tx:
+        def __init__(self, con: sqlite3.Connection) -> None:
+            self.con = con
+
+        def __enter__(self) -> sqlite3.Connection:
+            # IMMEDIATE takes the write lock up front, so claim's select+update is atomic.
+            self.con.execute("BEGIN IMMEDIATE")
+            return self.con
+
+        def __exit__(self, exc_type, exc, tb) -> None:
+            self.con.execute("ROLLBACK" if exc_type else "COMMIT")
+
+    def _tx(self) -> "_Tx":
+        return self._Tx(self._con())
+
+    def add_tasks(self, tasks: Iterable[Tuple[str, Optional[str], Dict[str, Any]]]) -> int:
+        """Insert (task_id, group, payload); existing ids are left alone, so enqueueing twice is safe."""
+        now = time.time()
+        rows = [(tid, grp, json.dumps(payload, ensure_ascii=False), now) for tid, grp, payload in tasks]
+        with self._tx() as con:
+            before = con.total_changes
+            con.executemany("INSERT OR IGNORE INTO tasks(task_id, grp, payload, updated) VALUES (?,?,?,?)", rows)
+            return con.total_changes - before
+
+    def claim(self, owner: str, n: int = 1) -> List[Task]:
+        now = time.time()
+        with self._tx() as con:
+            rows = con.execute(
+                "SELECT task_id, grp, payload, attempt FROM tasks "
+                "WHERE status='pending' OR (status='leased' AND lease_until < ?) "
+                "ORDER BY task_id LIMIT ?",
+                (now, n),
+            ).fetchall()
+            claimed = []
+            for tid, grp, payload, attempt in rows:
+                if attempt >= self.max_attempts:
+                    con.execute("UPDATE tasks SET status='failed', owner=NULL, updated=?, "
+                                "error=COALESCE(error, 'lease expired') WHERE task_id=?", (now, tid))
+                    continue
+                con.execute(
+                    "UPDATE tasks SET status='leased', owner=?, attempt=attempt+1, lease_until=?, updated=? "
+                    "WHERE task_id=?",
+                    (owner, now + self.lease_seconds, now, tid),
+                )
+                claimed.append(Task(tid, grp, json.loads(payload), attempt + 1))
+            return claimed
+
+    def heartbeat(self, owner: str, task_ids: List[str]) -> List[str]:
+        """Extend the leases still held by owner; returns the ids that were lost."""
+        if not task_ids:
+            return []
+        now = time.time()
+        lost = []
+        with self._tx() as con:
+            for tid in task_ids:
+                cur = con.execute(
+                    "UPDATE tasks SET lease_until=?, updated=? WHERE task_id=? AND owner=? AND status='leased'",
+                    (now + self.lease_seconds, now, tid, owner),
+                )
+                if cur.rowcount == 0:
+                    lost.append(tid)
+        return lost
+
+    def complete(self, owner: str, task: Task) -> bool:
+        """Mark done if this owner still holds this attempt's lease; False means someone else took over."""
+        with self._tx() as con:
+            cur = con.execute(
+                "UPDATE tasks SET status='done', lease_until=0, updated=?, error=NULL "
+                "WHERE task_id=? AND owner=? AND attempt=? AND status='leased'",
+                (time.time(), task.task_id, owner, task.attempt),
+            )
+            return cur.rowcount == 1
+
+    def fail(self, owner: str, task: Task, error: str) -> None:
+        with self._tx() as con:
+            con.execute(
+                "UPDATE tasks SET status=CASE WHEN attempt >= ? THEN 'failed' ELSE 'pending' END, "
+                "owner=NULL, lease_until=0, updated=?, error=? "
+                "WHERE task_id=? AND owner=? AND attempt=? AND status='leased'",
+                (self.max_attempts, time.time(), error[:2000], task.task_id, owner, task.attempt),
+            )
+
+    def group_done(self, grp: str) -> bool:
+        row = self._con().execute(
+            "SELECT COUNT(*) FROM tasks WHERE grp=? AND status!='done'", (grp,)
+        ).fetchone()
+        return row[0] == 0
+
+    def open_count(self) -> int:
+        """Tasks that may still need work (pending or leased)."""
+        return self._con().execute("SELECT COUNT(*) FROM tasks WHERE status IN ('pending','leased')").fetchone()[0]
+
+    def stats(self) -> Dict[str, int]:
+        return dict(self._con().execute("SELECT status, COUNT(*) FROM tasks GROUP BY status").fetchall())
+
+    def requeue_failed(self) -> int:
+        with self._tx() as con:
+            cur = con.execute("UPDATE tasks SET status='pending', attempt=0, owner=NULL, error=NULL "
+                              "WHERE status='failed'")
+            return cur.rowcount
+
+
+class Heartbeat:
+    """Background thread renewing the leases of the tasks a worker currently holds."""
+
+    def __init__(self, table: TaskTable, owner: str, interval: Optional[float] = None) -> None:
+        self.table = table
+        self.owner = owner
+        self.interval = interval or max(1.0, table.lease_seconds / 3)
+        self.held: Dict[str, Task] = {}
+        self.lost: set = set()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def hold(self, task: Task) -> None:
+        with self._lock:
+            self.held[task.task_id] = task
+
+    def release(self, task: Task) -> None:
+        with self._lock:
+            self.held.pop(task.task_id, None)
+
+    def is_lost(self, task: Task) -> bool:
+        """True once a renewal found the lease taken over (expired and re-claimed elsewhere)."""
+        with self._lock:
+            return task.task_id in self.lost
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            with self._lock:
+                ids = list(self.held)
+            try:
+                lost = self.table.heartbeat(self.owner, ids)
+            except sqlite3.Error as e:
+                print(f"[Warn] heartbeat failed: {e}")
+                continue
+            if lost:
+                with self._lock:
+                    self.lost.update(lost)
+
+    def __enter__(self) -> "Heartbeat":
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self._stop.set()
+        self._thread.join()
+
+
+def run_worker(
+    table: TaskTable,
+    handler: Callable[[Task], None],
+    threads: int = 8,
+    owner: Optional[str] = None,
+    on_done: Optional[Callable[[Task], None]] = None,
+    idle_poll: float = CONFIG["IDLE_POLL_SECONDS"],
+) -> Dict[str, int]:
+    """Claim and run tasks until none are pending or leased anywhere.
+
+    handler raises to signal failure (the task is retried up to max_attempts).
+    on_done runs after a successful, fenced completion (e.g. to assemble a file
+    once all tasks of its group are done).
+    """
+    owner = owner or make_owner_id()
+    counts = {"done": 0, "failed": 0, "stale": 0}
+    lock = threading.Lock()
+
+    def _run_one(task: Task) -> None:
+        if hb.is_lost(task):
+            # Lease expired while queued and another worker may already run it.
+            hb.release(task)
+            with lock:
+                counts["stale"] += 1
+            return
+        try:
+            handler(task)
+        except Exception as e:
+            table.fail(owner, task, f"{type(e).__name__}: {e}")
+            key = "failed"
+        else:
+            if table.complete(owner, task):
+                key = "done"
+                if on_done is not None:
+                    on_done(task)
+            else:
+                key = "stale"
+        finally:
+            hb.release(task)
+        with lock:
+            counts[key] += 1
+
+    with Heartbeat(table, owner) as hb, ThreadPoolExecutor(max_workers=threads) as ex:
+        inflight = set()
+        while True:
+            inflight = {f for f in inflight if not f.done()}
+            free = threads * 2 - len(inflight)
+            tasks = table.claim(owner, free) if free > 0 else []
+            for t in tasks:
+                hb.hold(t)  # renew from claim time, not from when a thread picks it up
+                inflight.add(ex.submit(_run_one, t))
+            if not tasks:
+                if not inflight and table.open_count() == 0:
+                    break
+                # Nothing claimable: wait for our own work or for someone's lease to expire.
+                time.sleep(min(idle_poll, 0.2) if inflight else idle_poll)
+    print(f"[Worker {owner}] done={counts['done']} failed={counts['failed']} stale={counts['stale']}")
+    return counts
+
+
+def _sim_worker(db: str, lease: float, out_dir: str, slow: bool) -> None:
+    table = TaskTable(db, lease_seconds=lease)
+
+    def handler(task: Task) -> None:
+        time.sleep(random.uniform(0.01, 0.05) * (20 if slow else 1))
+        with open(os.path.join(out_dir, f"{task.task_id}.{os.getpid()}.{task.attempt}"), "w") as f:
+            f.write("x")
+
+    run_worker(table, handler, threads=4, idle_poll=0.5)
+
+
+def simulate(db: str, n_tasks: int, procs: int, kill_one: bool, lease: float) -> None:
+    """Run several local worker processes on a synthetic table, optionally SIGKILL one mid-run."""
+    if os.path.exists(db):
+        os.remove(db)
+    out_dir = db + ".out"
+    os.makedirs(out_dir, exist_ok=True)
+    for fn in os.listdir(out_dir):
+        os.remove(os.path.join(out_dir, fn))
+    table = TaskTable(db, lease_seconds=lease)
+    table.add_tasks((f"t{i:05d}", f"g{i // 10}", {"i": i}) for i in range(n_tasks))
+
+    ctx = multiprocessing.get_context("spawn")
+    workers = [ctx.Process(target=_sim_worker, args=(db, lease, out_dir, kill_one and k == 0)) for k in range(procs)]
+    start = time.time()
+    for p in workers:
+        p.start()
+    if kill_one:
+        time.sleep(1.0)
+        os.kill(workers[0].pid, signal.SIGKILL)
+        print(f"[Sim] killed worker pid={workers[0].pid}")
+    for p in workers:
+        p.join()
+
+    per_task: Dict[str, int] = {}
+    for fn in os.listdir(out_dir):
+        tid = fn.split(".", 1)[0]
+        per_task[tid] = per_task.get(tid, 0) + 1
+    missing = n_tasks - len(per_task)
+    redone = sum(1 for v in per_task.values() if v > 1)
+    print(f"[Sim] {time.time() - start:.1f}s stats={table.stats()} missing={missing} "
+          f"re-executed={redone} (only tasks leased by a killed worker may be re-executed)")
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    st = sub.add_parser("status", help="task counts by status")
+    st.add_argument("--db", required=True)
+    rq = sub.add_parser("requeue", help="move failed tasks back to pending")
+    rq.add_argument("--db", required=True)
+    sm = sub.add_parser("simulate", help="multi-process self-check on a synthetic table")
+    sm.add_argument("--db", required=True)
+    sm.add_argument("--tasks", type=int, default=300)
+    sm.add_argument("--procs", type=int, default=4)
+    sm.add_argument("--lease", type=float, default=3.0)
+    sm.add_argument("--kill-one", action="store_true")
+    args = ap.parse_args()
+
+    if args.cmd == "status":
+        print(json.dumps(TaskTable(args.db).stats(), ensure_ascii=False))
+    elif args.cmd == "requeue":
+        print(f"[OK] requeued={TaskTable(args.db).requeue_failed()}")
+    else:
+        simulate(args.db, args.tasks, args.procs, args.kill_one, args.lease)
+
+
+if __name__ == "__main__":
+    main()
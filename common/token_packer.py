@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Token-budgeted packing of markdown sections into QA-generation requests.
+
+Adjacent sections (from md_sectionizer) are packed greedily, in document order,
+until a request holds about TARGET_INPUT_TOKENS of content. Each pack then gets a
+QA count and a `max_tokens` scaled to its size, so tiny sections no longer pay for
+the large system prompt on their own and big ones are not truncated by a fixed
+output cap.
+
+Token counts are local. The tokenizer is pluggable:
+  estimate                   heuristic from md_sectionizer (no dependency)
+  tiktoken:<encoding>        e.g. tiktoken:cl100k_base (requires `tiktoken`)
+  hf:<name_or_path>          HuggingFace tokenizer (requires `transformers`)
+
+Usage:
+  python common/token_packer.py manual.md --target 2400 --tokenizer estimate
+"""
+
+import os
+import argparse
+import importlib.util
+from dataclasses import dataclass
+from typing import Callable, Iterable, Iterator, List, Tuple
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+CONFIG = {
+    "TARGET_INPUT_TOKENS": 2400,
+    "TOKENS_PER_QA": 200,
+    "MIN_QA": 3,
+    "MAX_QA": 15,
+    "OUTPUT_TOKENS_PER_QA": 256,
+    "OUTPUT_OVERHEAD_TOKENS": 256,
+    "MIN_OUTPUT_TOKENS": 1024,
+    "MAX_OUTPUT_TOKENS": 4096,
+}
+
+
+def _load_sectionizer():
+    spec = importlib.util.spec_from_file_location("md_sectionizer", os.path.join(HERE, "md_sectionizer.py"))
+    mod = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(mod)
+    return mod
+
+
+sectionizer = _load_sectionizer()
+
+
+def get_tokenizer(spec: str = "estimate") -> Callable[[str], int]:
+    """Return a text -> token count function for `spec` (see module docstring)."""
+    if spec == "estimate":
+        return sectionizer.estimate_tokens
+    kind, _, name = spec.partition(":")
+    if kind == "tiktoken":
+        try:
+            import tiktoken
+        except ImportError as e:
+            raise ImportError("tokenizer 'tiktoken:...' requires `pip install tiktoken`") from e
+        enc = tiktoken.get_encoding(name or "cl100k_base")
+        return lambda text: len(enc.encode(text, disallowed_special=()))
+    if kind == "hf":
+        try:
+            from transformers import AutoTokenizer
+        except ImportError as e:
+            raise ImportError("tokenizer 'hf:...' requires `pip install transformers`") from e
+        tok = AutoTokenizer.from_pretrained(name, trust_remote_code=True)
+        return lambda text: len(tok.encode(text, add_special_tokens=False))
+    raise ValueError(f"unknown tokenizer spec: {spec}")
+
+
+@dataclass
+class Pack:
+    text: str
+    tokens: int
+    n_sections: int
+    qa_count: int
+    max_tokens: int
+
+
+def request_budget(tokens: int) -> Tuple[int, int]:
+    """(qa_count, max_tokens) for a pack of `tokens` input tokens."""
+    qa = round(tokens / CONFIG["TOKENS_PER_QA"])
+    qa = max(CONFIG["MIN_QA"], min(CONFIG["MAX_QA"], qa))
+    out = qa * CONFIG["OUTPUT_TOKENS_PER_QA"] + CONFIG["OUTPUT_OVERHEAD_TOKENS"]
+    out = max(CONFIG["MIN_OUTPUT_TOKENS"], min(CONFIG["MAX_OUTPUT_TOKENS"], out))
+    return qa, out
+
+
+def pack_sections(
+    sections: Iterable[str],
+    target_tokens: int = CONFIG["TARGET_INPUT_TOKENS"],
+    token_len: Callable[[str], int] = sectionizer.estimate_tokens,
+) -> Iterator[Pack]:
+    """Next-fit packing in document order; a section larger than the target forms its own pack."""
+    buf: List[str] = []
+    size = 0
+
+    def _emit() -> Pack:
+        qa, out = request_budget(size)
+        return Pack("\n\n".join(buf), size, len(buf), qa, out)
+
+    for sec in sections:
+        n = token_len(sec)
+        if buf and size + n > target_tokens:
+            yield _emit()
+            buf, size = [], 0
+        buf.append(sec)
+        size += n
+    if buf:
+        yield _emit()
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("md_path")
+    ap.add_argument("--target", type=int, default=CONFIG["TARGET_INPUT_TOKENS"])
+    ap.add_argument("--tokenizer", default="estimate")
+    ap.add_argument("--min-section-tokens", type=int, default=sectionizer.CONFIG["MIN_TOKENS"])
+    ap.add_argument("--max-section-tokens", type=int, default=sectionizer.CONFIG["MAX_TOKENS"])
+    args = ap.parse_args()
+
+    token_len = get_tokenizer(args.tokenizer)
+    n_sections = 0
+    n_packs = 0
+    total_tokens = 0
+    total_qa = 0
+
+    def _counted(it):
+        nonlocal n_sections
+        for sec in it:
+            n_sections += 1
+            yield sec
+
+    sections = sectionizer.iter_sections(args.md_path, args.min_section_tokens, args.max_section_tokens, token_len)
+    for p in pack_sections(_counted(sections), args.target, token_len):
+        n_packs += 1
+        total_tokens += p.tokens
+        total_qa += p.qa_count
+    print(f"[Done] sections={n_sections} requests={n_packs} "
+          f"avg_input_tokens={total_tokens / max(1, n_packs):.0f} qa_requested={total_qa}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,459 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+DAG runner for the Elmer IR -> DPO pipeline.
+
+Stages are declared in STAGES with their dependencies. Consecutive CPU stages
+stream records to each other in memory; a stage is only written to disk when an
+LLM stage consumes it (or when it is a sink). Each materialized stage records a
+fingerprint (script source + params + upstream content) in the state file, so a
+refresh only reruns the stages whose inputs or code changed. Checkpoint files
+are rewritten only when their content differs, and LLM outputs for changed
+records are dropped so they are regenerated; the changed record names are
+written to the state file (as the LLM stage's "invalidated" list) together with
+the checkpoint digest, so a crash before the LLM stage runs does not lose them.
+`--until` on a streamed stage materializes that stage.
+
+Usage:
+  python 0.pipeline_dag.py --in-root data/sources/elmer/official_sif --work-dir outputs/pipeline
+  python 0.pipeline_dag.py --until cot --dry-run
+  python 0.pipeline_dag.py --workers 8   # fused 3.0+3.5+4 on a process pool
+  python 0.pipeline_dag.py --sample-target 600   # stratified subset (2.5) before the instruction stages
+"""
+
+import os
+import sys
+import json
+import random
+import hashlib
+import argparse
+import importlib.util
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+CONFIG = {
+    "IN_ROOT": "data/sources/elmer/official_sif",
+    "WORK_DIR": "outputs/pipeline",
+    "STATE_FILE": "pipeline_state.json",
+    "FINAL_JSONL": "dpo_elmer_dataset.jsonl",
+    "MAX_PER_FILE": 3,
+    "NUM_VARIANTS_PER_FILE": 1,
+    "WORKERS": 1,
+    "SAMPLE_TARGET": 0,  # 0 = keep every record
+    "SAMPLE_ALPHA": 0.5,
+}
+
+Record = Tuple[str, Dict[str, Any]]
+
+STAGES: List[Dict[str, Any]] = [
+    {"name": "ir", "script": "1.IR_batch.py", "kind": "cpu", "deps": []},
+    {"name": "diversify", "script": "2.IR_diversify.py", "kind": "cpu", "deps": ["ir"]},
+    {"name": "sample", "script": "2.5.IR_stratified_sample.py", "kind": "cpu", "deps": ["diversify"]},
+    {"name": "instruction", "script": "3.0instruction_gen.py", "kind": "cpu", "deps": ["sample"]},
+    {"name": "dpo", "script": "3.5.DPO_gen.py", "kind": "cpu", "deps": ["instruction"]},
+    {"name": "cot", "script": "4.COT_out_gen.py", "kind": "cpu", "deps": ["dpo"]},
+    {"name": "llm_instructions", "script": "5.LLM_instructions.py", "kind": "llm", "deps": ["cot"]},
+    {"name": "clean_variants", "script": "5b.clean_instruction_variants.py", "kind": "cpu", "deps": ["llm_instructions"]},
+    {"name": "finalize", "script": "6.finla_alpaca.py", "kind": "llm", "deps": ["clean_variants"]},
+]
+
+# Same DAG with 3.0 + 3.5 + 4 fused into one process-pool stage. "scripts" lists
+# every file the stage runs, so the fingerprint covers the fused-in stages too.
+FUSED_STAGES: List[Dict[str, Any]] = [
+    s for s in STAGES if s["name"] not in ("instruction", "dpo", "cot")
+]
+FUSED_STAGES.insert(3, {
+    "name": "cot", "script": "4b.fused_cpu_stages.py", "kind": "cpu", "deps": ["sample"], "adapter": "fused_cot",
+    "scripts": ["4b.fused_cpu_stages.py", "3.0instruction_gen.py", "3.5.DPO_gen.py", "4.COT_out_gen.py"],
+})
+
+
+_MODULES: Dict[str, Any] = {}
+
+
+def load_module(script: str):
+    if script in _MODULES:
+        return _MODULES[script]
+    path = os.path.join(HERE, script)
+    name = "elmer_stage_" + hashlib.sha1(script.encode("utf-8")).hexdigest()[:8]
+    spec = importlib.util.spec_from_file_location(name, path)
+    mod = importlib.util.module_from_spec(spec)
+    assert spec and spec.loader, f"Cannot load module: {path}"
+    # Registered so process-pool stages can pickle functions from it.
+    sys.modules[name] = mod
+    spec.loader.exec_module(mod)  # type: ignore
+    _MODULES[script] = mod
+    return mod
+
+
+def sha1_bytes(b: bytes) -> str:
+    return hashlib.sha1(b).hexdigest()
+
+
+def file_sha1(path: str) -> str:
+    h = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def dir_digest(root: str, suffixes: Tuple[str, ...] = (".sif", ".json", ".jsonl")) -> str:
+    h = hashlib.sha1()
+    if not os.path.isdir(root):
+        return ""
+    items = []
+    for dp, _, fns in os.walk(root):
+        for fn in fns:
+            if fn.lower().endswith(suffixes):
+                p = os.path.join(dp, fn)
+                items.append((os.path.relpath(p, root), p))
+    for rel, p in sorted(items):
+        h.update(rel.encode("utf-8", "ignore"))
+        h.update(b"\0")
+        h.update(file_sha1(p).encode("ascii"))
+        h.update(b"\n")
+    return h.hexdigest()
+
+
+def record_rng(seed: int, name: str) -> random.Random:
+    # Per-record RNG so results do not depend on how stages interleave.
+    return random.Random(f"{seed}:{name}")
+
+
+def iter_dir(root: str) -> Iterator[Record]:
+    files = []
+    for dp, _, fns in os.walk(root):
+        for fn in fns:
+            if fn.lower().endswith(".json"):
+                files.append(os.path.join(dp, fn))
+    for p in sorted(files):
+        with open(p, "r", encoding="utf-8") as f:
+            yield os.path.basename(p), json.load(f)
+
+
+# ---------------------------------------------------------------------------
+# Stage adapters: (module, upstream records, ctx) -> records
+# ---------------------------------------------------------------------------
+
+def run_ir(mod, upstream: Iterable[Record], ctx: Dict[str, Any]) -> Iterator[Record]:
+    root = ctx["in_root"]
+    for p in mod.walk_sif_files(root):
+        yield mod.rel_safe_name(p, root) + ".json", mod.build_record(p)
+
+
+def run_diversify(mod, upstream: Iterable[Record], ctx: Dict[str, Any]) -> Iterator[Record]:
+    mod.CONFIG["EXTRACTOR_PATH"] = os.path.join(HERE, "1.IR_batch.py")
+    for name, data in upstream:
+        rng = record_rng(mod.CONFIG["SEED"], name)
+        stem = os.path.splitext(name)[0]
+        for i, v in enumerate(mod.diversify_one(data, ctx["max_per_file"], rng), start=1):
+            yield f"{stem}__aug{i}.json", v
+
+
+def run_sample(mod, upstream: Iterable[Record], ctx: Dict[str, Any]) -> Iterator[Record]:
+    if not ctx["sample_target"]:
+        return iter(upstream)
+    return mod.sample_stream(upstream, ctx["sample_target"], ctx["sample_alpha"])
+
+
+def run_instruction(mod, upstream: Iterable[Record], ctx: Dict[str, Any]) -> Iterator[Record]:
+    for name, data in upstream:
+        yield name, mod.attach_alpaca_records(data, ctx["num_variants"])
+
+
+def run_dpo(mod, upstream: Iterable[Record], ctx: Dict[str, Any]) -> Iterator[Record]:
+    for name, data in upstream:
+        out = mod.attach_dpo_pairs(data, record_rng(mod.CONFIG["SEED"], name))
+        if out is not None:
+            yield name, out
+
+
+def run_cot(mod, upstream: Iterable[Record], ctx: Dict[str, Any]) -> Iterator[Record]:
+    for name, data in upstream:
+        yield name, mod.attach_cot(data)
+
+
+def run_fused_cot(mod, upstream: Iterable[Record], ctx: Dict[str, Any]) -> Iterator[Record]:
+    return mod.fused_map(upstream, ctx["num_variants"], ctx["workers"])
+
+
+def run_clean_variants(mod, upstream: Iterable[Record], ctx: Dict[str, Any]) -> Iterator[Record]:
+    for name, data in upstream:
+        yield name, mod.clean_record(data)
+
+
+def run_llm_instructions(mod, in_dir: str, out_dir: str) -> None:
+    mod.run(in_dir, out_dir)
+
+
+def run_finalize(mod, in_dir: str, out_dir: str) -> None:
+    mod.run(in_dir, os.path.join(out_dir, CONFIG["FINAL_JSONL"]))
+
+
+ADAPTERS: Dict[str, Callable] = {
+    "ir": run_ir,
+    "diversify": run_diversify,
+    "sample": run_sample,
+    "instruction": run_instruction,
+    "dpo": run_dpo,
+    "cot": run_cot,
+    "fused_cot": run_fused_cot,
+    "llm_instructions": run_llm_instructions,
+    "clean_variants": run_clean_variants,
+    "finalize": run_finalize,
+}
+
+
+# ---------------------------------------------------------------------------
+# DAG
+# ---------------------------------------------------------------------------
+
+class Pipeline:
+    def __init__(self, stages: List[Dict[str, Any]], ctx: Dict[str, Any]) -> None:
+        self.stages = {s["name"]: s for s in stages}
+        self.ctx = ctx
+        self.work_dir = ctx["work_dir"]
+        self.state_path = os.path.join(self.work_dir, CONFIG["STATE_FILE"])
+        self.state: Dict[str, Dict[str, str]] = {}
+        if os.path.exists(self.state_path):
+            with open(self.state_path, "r", encoding="utf-8") as f:
+                self.state = json.load(f)
+        self.order = self._topo_order()
+        self.consumers: Dict[str, List[str]] = {n: [] for n in self.stages}
+        for s in self.stages.values():
+            for d in s["deps"]:
+                if d not in self.stages:
+                    raise ValueError(f"stage {s['name']} depends on unknown stage {d}")
+                self.consumers[d].append(s["name"])
+        self.changed: Dict[str, Set[str]] = {}
+        self.extra_materialized: Set[str] = set()
+        self._fp: Dict[str, str] = {}
+
+    def _topo_order(self) -> List[str]:
+        order: List[str] = []
+        mark: Dict[str, int] = {}
+
+        def visit(n: str) -> None:
+            if mark.get(n) == 2:
+                return
+            if mark.get(n) == 1:
+                raise ValueError(f"cycle in pipeline at stage {n}")
+            mark[n] = 1
+            for d in self.stages[n]["deps"]:
+                visit(d)
+            mark[n] = 2
+            order.append(n)
+
+        for n in self.stages:
+            visit(n)
+        return order
+
+    def out_dir(self, name: str) -> str:
+        return os.path.join(self.work_dir, name)
+
+    def materialized(self, name: str) -> bool:
+        st = self.stages[name]
+        if st["kind"] == "llm" or name in self.extra_materialized:
+            return True
+        cons = self.consumers[name]
+        return not cons or any(self.stages[c]["kind"] == "llm" for c in cons)
+
+    def ancestors(self, name: str) -> Set[str]:
+        out: Set[str] = set()
+        stack = list(self.stages[name]["deps"])
+        while stack:
+            d = stack.pop()
+            if d not in out:
+                out.add(d)
+                stack.extend(self.stages[d]["deps"])
+        return out
+
+    def fingerprint(self, name: str) -> str:
+        if name in self._fp:
+            return self._fp[name]
+        st = self.stages[name]
+        h = hashlib.sha1()
+        h.update(name.encode("utf-8"))
+        for script in st.get("scripts", [st["script"]]):
+            with open(os.path.join(HERE, script), "rb") as f:
+                h.update(f.read())
+        params = {k: v for k, v in self.ctx.items() if k not in ("work_dir", "workers")}
+        h.update(json.dumps(params, sort_keys=True).encode("utf-8"))
+        if not st["deps"]:
+            h.update(dir_digest(self.ctx["in_root"], (".sif",)).encode("ascii"))
+        for d in st["deps"]:
+            if self.materialized(d):
+                h.update((self.state.get(d) or {}).get("digest", "").encode("ascii"))
+            else:
+                h.update(self.fingerprint(d).encode("ascii"))
+        self._fp[name] = h.hexdigest()
+        return self._fp[name]
+
+    def up_to_date(self, name: str) -> bool:
+        rec = self.state.get(name) or {}
+        return rec.get("fingerprint") == self.fingerprint(name) and os.path.isdir(self.out_dir(name))
+
+    def stream(self, name: str) -> Iterator[Record]:
+        st = self.stages[name]
+        upstream: Iterable[Record] = iter(())
+        for d in st["deps"]:
+            src = iter_dir(self.out_dir(d)) if self.materialized(d) else self.stream(d)
+            upstream = _chain(upstream, src)
+        mod = load_module(st["script"])
+        return ADAPTERS[st.get("adapter", name)](mod, upstream, self.ctx)
+
+    def materialize(self, name: str) -> Tuple[int, str]:
+        out_dir = self.out_dir(name)
+        os.makedirs(out_dir, exist_ok=True)
+        before = {fn for fn in os.listdir(out_dir) if fn.endswith(".json")}
+        produced: Set[str] = set()
+        changed: Set[str] = set()
+        h = hashlib.sha1()
+        digests: List[Tuple[str, str]] = []
+        for rec_name, data in self.stream(name):
+            payload = json.dumps(data, ensure_ascii=False, indent=2).encode("utf-8")
+            path = os.path.join(out_dir, rec_name)
+            produced.add(rec_name)
+            digests.append((rec_name, sha1_bytes(payload)))
+            if rec_name in before:
+                with open(path, "rb") as f:
+                    if f.read() == payload:
+                        continue
+            with open(path, "wb") as f:
+                f.write(payload)
+            changed.add(rec_name)
+        for stale in before - produced:
+            os.remove(os.path.join(out_dir, stale))
+            changed.add(stale)
+        for rel, d in sorted(digests):
+            h.update(rel.encode("utf-8", "ignore"))
+            h.update(b"\0")
+            h.update(d.encode("ascii"))
+            h.update(b"\n")
+        self.changed[name] = changed
+        return len(produced), h.hexdigest()
+
+    def run_llm(self, name: str) -> str:
+        st = self.stages[name]
+        out_dir = self.out_dir(name)
+        os.makedirs(out_dir, exist_ok=True)
+        # Drop outputs of records whose checkpoint changed so the stage regenerates them.
+        rec = self.state.get(name) or {}
+        for rec_name in rec.get("invalidated", ()):
+            p = os.path.join(out_dir, rec_name)
+            if os.path.exists(p):
+                os.remove(p)
+        if rec.pop("invalidated", None) is not None:
+            self.save_state()
+        if len(st["deps"]) != 1:
+            raise ValueError(f"LLM stage {name} must have exactly one input")
+        mod = load_module(st["script"])
+        ADAPTERS[st.get("adapter", name)](mod, self.out_dir(st["deps"][0]), out_dir)
+        return dir_digest(out_dir)
+
+    def invalidate_consumers(self, name: str) -> None:
+        """Record the changed records of a checkpoint on its LLM consumers (saved with the digest)."""
+        changed = self.changed.get(name)
+        if not changed:
+            return
+        for c in self.consumers[name]:
+            if self.stages[c]["kind"] == "llm":
+                rec = self.state.setdefault(c, {})
+                rec["invalidated"] = sorted(set(rec.get("invalidated", [])) | changed)
+
+    def save_state(self) -> None:
+        os.makedirs(self.work_dir, exist_ok=True)
+        tmp = self.state_path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self.state, f, ensure_ascii=False, indent=2)
+        os.replace(tmp, self.state_path)
+
+    def run(self, until: Optional[str] = None, force: Iterable[str] = (), dry_run: bool = False) -> None:
+        targets = self.order
+        if until:
+            if until not in self.stages:
+                raise ValueError(f"unknown stage {until}")
+            keep = self.ancestors(until) | {until}
+            targets = [n for n in self.order if n in keep]
+            if not self.materialized(until):
+                print(f"[Info] {until} is streamed into {', '.join(self.consumers[until])}; materializing it for --until")
+                self.extra_materialized.add(until)
+        force = set(force)
+        pending: Set[str] = set()
+
+        for name in targets:
+            if not self.materialized(name):
+                continue
+            st = self.stages[name]
+            dirty_up = bool(self.ancestors(name) & pending)
+            if not dirty_up and name not in force and self.up_to_date(name):
+                print(f"[Skip] {name} (up to date)")
+                continue
+            if dry_run:
+                print(f"[Plan] {name} ({st['kind']}) -> {self.out_dir(name)}")
+                pending.add(name)
+                continue
+            fp = self.fingerprint(name)
+            if st["kind"] == "llm":
+                print(f"[Run] {name} (llm) -> {self.out_dir(name)}")
+                digest = self.run_llm(name)
+                print(f"[OK] {name}")
+            else:
+                print(f"[Run] {name} (cpu chain) -> {self.out_dir(name)}")
+                n, digest = self.materialize(name)
+                print(f"[OK] {name} records={n} rewritten={len(self.changed[name])}")
+                self.invalidate_consumers(name)
+            self.state[name] = {"fingerprint": fp, "digest": digest}
+            self.save_state()
+            # Downstream fingerprints depend on this digest.
+            self._fp = {k: v for k, v in self._fp.items() if k not in self._descendants(name)}
+
+    def _descendants(self, name: str) -> Set[str]:
+        out: Set[str] = set()
+        stack = list(self.consumers[name])
+        while stack:
+            c = stack.pop()
+            if c not in out:
+                out.add(c)
+                stack.extend(self.consumers[c])
+        return out
+
+
+def _chain(a: Iterable[Record], b: Iterable[Record]) -> Iterator[Record]:
+    yield from a
+    yield from b
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--in-root", default=CONFIG["IN_ROOT"])
+    ap.add_argument("--work-dir", default=CONFIG["WORK_DIR"])
+    ap.add_argument("--max-per-file", type=int, default=CONFIG["MAX_PER_FILE"])
+    ap.add_argument("--num-variants", type=int, default=CONFIG["NUM_VARIANTS_PER_FILE"])
+    ap.add_argument("--workers", type=int, default=CONFIG["WORKERS"], help=">1 fuses 3.0+3.5+4 on a process pool")
+    ap.add_argument("--sample-target", type=int, default=CONFIG["SAMPLE_TARGET"],
+                    help="keep this many records, stratified by solver family (0 = all)")
+    ap.add_argument("--sample-alpha", type=float, default=CONFIG["SAMPLE_ALPHA"])
+    ap.add_argument("--until", default=None, help="stop after this stage")
+    ap.add_argument("--force", action="append", default=[], help="rerun this stage even if up to date")
+    ap.add_argument("--dry-run", action="store_true")
+    args = ap.parse_args()
+
+    ctx = {
+        "in_root": args.in_root,
+        "work_dir": args.work_dir,
+        "max_per_file": args.max_per_file,
+        "num_variants": args.num_variants,
+        "workers": args.workers,
+        "sample_target": args.sample_target,
+        "sample_alpha": args.sample_alpha,
+    }
+    stages = FUSED_STAGES if args.workers > 1 else STAGES
+    Pipeline(stages, ctx).run(until=args.until, force=args.force, dry_run=args.dry_run)
+
+
+if __name__ == "__main__":
+    main()
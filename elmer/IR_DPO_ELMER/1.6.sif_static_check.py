@@ -0,0 +1,381 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Static pre-screen for generated Elmer .sif code.
+
+Catches the trivial failures that make a solver run pointless, using the
+parser helpers and SECTION_NAMES of 1.IR_batch.py:
+  structure   unbalanced End, unknown section names, Markdown / prose in the file
+  references  Active Solvers -> Solver N, Body -> Equation/Material/Body Force/
+              Initial Condition N (`Section N :: key = value` one-liners define sections too)
+  targets     Target Boundaries / Target Bodies empty or with a wrong (n) count
+
+Each issue is {"code", "line", "msg"}; codes starting with E are errors (sample
+is hopeless, skip the solver), W are warnings.
+
+Usage:
+  python 1.6.sif_static_check.py --sif case.sif
+  python 1.6.sif_static_check.py --in gpt4o_pass1.jsonl --field code --out checked.jsonl --rejected bad.jsonl
+  python 1.6.sif_static_check.py --in gradio_pass1.jsonl --field samples.0 --rejected bad.jsonl
+  python 1.6.sif_static_check.py --in-dir elmer_IR --field source_code --out-dir elmer_IR_ok   # IR records
+  python 1.6.sif_static_check.py --check-gold   # regression: every gold deck of the eval set must pass
+"""
+
+import os
+import re
+import json
+import time
+import argparse
+import importlib.util
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def load_module(path: str):
+    spec = importlib.util.spec_from_file_location("elmer_ir", path)
+    mod = importlib.util.module_from_spec(spec)
+    assert spec and spec.loader, f"Cannot load module: {path}"
+    spec.loader.exec_module(mod)  # type: ignore
+    return mod
+
+
+ir_mod = load_module(os.path.join(HERE, "1.IR_batch.py"))
+
+GOLD_SET = os.path.join(HERE, "..", "code_test", "elmer_eval_set_20_v2", "elmer_eval_20_v2.jsonl")
+
+CODES = {
+    "E_EMPTY": "no sections",
+    "E_MARKDOWN": "Markdown fence/emphasis left in the file",
+    "E_STRAY_TEXT": "prose or unparsable line outside sections",
+    "E_UNKNOWN_SECTION": "section name not in SECTION_NAMES",
+    "E_MISSING_END": "section not closed before the next one / EOF",
+    "E_STRAY_END": "End without an open section",
+    "E_NO_SOLVER": "no Solver section",
+    "E_SOLVER_REF": "reference to a missing Solver",
+    "E_SECTION_REF": "Body references a missing Equation/Material/Body Force/Initial Condition",
+    "E_TARGET_EMPTY": "Target Boundaries/Bodies without values",
+    "E_ARRAY_SIZE": "declared (n) does not match the number of values",
+    "W_NO_HEADER": "no Header section",
+    "W_NO_SIMULATION": "no Simulation section",
+    "W_NO_TARGET": "Boundary Condition without any target",
+    "W_DUP_SECTION": "duplicate section id",
+    "W_SOLVER_NO_PROCEDURE": "Solver without Procedure",
+    "W_TOPLEVEL_KV": "key = value outside any section",
+}
+
+CJK_RE = re.compile(r"[　-〿一-鿿＀-￯]")
+END_RE = re.compile(r"^end\b", re.I)
+HEADER_LIKE_RE = re.compile(r"^[A-Za-z][A-Za-z_]*(?: [A-Za-z_]+){0,3}(?:\s+\d+)?$")
+SIZE_RE = re.compile(r"^(.*?)\s*\(\s*(\d+)\s*\)\s*$")
+TYPE_WORDS = {"integer", "real", "logical", "string", "file"}
+INLINE_RE = re.compile(
+    r"^(" + "|".join(re.escape(n) for n in sorted(ir_mod.SECTION_NAMES, key=len, reverse=True)) + r")\s+(\d+)\s*::\s*([^=]+?)\s*=\s*(.*)$",
+    re.I)
+BODY_REFS = {"equation": "Equation", "material": "Material", "body force": "Body Force",
+             "initial condition": "Initial Condition"}
+BC_TARGET_KEYS = ("target boundaries", "target nodes", "target coordinates", "body id", "name")
+
+
+def _issue(code: str, line: Optional[int], msg: str = "") -> Dict[str, Any]:
+    return {"code": code, "line": line, "msg": msg or CODES[code]}
+
+
+def _is_global_line(line: str) -> bool:
+    low = line.lower()
+    if low.startswith("$") or INLINE_RE.match(line):
+        return True
+    return any(low.startswith(c.lower()) for c in ir_mod.GLOBAL_COMMANDS + ["Echo"])
+
+
+def scan_structure(text: str) -> List[Dict[str, Any]]:
+    """Line-level scan: balance of section/End, unknown headers, Markdown and prose."""
+    issues: List[Dict[str, Any]] = []
+    rows: List[Tuple[int, str, str]] = []  # (line no, raw, stripped code)
+    for no, raw in enumerate(text.splitlines(), 1):
+        s = raw.strip()
+        if s.startswith("```") or s.startswith("**"):
+            issues.append(_issue("E_MARKDOWN", no))
+            continue
+        code = ir_mod.strip_inline_comment(raw).strip()
+        if code and not code.startswith(("!", "#")):
+            rows.append((no, raw, code))
+
+    open_sec: Optional[Tuple[str, int]] = None
+    in_table = False
+    for i, (no, raw, line) in enumerate(rows):
+        if in_table:
+            # `Real`/`Integer` ... End table of a key (with or without `=`), as parse_to_lite_ir(block_aware=True)
+            in_table = not (END_RE.match(line) and "=" not in line)
+            continue
+        if open_sec is not None and line.lower() in ir_mod.BLOCK_TYPES:
+            in_table = True
+            continue
+        if END_RE.match(line) and "=" not in line:
+            if open_sec is None:
+                issues.append(_issue("E_STRAY_END", no))
+            open_sec = None
+            continue
+        header = ir_mod.parse_section_header(line)
+        if header:
+            if open_sec is not None:
+                issues.append(_issue("E_MISSING_END", open_sec[1], f"{open_sec[0]} not closed before line {no}"))
+            open_sec = (f"{header[0]} {header[1] or ''}".strip(), no)
+            continue
+        if open_sec is not None:
+            if "=" not in line and CJK_RE.search(line.split('"')[0]):
+                issues.append(_issue("E_STRAY_TEXT", no, "non-code text inside a section"))
+            continue
+        if _is_global_line(line):
+            continue
+        if "=" in line:
+            issues.append(_issue("W_TOPLEVEL_KV", no))
+            continue
+        nxt = rows[i + 1][2] if i + 1 < len(rows) else ""
+        if HEADER_LIKE_RE.match(line) and ("=" in nxt or END_RE.match(nxt)):
+            issues.append(_issue("E_UNKNOWN_SECTION", no, f"unknown section '{line}'"))
+            open_sec = (line, no)
+            continue
+        issues.append(_issue("E_STRAY_TEXT", no, f"stray text: {line[:60]}"))
+    if open_sec is not None:
+        issues.append(_issue("E_MISSING_END", open_sec[1], f"{open_sec[0]} not closed at EOF"))
+    return issues
+
+
+def _dynamic_value(item: Dict[str, Any]) -> bool:
+    """Empty (e.g. a `#` MATC value eaten as a comment), MATC or `$` expression: size not checkable."""
+    value = (item.get("value") or "").strip()
+    return not value or value.startswith(("#", "$")) or value.lower().startswith("matc")
+
+
+def _values(item: Dict[str, Any]) -> List[str]:
+    parts = (item.get("value") or "").split()
+    for cont in item.get("cont") or []:
+        parts += cont.split()
+    return [p for p in parts if p.lower() not in TYPE_WORDS]
+
+
+def _int_values(item: Dict[str, Any]) -> Optional[List[int]]:
+    vals = _values(item)
+    try:
+        return [int(v) for v in vals]
+    except ValueError:
+        return None  # MATC / variable-dependent value: not statically checkable
+
+
+def _sec_id(sec: Dict[str, Any]) -> Optional[int]:
+    try:
+        return int((sec.get("tag") or "").split()[0])
+    except (ValueError, IndexError):
+        return None
+
+
+def inline_sections(ir: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Merge `Body Force 2 :: key = value` one-liners into sections (they define the section if it is absent)."""
+    sections = [dict(s, lines=list(s.get("lines", []))) for s in ir.get("sections", []) if s.get("name") != "Global"]
+    by_id = {(s["name"], (s.get("tag") or "").strip()): s for s in sections}
+    for sec in ir.get("sections", []):
+        if sec.get("name") != "Global":
+            continue
+        for item in sec.get("lines", []):
+            m = INLINE_RE.match((item.get("raw") or "").strip())
+            if not m:
+                continue
+            name = next(n for n in ir_mod.SECTION_NAMES if n.lower() == m.group(1).lower())
+            target = by_id.get((name, m.group(2)))
+            if target is None:
+                target = by_id[(name, m.group(2))] = {"name": name, "tag": m.group(2), "lines": []}
+                sections.append(target)
+            target["lines"].append({"raw": item["raw"], "key": m.group(3).strip(), "value": m.group(4).strip()})
+    return sections
+
+
+def check_references(ir: Dict[str, Any]) -> List[Dict[str, Any]]:
+    issues: List[Dict[str, Any]] = []
+    sections = inline_sections(ir)
+    names = [s["name"] for s in sections]
+    if not sections:
+        return [_issue("E_EMPTY", None)]
+    if "Solver" not in names:
+        issues.append(_issue("E_NO_SOLVER", None))
+    if "Header" not in names:
+        issues.append(_issue("W_NO_HEADER", None))
+    if "Simulation" not in names:
+        issues.append(_issue("W_NO_SIMULATION", None))
+
+    ids: Dict[str, set] = {}
+    for s in sections:
+        sid = _sec_id(s)
+        if sid is None:
+            continue
+        seen = ids.setdefault(s["name"], set())
+        if sid in seen:
+            issues.append(_issue("W_DUP_SECTION", None, f"duplicate {s['name']} {sid}"))
+        seen.add(sid)
+    solvers = ids.get("Solver", set())
+
+    for s in sections:
+        keys = {}
+        for item in s.get("lines", []):
+            key = item.get("key")
+            if not key or key == "__comment__":
+                continue
+            m = SIZE_RE.match(key)
+            base, size = (m.group(1), int(m.group(2))) if m else (key, None)
+            keys[base.strip().lower()] = item
+            ints = _int_values(item)
+            if size is not None and ints is not None and not _dynamic_value(item) and len(ints) != size:
+                issues.append(_issue("E_ARRAY_SIZE", None, f"{s['name']} {s.get('tag') or ''}: {key} has {len(ints)} values"))
+            low = base.strip().lower()
+            if low == "active solvers" and ints is not None:
+                for v in ints:
+                    if v not in solvers:
+                        issues.append(_issue("E_SOLVER_REF", None, f"Active Solvers -> Solver {v}"))
+            if low in ("target boundaries", "target bodies") and not _values(item):
+                issues.append(_issue("E_TARGET_EMPTY", None, f"{s['name']} {s.get('tag') or ''}: {key}"))
+            if s["name"] == "Body" and low in BODY_REFS and ints is not None and len(ints) == 1:
+                target = BODY_REFS[low]
+                if ints[0] not in ids.get(target, set()):
+                    issues.append(_issue("E_SECTION_REF", None, f"Body {s.get('tag') or ''}: {base} -> {target} {ints[0]}"))
+        if s["name"] == "Boundary Condition" and not any(k in keys for k in BC_TARGET_KEYS):
+            issues.append(_issue("W_NO_TARGET", None, f"Boundary Condition {s.get('tag') or ''}"))
+        if s["name"] == "Solver" and "procedure" not in keys:
+            issues.append(_issue("W_SOLVER_NO_PROCEDURE", None, f"Solver {s.get('tag') or ''}"))
+    return issues
+
+
+def check_sif(text: str) -> Dict[str, Any]:
+    start = time.perf_counter()
+    issues = scan_structure(text or "")
+    issues += check_references(ir_mod.parse_to_lite_ir(text or "", "<generated>", block_aware=True))
+    errors = [i for i in issues if i["code"].startswith("E")]
+    return {
+        "ok": not errors,
+        "errors": errors,
+        "warnings": [i for i in issues if i["code"].startswith("W")],
+        "codes": sorted({i["code"] for i in issues}),
+        "us": round((time.perf_counter() - start) * 1e6, 1),
+    }
+
+
+# ---------------- batch filter ----------------
+
+def _iter_records(path: str) -> Iterable[Dict[str, Any]]:
+    with open(path, "r", encoding="utf-8") as f:
+        if path.endswith(".jsonl"):
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+        else:
+            data = json.load(f)
+            yield from (data if isinstance(data, list) else [data])
+
+
+def _get_field(rec: Dict[str, Any], field: str) -> str:
+    cur: Any = rec
+    for part in field.split("."):
+        if isinstance(cur, list) and part.isdigit():
+            cur = cur[int(part)] if int(part) < len(cur) else None
+        else:
+            cur = cur.get(part) if isinstance(cur, dict) else None
+    return cur if isinstance(cur, str) else ""
+
+
+def filter_records(records: Iterable[Dict[str, Any]], field: str) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+    kept, rejected = [], []
+    for rec in records:
+        rec["sif_check"] = check_sif(_get_field(rec, field))
+        (kept if rec["sif_check"]["ok"] else rejected).append(rec)
+    return kept, rejected
+
+
+def _write_jsonl(path: str, rows: List[Dict[str, Any]]) -> None:
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        for r in rows:
+            f.write(json.dumps(r, ensure_ascii=False) + "\n")
+
+
+def print_summary(kept: List[Dict[str, Any]], rejected: List[Dict[str, Any]]) -> None:
+    total = len(kept) + len(rejected)
+    counts: Dict[str, int] = {}
+    for r in kept + rejected:
+        for c in r["sif_check"]["codes"]:
+            counts[c] = counts.get(c, 0) + 1
+    us = [r["sif_check"]["us"] for r in kept + rejected]
+    mean_us = sum(us) / len(us) if us else 0.0
+    print(f"[OK] checked {total}: kept {len(kept)}, rejected {len(rejected)} (mean {mean_us:.0f} us/sample)")
+    for code, n in sorted(counts.items(), key=lambda kv: (-kv[1], kv[0])):
+        print(f"  {code:<24}{n:>6}  {CODES[code]}")
+
+
+def check_gold(path: str) -> bool:
+    """Valid elmerfem decks must never be rejected; prints the offending errors otherwise."""
+    bad = 0
+    rows = [r for r in _iter_records(path) if r.get("gold_sif")]
+    for r in rows:
+        res = check_sif(r["gold_sif"])
+        if not res["ok"]:
+            bad += 1
+            for e in res["errors"]:
+                print(f"[Error] {r.get('id')}: {e['code']} line {e['line']}: {e['msg']}")
+    print(f"[{'OK' if not bad else 'Error'}] gold decks passing: {len(rows) - bad}/{len(rows)}")
+    return bad == 0
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--sif", default=None, help="check one .sif file")
+    ap.add_argument("--in", dest="inp", nargs="+", default=None, help="JSON/JSONL record files")
+    ap.add_argument("--in-dir", default=None, help="directory of JSON records (e.g. 1.IR_batch.py output)")
+    ap.add_argument("--field", default="code", help="record field holding the .sif text (dots for nesting, e.g. samples.0)")
+    ap.add_argument("--out", default=None, help="kept records (JSONL), each with a sif_check field")
+    ap.add_argument("--rejected", default=None, help="rejected records (JSONL)")
+    ap.add_argument("--out-dir", default=None, help="with --in-dir: copy kept records here")
+    ap.add_argument("--check-gold", nargs="?", const=GOLD_SET, default=None,
+                    help=f"regression check on an eval set's gold_sif decks (default: {GOLD_SET})")
+    args = ap.parse_args()
+
+    if args.check_gold:
+        raise SystemExit(0 if check_gold(args.check_gold) else 1)
+
+    if args.sif:
+        with open(args.sif, "r", encoding="utf-8", errors="ignore") as f:
+            res = check_sif(f.read())
+        print(json.dumps(res, ensure_ascii=False, indent=2))
+        return
+
+    if args.in_dir:
+        names = sorted(fn for fn in os.listdir(args.in_dir) if fn.endswith(".json"))
+        kept_n = 0
+        all_kept, all_rej = [], []
+        for fn in names:
+            kept, rej = filter_records(_iter_records(os.path.join(args.in_dir, fn)), args.field)
+            all_kept += kept
+            all_rej += rej
+            if kept and args.out_dir:
+                ir_mod.write_json(kept[0], os.path.join(args.out_dir, fn))
+                kept_n += 1
+        print_summary(all_kept, all_rej)
+        if args.out_dir:
+            print(f"[Done] {kept_n} records -> {args.out_dir}")
+        return
+
+    if not args.inp:
+        ap.error("one of --sif / --in / --in-dir is required")
+    records: List[Dict[str, Any]] = []
+    for path in args.inp:
+        records.extend(_iter_records(path))
+    kept, rejected = filter_records(records, args.field)
+    print_summary(kept, rejected)
+    if args.out:
+        _write_jsonl(args.out, kept)
+        print(f"[Done] -> {args.out}")
+    if args.rejected:
+        _write_jsonl(args.rejected, rejected)
+        print(f"[Done] -> {args.rejected}")
+
+
+if __name__ == "__main__":
+    main()
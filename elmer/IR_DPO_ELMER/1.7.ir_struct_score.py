@@ -0,0 +1,215 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+IR-level structural similarity of generated vs gold Elmer .sif.
+
+Both decks are parsed with parse_to_lite_ir (1.IR_batch.py) and compared on:
+  section_f1   multiset F1 over section names (3 x Boundary Condition vs 2 -> partial credit)
+  key_jaccard  Jaccard of the key sets per section name, averaged over the names in either deck
+  num_f1       F1 over the IR `numbers` sets (values matched after rounding to NUM_SIG_DIGITS)
+  score        weighted mean of the three (CONFIG["WEIGHTS"])
+
+Features of every (sample, gold) pair go into shared vocabularies, so all
+samples of all models are scored with a handful of numpy matrix operations;
+no solver runs are needed.
+
+Usage:
+  python 1.7.ir_struct_score.py \
+      --eval-set ../code_test/elmer_eval_set_20_v2/elmer_eval_20_v2.jsonl \
+      --pass1 ../code_test/elmer_eval_set_20_v2/*_pass1.jsonl --out struct_scores.jsonl
+"""
+
+import os
+import re
+import glob
+import json
+import time
+import argparse
+import importlib.util
+from typing import Any, Dict, List, Sequence, Tuple
+
+import numpy as np
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def load_module(name: str, path: str):
+    spec = importlib.util.spec_from_file_location(name, path)
+    mod = importlib.util.module_from_spec(spec)
+    assert spec and spec.loader, f"Cannot load module: {path}"
+    spec.loader.exec_module(mod)  # type: ignore
+    return mod
+
+
+ir_mod = load_module("elmer_ir", os.path.join(HERE, "1.IR_batch.py"))
+runner = load_module("run_sif_eval", os.path.join(HERE, "..", "code_test", "run_sif_eval.py"))
+
+CONFIG = {
+    "EVAL_SET": os.path.join(HERE, "..", "code_test", "elmer_eval_set_20_v2", "elmer_eval_20_v2.jsonl"),
+    "PASS1_GLOB": runner.CONFIG["PASS1_GLOB"],
+    "NUM_SIG_DIGITS": 6,
+    "WEIGHTS": {"section_f1": 1.0, "key_jaccard": 1.0, "num_f1": 1.0},
+}
+
+SIZE_RE = re.compile(r"\s*\(\s*\d+\s*\)\s*$")
+
+
+def norm_key(key: str) -> str:
+    """`Active Solvers(2)` -> `active solvers`."""
+    return " ".join(SIZE_RE.sub("", key).lower().split())
+
+
+def ir_features(text: str) -> Dict[str, List[str]]:
+    ir = ir_mod.parse_to_lite_ir(text or "", "<sample>")
+    sections, keys = [], []
+    for sec in ir["sections"]:
+        name = sec.get("name") or ""
+        sections.append(name)
+        for item in sec.get("lines", []):
+            k = item.get("key")
+            if k and k != "__comment__":
+                keys.append(f"{name}\t{norm_key(k)}")
+    nums = [f"{x:.{CONFIG['NUM_SIG_DIGITS']}g}" for x in ir["numbers"]]
+    return {"s": sections, "k": keys, "n": nums}
+
+
+class Vocab:
+    def __init__(self) -> None:
+        self.index: Dict[str, int] = {}
+
+    def ids(self, items: Sequence[str]) -> List[int]:
+        return [self.index.setdefault(x, len(self.index)) for x in items]
+
+
+def count_matrix(rows: List[List[int]], width: int) -> np.ndarray:
+    m = np.zeros((len(rows), max(width, 1)), dtype=np.int32)
+    for i, cols in enumerate(rows):
+        np.add.at(m[i], cols, 1)
+    return m
+
+
+def _f1(inter: np.ndarray, n_gold: np.ndarray, n_pred: np.ndarray) -> np.ndarray:
+    denom = n_gold + n_pred
+    return np.where(denom > 0, 2.0 * inter / np.maximum(denom, 1), 1.0)  # both empty -> identical
+
+
+def score_pairs(pairs: Sequence[Tuple[Dict[str, List[str]], Dict[str, List[str]]]]) -> Dict[str, np.ndarray]:
+    """pairs: (gold features, generated features). Returns metric arrays aligned with pairs."""
+    vocabs = {kind: Vocab() for kind in ("s", "k", "n")}
+    ids = {kind: ([], []) for kind in vocabs}
+    for gold, pred in pairs:
+        for kind, v in vocabs.items():
+            ids[kind][0].append(v.ids(gold[kind]))
+            ids[kind][1].append(v.ids(pred[kind]))
+
+    def mats(kind: str, binary: bool) -> Tuple[np.ndarray, np.ndarray]:
+        width = len(vocabs[kind].index)
+        g, p = count_matrix(ids[kind][0], width), count_matrix(ids[kind][1], width)
+        return (g > 0, p > 0) if binary else (g, p)
+
+    # section-name multiset F1
+    g, p = mats("s", binary=False)
+    section_f1 = _f1(np.minimum(g, p).sum(1), g.sum(1), p.sum(1))
+
+    # key Jaccard per section name: group (section, key) columns by their section name
+    g, p = mats("k", binary=True)
+    names = Vocab()
+    col_name = np.array(names.ids([k.split("\t", 1)[0] for k in vocabs["k"].index]), dtype=np.intp)
+    group = np.zeros((g.shape[1], max(len(names.index), 1)), dtype=np.int32)
+    group[np.arange(len(col_name)), col_name] = 1
+    inter = (g & p).astype(np.int32) @ group
+    union = (g | p).astype(np.int32) @ group
+    present = union > 0
+    jac = np.where(present, inter / np.maximum(union, 1), 0.0)
+    n_present = present.sum(1)
+    key_jaccard = np.where(n_present > 0, jac.sum(1) / np.maximum(n_present, 1), 1.0)
+
+    # numeric agreement over the IR number sets
+    g, p = mats("n", binary=True)
+    num_f1 = _f1((g & p).sum(1), g.sum(1), p.sum(1))
+
+    w = CONFIG["WEIGHTS"]
+    total = sum(w.values())
+    score = (w["section_f1"] * section_f1 + w["key_jaccard"] * key_jaccard + w["num_f1"] * num_f1) / total
+    return {"section_f1": section_f1, "key_jaccard": key_jaccard, "num_f1": num_f1, "score": score}
+
+
+# ---------------- eval set ----------------
+
+def load_gold(path: str) -> Dict[str, str]:
+    with open(path, "r", encoding="utf-8") as f:
+        if path.endswith(".jsonl"):
+            rows = [json.loads(line) for line in f if line.strip()]
+        else:
+            rows = json.load(f)
+    return {r["id"]: r["gold_sif"] for r in rows if r.get("gold_sif")}
+
+
+def build_pairs(gold: Dict[str, str], rows: List[Dict[str, Any]]):
+    gold_feats: Dict[str, Dict[str, List[str]]] = {}
+    meta, pairs = [], []
+    missing = 0
+    for row in rows:
+        gid = row.get("id")
+        if gid not in gold:
+            missing += 1
+            continue
+        if gid not in gold_feats:
+            gold_feats[gid] = ir_features(gold[gid])
+        for j, code in enumerate(runner.sample_codes(row)):
+            meta.append({"id": gid, "model": row.get("model", "unknown"), "sample": j})
+            pairs.append((gold_feats[gid], ir_features(code)))
+    if missing:
+        print(f"[Warn] {missing} rows without gold_sif skipped")
+    return meta, pairs
+
+
+def summarize(meta: List[Dict[str, Any]], scores: Dict[str, np.ndarray]) -> List[Dict[str, Any]]:
+    models = np.array([m["model"] for m in meta])
+    metrics = list(scores)
+    print(f"{'model':<16}{'samples':>9}" + "".join(f"{m:>13}" for m in metrics))
+    table = []
+    for model in sorted(set(models)):
+        sel = models == model
+        row: Dict[str, Any] = {"model": model, "samples": int(sel.sum())}
+        for m in metrics:
+            row[m] = float(scores[m][sel].mean())
+        table.append(row)
+        print(f"{model:<16}{row['samples']:>9}" + "".join(f"{row[m]:>13.3f}" for m in metrics))
+    return table
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--eval-set", default=CONFIG["EVAL_SET"], help="JSON/JSONL with id + gold_sif")
+    ap.add_argument("--pass1", nargs="+", default=None, help=f"sample files (default: {CONFIG['PASS1_GLOB']})")
+    ap.add_argument("--out", default=None, help="per-sample scores (JSONL)")
+    ap.add_argument("--summary-json", default=None)
+    args = ap.parse_args()
+
+    start = time.perf_counter()
+    gold = load_gold(args.eval_set)
+    rows = runner.load_samples(args.pass1 or sorted(glob.glob(CONFIG["PASS1_GLOB"])))
+    meta, pairs = build_pairs(gold, rows)
+    parsed = time.perf_counter()
+    scores = score_pairs(pairs)
+    done = time.perf_counter()
+    print(f"[OK] {len(pairs)} samples vs {len(gold)} gold decks: parse {parsed - start:.2f}s, "
+          f"score {(done - parsed) * 1000:.1f}ms")
+    table = summarize(meta, scores)
+
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            for i, m in enumerate(meta):
+                rec = dict(m, **{k: round(float(v[i]), 4) for k, v in scores.items()})
+                f.write(json.dumps(rec, ensure_ascii=False) + "\n")
+        print(f"[Done] -> {args.out}")
+    if args.summary_json:
+        with open(args.summary_json, "w", encoding="utf-8") as f:
+            json.dump(table, f, ensure_ascii=False, indent=2)
+        print(f"[Done] -> {args.summary_json}")
+
+
+if __name__ == "__main__":
+    main()
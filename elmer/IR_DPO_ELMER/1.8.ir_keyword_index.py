@@ -0,0 +1,258 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Inverted index over Elmer IR records: (section, key, normalized value) -> record ids.
+
+Works on any directory of IR JSON records ({"ir": ...}, as written by
+1.IR_batch.py or 2.IR_diversify.py). Keys drop their `(n)` size, values drop
+quotes and type words (`Logical True` -> `true`, `Real 1.0E-8` -> `1e-08`), and
+`Solver 1 :: key = value` one-liners count as keys of their section.
+
+On-disk format (one .npz, compressed):
+  docs      record ids (path relative to --in-dir, without .json)
+  terms     sorted "section\\tkey\\tvalue" strings
+  offsets   postings slice of each term
+  postings  doc numbers per term, delta-encoded uint32
+
+Exact terms and key prefixes are found with a binary search over `terms`, and
+posting lists are intersected with numpy, so a query takes milliseconds.
+
+Usage:
+  python 1.8.ir_keyword_index.py build --in-dir elmer_IR --index elmer_IR.index.npz
+  python 1.8.ir_keyword_index.py query --index elmer_IR.index.npz \
+      --where "Solver::Linear System Solver=Iterative" --where "Linear System Iterative Method=BiCGStabl"
+  python 1.8.ir_keyword_index.py values --index elmer_IR.index.npz --key "Solver::Linear System Iterative Method"
+
+API:
+  idx = IRIndex.load("elmer_IR.index.npz")
+  ids = idx.query([("Solver", "Linear System Solver", "Iterative"), (None, "Procedure", None)])
+"""
+
+import os
+import re
+import json
+import time
+import argparse
+import importlib.util
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def load_module(name: str, path: str):
+    spec = importlib.util.spec_from_file_location(name, path)
+    mod = importlib.util.module_from_spec(spec)
+    assert spec and spec.loader, f"Cannot load module: {path}"
+    spec.loader.exec_module(mod)  # type: ignore
+    return mod
+
+
+static_check = load_module("sif_static_check", os.path.join(HERE, "1.6.sif_static_check.py"))
+
+CONFIG = {
+    "IN_DIR": "elmer_IR",
+    "MAX_VALUE_CHARS": 80,
+    "NUM_SIG_DIGITS": 6,
+}
+
+SEP = "\t"
+SIZE_RE = re.compile(r"\s*\(\s*\d+\s*\)\s*$")
+NUM_RE = re.compile(r"^[-+]?(?:\d+\.?\d*|\.\d+)(?:[eEdD][-+]?\d+)?$")
+TYPE_WORDS = {"integer", "real", "logical", "string", "file"}
+Condition = Tuple[Optional[str], str, Optional[str]]
+
+
+def norm_key(key: str) -> str:
+    return " ".join(SIZE_RE.sub("", key).lower().split())
+
+
+def norm_value(value: str) -> str:
+    parts = (value or "").replace('"', " ").split()
+    if parts and parts[0].lower() in TYPE_WORDS:
+        parts = parts[1:]
+    out = []
+    for p in parts:
+        if NUM_RE.match(p):
+            p = f"{float(p.replace('d', 'e').replace('D', 'e')):.{CONFIG['NUM_SIG_DIGITS']}g}"
+        out.append(p.lower())
+    return " ".join(out)[:CONFIG["MAX_VALUE_CHARS"]]
+
+
+def norm_section(name: str) -> str:
+    return " ".join((name or "").lower().split())
+
+
+def record_terms(ir: Dict) -> List[str]:
+    sections = static_check.inline_sections(ir)
+    sections += [s for s in ir.get("sections", []) if s.get("name") == "Global"]
+    terms = set()
+    for sec in sections:
+        sname = norm_section(sec.get("name", ""))
+        for item in sec.get("lines", []):
+            key = item.get("key")
+            if not key or key == "__comment__":
+                continue
+            value = " ".join([item.get("value") or ""] + list(item.get("cont") or []))
+            terms.add(SEP.join((sname, norm_key(key), norm_value(value))))
+    return sorted(terms)
+
+
+def iter_records(in_dir: str) -> Iterable[Tuple[str, Dict]]:
+    for dp, _, fns in os.walk(in_dir):
+        for fn in sorted(fns):
+            if not fn.endswith(".json"):
+                continue
+            path = os.path.join(dp, fn)
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if isinstance(data, dict) and "ir" in data:
+                yield os.path.relpath(path, in_dir)[:-len(".json")], data["ir"]
+
+
+class IRIndex:
+    def __init__(self, docs: np.ndarray, terms: np.ndarray, offsets: np.ndarray, postings: np.ndarray) -> None:
+        self.docs = docs
+        self.terms = terms
+        self.offsets = offsets
+        self.postings = postings
+        self.sections = sorted({t.split(SEP, 1)[0] for t in terms.tolist()})
+
+    @classmethod
+    def build(cls, records: Iterable[Tuple[str, Dict]]) -> "IRIndex":
+        docs: List[str] = []
+        inverted: Dict[str, List[int]] = {}
+        for doc_id, ir in records:
+            n = len(docs)
+            docs.append(doc_id)
+            for t in record_terms(ir):
+                inverted.setdefault(t, []).append(n)  # doc numbers arrive in increasing order
+        terms = sorted(inverted)
+        lists = [np.asarray(inverted[t], dtype=np.uint32) for t in terms]
+        offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum([len(x) for x in lists])
+        deltas = [np.diff(x, prepend=np.uint32(0)) for x in lists]
+        postings = np.concatenate(deltas) if deltas else np.zeros(0, dtype=np.uint32)
+        return cls(np.asarray(docs), np.asarray(terms), offsets, postings.astype(np.uint32))
+
+    def save(self, path: str) -> None:
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        np.savez_compressed(path, docs=self.docs, terms=self.terms, offsets=self.offsets, postings=self.postings)
+
+    @classmethod
+    def load(cls, path: str) -> "IRIndex":
+        with np.load(path, allow_pickle=False) as z:
+            return cls(z["docs"], z["terms"], z["offsets"], z["postings"])
+
+    # ---------------- lookup ----------------
+
+    def _posting(self, i: int) -> np.ndarray:
+        return np.cumsum(self.postings[self.offsets[i]:self.offsets[i + 1]], dtype=np.int64)
+
+    def _range(self, prefix: str) -> Tuple[int, int]:
+        lo = int(np.searchsorted(self.terms, prefix, side="left"))
+        hi = int(np.searchsorted(self.terms, prefix + "\U0010ffff", side="left"))
+        return lo, hi
+
+    def term_ids(self, section: Optional[str], key: str, value: Optional[str]) -> List[int]:
+        secs = [norm_section(section)] if section else self.sections
+        out: List[int] = []
+        for s in secs:
+            base = SEP.join((s, norm_key(key), ""))
+            if value is None:
+                lo, hi = self._range(base)
+                out.extend(range(lo, hi))
+                continue
+            term = base + norm_value(value)
+            i = int(np.searchsorted(self.terms, term))
+            if i < len(self.terms) and self.terms[i] == term:
+                out.append(i)
+        return out
+
+    def match(self, cond: Condition) -> np.ndarray:
+        lists = [self._posting(i) for i in self.term_ids(*cond)]
+        return np.unique(np.concatenate(lists)) if lists else np.zeros(0, dtype=np.int64)
+
+    def query(self, conds: Sequence[Condition], mode: str = "all") -> List[str]:
+        """Record ids matching all (or any) conditions; section/value None = any."""
+        result: Optional[np.ndarray] = None
+        for cond in conds:
+            hits = self.match(cond)
+            if result is None:
+                result = hits
+            elif mode == "all":
+                result = np.intersect1d(result, hits, assume_unique=True)
+            else:
+                result = np.union1d(result, hits)
+            if mode == "all" and result.size == 0:
+                break
+        return self.docs[result].tolist() if result is not None else []
+
+    def values(self, section: Optional[str], key: str) -> List[Tuple[str, int]]:
+        """(value, record count) for a key, most frequent first."""
+        counts: Dict[str, int] = {}
+        for i in self.term_ids(section, key, None):
+            v = str(self.terms[i]).split(SEP, 2)[2]
+            counts[v] = counts.get(v, 0) + int(self.offsets[i + 1] - self.offsets[i])
+        return sorted(counts.items(), key=lambda kv: (-kv[1], kv[0]))
+
+
+def parse_condition(text: str) -> Condition:
+    """`Solver::Linear System Solver=Iterative`, `Procedure` (any section, any value)."""
+    section: Optional[str] = None
+    if "::" in text:
+        section, text = text.split("::", 1)
+        section = section.strip() or None
+        if section == "*":
+            section = None
+    if "=" in text:
+        key, value = text.split("=", 1)
+        return section, key.strip(), value.strip()
+    return section, text.strip(), None
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    b = sub.add_parser("build")
+    b.add_argument("--in-dir", default=CONFIG["IN_DIR"], help="IR JSON records (1.IR_batch.py / 2.IR_diversify.py)")
+    b.add_argument("--index", required=True, help="output .npz")
+    q = sub.add_parser("query")
+    q.add_argument("--index", required=True)
+    q.add_argument("--where", action="append", required=True,
+                   help='"[Section::]Key[=Value]", repeatable (e.g. "Solver::Linear System Solver=Iterative")')
+    q.add_argument("--any", action="store_true", help="OR the conditions instead of AND")
+    q.add_argument("--limit", type=int, default=50)
+    v = sub.add_parser("values")
+    v.add_argument("--index", required=True)
+    v.add_argument("--key", required=True, help='"[Section::]Key"')
+    v.add_argument("--limit", type=int, default=30)
+    args = ap.parse_args()
+
+    start = time.perf_counter()
+    if args.cmd == "build":
+        idx = IRIndex.build(iter_records(args.in_dir))
+        idx.save(args.index)
+        size = os.path.getsize(args.index if args.index.endswith(".npz") else args.index + ".npz")
+        print(f"[OK] {len(idx.docs)} records, {len(idx.terms)} terms, {len(idx.postings)} postings "
+              f"-> {args.index} ({size / 1024:.1f} KB, {time.perf_counter() - start:.2f}s)")
+        return
+
+    idx = IRIndex.load(args.index)
+    loaded = time.perf_counter()
+    if args.cmd == "query":
+        ids = idx.query([parse_condition(w) for w in args.where], mode="any" if args.any else "all")
+        print(f"[OK] {len(ids)} records (load {(loaded - start) * 1000:.1f}ms, "
+              f"query {(time.perf_counter() - loaded) * 1000:.2f}ms)")
+        for doc_id in ids[:args.limit]:
+            print(doc_id)
+    else:
+        section, key, _ = parse_condition(args.key)
+        for value, n in idx.values(section, key)[:args.limit]:
+            print(f"{n:>6}  {value}")
+
+
+if __name__ == "__main__":
+    main()
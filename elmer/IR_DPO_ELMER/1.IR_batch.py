@@ -4,8 +4,15 @@
 """
 Batch IR extractor for Elmer .sif files.
 
+With --flatten each record also gets `ir_flat`: the IR of the deck with its
+INCLUDE files spliced in (searched in the deck dir, `Include Path` and
+--include-path; each include is read and expanded once per run through an LRU
+cache), `Real`/`Integer` tables parsed up to their own End, and continuation
+blocks resolved into `table` / `array` / `matc` / `variable` fields.
+
 Usage:
   python 1.IR_batch.py --in-root data/sources/elmer/official_sif --out-dir elmer_IR
+  python 1.IR_batch.py --in-root elmerfem/fem/tests --out-dir elmer_IR --flatten
 """
 
 import os
@@ -13,12 +20,20 @@ import re
 import json
 import argparse
 import hashlib
+import functools
 from typing import Any, Dict, List, Optional, Tuple
 
 DEFAULT_IN_ROOT = "data/sources/elmer/official_sif"
 DEFAULT_OUT_DIR = "elmer_IR"
 
 NUM_RE = re.compile(r"(?<![\w/.-])[-+]?\d+(?:\.\d+)?(?:[eE][+-]?\d+)?(?![\w/.-])")
+INCLUDE_RE = re.compile(r"^\s*include\s+(?!path\b)(.+?)\s*$", re.I)
+INCLUDE_PATH_RE = re.compile(r"^\s*include\s+path\s*=?\s*(.*?)\s*$", re.I)
+MATC_RE = re.compile(r"\bMATC\s+\"(.*)\"", re.I | re.S)
+VARIABLE_RE = re.compile(r"\bVariable\s+(\"[^\"]+\"|[^,;]+?)\s*(?:[,;]|\s+(?:Real|Integer)\b|$)", re.I)
+BLOCK_TYPES = {"real", "integer", "logical", "string"}
+INCLUDE_CACHE_SIZE = 256
+MAX_INCLUDE_DEPTH = 8
 
 
 def sha1_short(s: str, n: int = 8) -> str:
@@ -152,9 +167,12 @@ def extract_numbers(text: str) -> List[float]:
     return nums
 
 
-def parse_to_lite_ir(text: str, source_file: str) -> Dict[str, Any]:
+def parse_to_lite_ir(text: str, source_file: str, block_aware: bool = False) -> Dict[str, Any]:
+    # block_aware: a `Real`/`Integer` continuation line opens a table that runs to its own End,
+    # instead of that End closing the enclosing section.
     sections: List[Dict[str, Any]] = []
     cur: Optional[Dict[str, Any]] = None
+    block_item: Optional[Dict[str, Any]] = None
     global_sec: Optional[Dict[str, Any]] = None
     solver_ext: Dict[str, Dict[str, str]] = {}
     include_paths: List[str] = []
@@ -167,6 +185,13 @@ def parse_to_lite_ir(text: str, source_file: str) -> Dict[str, Any]:
         if not line.strip():
             continue
 
+        if block_item is not None and not line.lstrip().startswith(("!", "#")):
+            block_item["cont"].append(line.strip())
+            numbers.extend(extract_numbers(line))
+            if line.strip().lower() == "end":
+                block_item = None
+            continue
+
         # Preserve full-line comments as raw lines
         if line.lstrip().startswith(("!", "#")):
             if cur is None:
@@ -211,6 +236,8 @@ def parse_to_lite_ir(text: str, source_file: str) -> Dict[str, Any]:
                 cont.append(line.strip())
                 last["cont"] = cont
                 numbers.extend(extract_numbers(line))
+                if block_aware and line.strip().lower() in BLOCK_TYPES:
+                    block_item = last
                 continue
             # Keep raw lines that don't match key/value (e.g., arrays or loose syntax)
             cur["lines"].append({"raw": line, "key": None, "value": None})
@@ -268,6 +295,114 @@ def parse_to_lite_ir(text: str, source_file: str) -> Dict[str, Any]:
     return ir
 
 
+# ---------------- include + continuation resolution ----------------
+
+def include_search_dirs(text: str, base_dir: str, extra: Tuple[str, ...] = ()) -> Tuple[str, ...]:
+    dirs = [base_dir]
+    for raw in text.splitlines():
+        m = INCLUDE_PATH_RE.match(strip_inline_comment(raw))
+        if m:
+            val = m.group(1).strip().strip('"')
+            dirs.append(os.path.join(base_dir, val) if val else base_dir)
+    dirs.extend(extra)
+    return tuple(dict.fromkeys(os.path.normpath(d) for d in dirs))
+
+
+def _find_include(name: str, dirs: Tuple[str, ...]) -> Optional[str]:
+    if os.path.isabs(name):
+        return name if os.path.isfile(name) else None
+    for d in dirs:
+        cand = os.path.join(d, name)
+        if os.path.isfile(cand):
+            return os.path.abspath(cand)
+    return None
+
+
+@functools.lru_cache(maxsize=INCLUDE_CACHE_SIZE)
+def _read_include(path: str, mtime_ns: int) -> Tuple[str, bool]:
+    # keyed on mtime so an edited include is re-read; returns (text, has nested INCLUDE)
+    with open(path, "r", encoding="utf-8", errors="ignore") as f:
+        text = f.read()
+    return text, any(INCLUDE_RE.match(strip_inline_comment(ln)) for ln in text.splitlines())
+
+
+@functools.lru_cache(maxsize=INCLUDE_CACHE_SIZE)
+def _expanded_include(path: str, mtime_ns: int, dirs: Tuple[str, ...], depth: int) -> Tuple[str, Tuple[str, ...], Tuple[str, ...]]:
+    text, _ = _read_include(path, mtime_ns)
+    flat, used, missing = expand_includes(text, dirs, depth + 1)
+    return flat, tuple(used), tuple(missing)
+
+
+def expand_includes(text: str, dirs: Tuple[str, ...], depth: int = 0) -> Tuple[str, List[str], List[str]]:
+    """Splice INCLUDE files into text. Returns (flat text, included paths, unresolved names)."""
+    out: List[str] = []
+    used: List[str] = []
+    missing: List[str] = []
+    for raw in text.splitlines():
+        m = INCLUDE_RE.match(strip_inline_comment(raw))
+        if not m:
+            out.append(raw)
+            continue
+        name = m.group(1).strip().strip('"')
+        path = _find_include(name, dirs)
+        if path is None or depth >= MAX_INCLUDE_DEPTH:
+            missing.append(name)
+            out.append(raw)
+            continue
+        mtime_ns = os.stat(path).st_mtime_ns
+        _, nested = _read_include(path, mtime_ns)
+        # leaf includes do not depend on the search dirs, so every deck shares one expansion
+        key_dirs, key_depth = (dirs, depth) if nested else ((), 0)
+        sub, sub_used, sub_missing = _expanded_include(path, mtime_ns, key_dirs, key_depth)
+        out.append(f"! >>> include {name}")
+        out.extend(sub.splitlines())
+        out.append(f"! <<< include {name}")
+        used.extend([path, *sub_used])
+        missing.extend(sub_missing)
+    return "\n".join(out), used, missing
+
+
+def include_cache_info() -> Dict[str, int]:
+    read, expanded = _read_include.cache_info(), _expanded_include.cache_info()
+    return {"files_read": read.misses, "expansions": expanded.misses, "reuses": expanded.hits}
+
+
+def resolve_item(item: Dict[str, Any]) -> None:
+    """Structured view of a key's continuation block: matc / variable / table / array."""
+    value = item.get("value") or ""
+    cont = list(item.get("cont") or [])
+    text = " ".join([value] + cont)
+    m = MATC_RE.search(text)
+    if m or value.startswith("$"):
+        item["matc"] = m.group(1).strip() if m else " ".join([value[1:]] + cont).strip()
+        return
+    v = VARIABLE_RE.search(text)
+    if v:
+        item["variable"] = v.group(1).strip().strip('"')
+    lowered = [c.lower() for c in cont]
+    start = next((i for i, c in enumerate(lowered) if c in BLOCK_TYPES), None)
+    if start is not None:
+        end = lowered.index("end", start) if "end" in lowered[start:] else len(cont)
+        item["table"] = [extract_numbers(row) for row in cont[start + 1:end]]
+    elif cont and all(extract_numbers(c) and not re.search(r"[a-df-z]", c, re.I) for c in cont):
+        item["array"] = extract_numbers(text)
+
+
+def flatten_sif(text: str, source_file: str, include_paths: Tuple[str, ...] = ()) -> Dict[str, Any]:
+    base_dir = os.path.dirname(os.path.abspath(source_file))
+    dirs = include_search_dirs(text, base_dir, tuple(include_paths))
+    flat, used, missing = expand_includes(text, dirs)
+    ir = parse_to_lite_ir(flat, source_file, block_aware=True)
+    for sec in ir["sections"]:
+        for item in sec.get("lines", []):
+            if item.get("cont") or (item.get("value") or "").startswith("$") or "matc" in (item.get("value") or "").lower():
+                resolve_item(item)
+    ir["meta"]["includes_resolved"] = list(dict.fromkeys(used))
+    if missing:
+        ir["meta"]["includes_missing"] = list(dict.fromkeys(missing))
+    return ir
+
+
 def render_sif(ir: Dict[str, Any]) -> str:
     sections = ir.get("sections") or []
     lines: List[str] = []
@@ -297,15 +432,23 @@ def render_sif(ir: Dict[str, Any]) -> str:
     return "\n".join(lines).rstrip() + "\n"
 
 
-def process_file(path: str, root: str, out_dir: str) -> str:
+def build_record(path: str, flatten: bool = False, include_paths: Tuple[str, ...] = ()) -> Dict[str, Any]:
     with open(path, "r", encoding="utf-8", errors="ignore") as f:
         text = f.read()
     ir = parse_to_lite_ir(text, path)
-    obj = {
+    rec = {
         "source_code": text,
         "ir": ir,
         "meta": {"source_file": path},
     }
+    if flatten:
+        rec["ir_flat"] = flatten_sif(text, path, include_paths)
+    return rec
+
+
+def process_file(path: str, root: str, out_dir: str, flatten: bool = False,
+                 include_paths: Tuple[str, ...] = ()) -> str:
+    obj = build_record(path, flatten, include_paths)
     out_name = rel_safe_name(path, root) + ".json"
     out_path = os.path.join(out_dir, out_name)
     write_json(obj, out_path)
@@ -316,6 +459,8 @@ def main() -> None:
     ap = argparse.ArgumentParser()
     ap.add_argument("--in-root", default=DEFAULT_IN_ROOT)
     ap.add_argument("--out-dir", default=DEFAULT_OUT_DIR)
+    ap.add_argument("--flatten", action="store_true", help="also write ir_flat (includes + tables resolved)")
+    ap.add_argument("--include-path", action="append", default=[], help="extra include search dir (repeatable)")
     args = ap.parse_args()
 
     files = walk_sif_files(args.in_root)
@@ -324,8 +469,12 @@ def main() -> None:
         return
 
     for p in files:
-        out_path = process_file(p, args.in_root, args.out_dir)
+        out_path = process_file(p, args.in_root, args.out_dir, args.flatten, tuple(args.include_path))
         print(f"[OK] {p} -> {out_path}")
+    if args.flatten:
+        info = include_cache_info()
+        print(f"[OK] include cache: {info['files_read']} files read, {info['expansions']} expansions, "
+              f"{info['reuses']} reuses")
 
 
 if __name__ == "__main__":
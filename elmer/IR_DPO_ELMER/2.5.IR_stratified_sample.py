@@ -0,0 +1,220 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Feature-stratified sampling of IR records before the instruction / DPO stages.
+
+ElmerFEM tests over-represent a few solver families, so processing every IR
+file gives a mix dominated by them. This stage groups records into strata by
+  eq       primary solver equation (first Solver `Equation`, via summarize_sections)
+  eqset    all solver equations of the deck
+  solvers  bucketed meta.solver_count
+  bcs      bucketed meta.bc_count
+and keeps `--target` records in one streaming pass:
+  - per stratum, bottom-k sampling on a seeded hash of the record name (order
+    independent and reproducible, like the per-record RNG of 0.pipeline_dag.py);
+  - after the pass, quotas are water-filled: every stratum first gets
+    min(available, --min-per-stratum) while the budget lasts, the rest is split
+    proportional to available**alpha (alpha=0 balanced, 1 proportional) and
+    capped at availability.
+
+Usage:
+  python 2.5.IR_stratified_sample.py --in-dir elmer_augmented_IR --out-dir elmer_sampled_IR --target 600
+  python 2.5.IR_stratified_sample.py --in-dir elmer_augmented_IR --target 600 --strata eq,bcs --dry-run
+  python 3.0instruction_gen.py --in-dir elmer_sampled_IR ...
+"""
+
+import os
+import json
+import heapq
+import shutil
+import hashlib
+import argparse
+import importlib.util
+from typing import Any, Dict, Iterable, Iterator, List, Sequence, Tuple
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+CONFIG = {
+    "IN_DIR": "elmer_augmented_IR",
+    "OUT_DIR": "elmer_sampled_IR",
+    "SEED": 20250101,
+    "STRATA": "eq,solvers",
+    "ALPHA": 0.5,
+    "MIN_PER_STRATUM": 1,
+    "COUNT_BUCKETS": [1, 2, 3, 5, 9],
+    "MANIFEST": "sample_manifest.jsonl",  # not *.json, so downstream stages do not read it as a record
+}
+
+
+def load_module(path: str):
+    spec = importlib.util.spec_from_file_location("elmer_instruction_gen", path)
+    mod = importlib.util.module_from_spec(spec)
+    assert spec and spec.loader, f"Cannot load module: {path}"
+    spec.loader.exec_module(mod)  # type: ignore
+    return mod
+
+
+instruction_gen = load_module(os.path.join(HERE, "3.0instruction_gen.py"))
+
+
+def list_json_files(root: str) -> List[str]:
+    out = []
+    for dp, _, fns in os.walk(root):
+        for fn in fns:
+            if fn.lower().endswith(".json"):
+                out.append(os.path.join(dp, fn))
+    return sorted(out)
+
+
+# ---------------- strata ----------------
+
+def bucket(n: int, edges: Sequence[int]) -> str:
+    if n < edges[0]:
+        return str(n)
+    for lo, hi in zip(edges, edges[1:]):
+        if n < hi:
+            return str(lo) if hi - lo == 1 else f"{lo}-{hi - 1}"
+    return f"{edges[-1]}+"
+
+
+def norm_eq(val: str) -> str:
+    return " ".join(val.replace('"', " ").lower().split())
+
+
+def stratum_of(data: Dict[str, Any], fields: Sequence[str]) -> str:
+    ir = data.get("ir") or {}
+    meta = ir.get("meta") or {}
+    eqs = [norm_eq(e) for e in instruction_gen.summarize_sections(ir)["solver_eqs"]]
+    feats = {
+        "eq": eqs[0] if eqs else "none",
+        "eqset": "+".join(sorted(set(eqs))) or "none",
+        "solvers": bucket(int(meta.get("solver_count") or 0), CONFIG["COUNT_BUCKETS"]),
+        "bcs": bucket(int(meta.get("bc_count") or 0), CONFIG["COUNT_BUCKETS"]),
+    }
+    return "|".join(f"{f}={feats[f]}" for f in fields)
+
+
+# ---------------- sampling ----------------
+
+def priority(seed: int, name: str) -> int:
+    return int(hashlib.sha1(f"{seed}:{name}".encode("utf-8")).hexdigest()[:16], 16)
+
+
+def allocate(counts: Dict[str, int], target: int, alpha: float, min_per: int) -> Dict[str, int]:
+    """Water-filling quotas: coverage minimum first, then count**alpha shares capped at availability."""
+    quota = {s: 0 for s in counts}
+    left = target
+    for s in sorted(counts, key=lambda s: (-counts[s], s)):  # more strata than budget: largest first
+        quota[s] = min(counts[s], min_per, left)
+        left -= quota[s]
+    while left > 0:
+        open_s = [s for s in counts if quota[s] < counts[s]]
+        if not open_s:
+            break
+        weights = {s: counts[s] ** alpha for s in open_s}
+        total_w = sum(weights.values())
+        shares = {s: left * w / total_w for s, w in weights.items()}
+        grant = {s: min(counts[s] - quota[s], int(shares[s])) for s in open_s}
+        if not any(grant.values()):
+            # largest remainder: hand out the last few one by one
+            for s in sorted(open_s, key=lambda s: (-(shares[s] - int(shares[s])), s))[:left]:
+                grant[s] = 1
+        for s, g in grant.items():
+            quota[s] += g
+        left -= sum(grant.values())
+    return quota
+
+
+class StratifiedSampler:
+    """One pass over (name, item, stratum); keeps at most `target` lowest-priority items per stratum."""
+
+    def __init__(self, target: int, seed: int = CONFIG["SEED"]) -> None:
+        self.target = target
+        self.seed = seed
+        self.heaps: Dict[str, List[Tuple[int, str, Any]]] = {}
+        self.counts: Dict[str, int] = {}
+
+    def add(self, name: str, item: Any, stratum: str) -> None:
+        self.counts[stratum] = self.counts.get(stratum, 0) + 1
+        heap = self.heaps.setdefault(stratum, [])
+        entry = (-priority(self.seed, name), name, item)  # max-heap on priority
+        if len(heap) < self.target:
+            heapq.heappush(heap, entry)
+        elif entry[0] > heap[0][0]:
+            heapq.heapreplace(heap, entry)
+
+    def select(self, alpha: float, min_per: int) -> Tuple[List[Tuple[str, Any]], List[Dict[str, Any]]]:
+        quota = allocate(self.counts, self.target, alpha, min_per)
+        picked: List[Tuple[str, Any]] = []
+        report = []
+        for s in sorted(self.counts, key=lambda s: (-self.counts[s], s)):
+            best = sorted(self.heaps[s], key=lambda e: -e[0])[:quota[s]]
+            picked.extend((name, item) for _, name, item in best)
+            report.append({"stratum": s, "available": self.counts[s], "quota": quota[s]})
+        picked.sort(key=lambda x: x[0])
+        return picked, report
+
+
+def sample_stream(records: Iterable[Tuple[str, Dict[str, Any]]], target: int, alpha: float = CONFIG["ALPHA"],
+                  fields: Sequence[str] = tuple(CONFIG["STRATA"].split(",")),
+                  min_per: int = CONFIG["MIN_PER_STRATUM"]) -> Iterator[Tuple[str, Dict[str, Any]]]:
+    """Pipeline adapter: stratified subset of (name, record) pairs, in name order."""
+    sampler = StratifiedSampler(target)
+    for name, data in records:
+        sampler.add(name, data, stratum_of(data, fields))
+    picked, _ = sampler.select(alpha, min_per)
+    yield from picked
+
+
+def print_report(report: List[Dict[str, Any]]) -> None:
+    width = max([len(r["stratum"]) for r in report] + [8])
+    print(f"{'stratum':<{width}}{'avail':>8}{'quota':>8}")
+    for r in report:
+        print(f"{r['stratum']:<{width}}{r['available']:>8}{r['quota']:>8}")
+    total_a = sum(r["available"] for r in report)
+    total_q = sum(r["quota"] for r in report)
+    print(f"{'total':<{width}}{total_a:>8}{total_q:>8}  ({len(report)} strata)")
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--in-dir", default=CONFIG["IN_DIR"])
+    ap.add_argument("--out-dir", default=CONFIG["OUT_DIR"])
+    ap.add_argument("--target", type=int, required=True, help="records to keep")
+    ap.add_argument("--strata", default=CONFIG["STRATA"], help="comma list of eq,eqset,solvers,bcs")
+    ap.add_argument("--alpha", type=float, default=CONFIG["ALPHA"], help="0 = balanced, 1 = proportional")
+    ap.add_argument("--min-per-stratum", type=int, default=CONFIG["MIN_PER_STRATUM"])
+    ap.add_argument("--seed", type=int, default=CONFIG["SEED"])
+    ap.add_argument("--dry-run", action="store_true", help="only print the strata table")
+    args = ap.parse_args()
+
+    fields = [f.strip() for f in args.strata.split(",") if f.strip()]
+    files = list_json_files(args.in_dir)
+    if not files:
+        print(f"[Error] no IR files in {args.in_dir}")
+        return
+
+    sampler = StratifiedSampler(args.target, args.seed)
+    for p in files:  # single pass; only paths are kept, picked files are copied afterwards
+        with open(p, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        sampler.add(os.path.relpath(p, args.in_dir), p, stratum_of(data, fields))
+    picked, report = sampler.select(args.alpha, args.min_per_stratum)
+    print_report(report)
+    if args.dry_run:
+        return
+
+    os.makedirs(args.out_dir, exist_ok=True)
+    for rel, src in picked:
+        dst = os.path.join(args.out_dir, rel)
+        os.makedirs(os.path.dirname(dst), exist_ok=True)
+        shutil.copyfile(src, dst)
+    with open(os.path.join(args.out_dir, CONFIG["MANIFEST"]), "w", encoding="utf-8") as f:
+        for r in report:
+            f.write(json.dumps(r, ensure_ascii=False) + "\n")
+    print(f"[Done] {len(picked)}/{len(files)} records -> {args.out_dir}")
+
+
+if __name__ == "__main__":
+    main()
@@ -14,6 +14,7 @@ import re
 import json
 import random
 import argparse
+import functools
 import importlib.util
 from typing import Any, Dict, List, Tuple
 
@@ -42,6 +43,7 @@ def list_json_files(root: str) -> List[str]:
     return sorted(out)
 
 
+@functools.lru_cache(maxsize=None)
 def load_parser(path: str):
     spec = importlib.util.spec_from_file_location("elmer_ir", path)
     mod = importlib.util.module_from_spec(spec)
@@ -50,8 +52,8 @@ def load_parser(path: str):
     return mod
 
 
-def jitter_value(x: float, rel: float) -> float:
-    return x * (1.0 + random.uniform(-rel, rel))
+def jitter_value(x: float, rel: float, rng=random) -> float:
+    return x * (1.0 + rng.uniform(-rel, rel))
 
 
 SKIP_PATTERNS = [
@@ -82,21 +84,21 @@ def should_skip_line(raw: str) -> bool:
     return False
 
 
-def jitter_line(line: str, rel: float) -> Tuple[str, bool]:
+def jitter_line(line: str, rel: float, rng=random) -> Tuple[str, bool]:
     # Jitter the first numeric token found
     def _repl(m):
         try:
             val = float(m.group(0))
         except Exception:
             return m.group(0)
-        new_val = jitter_value(val, rel)
+        new_val = jitter_value(val, rel, rng)
         return f"{new_val:.6g}"
 
     new_line, n = NUM_RE.subn(_repl, line, count=1)
     return new_line, n > 0
 
 
-def diversify_one(data: Dict[str, Any], max_variants: int) -> List[Dict[str, Any]]:
+def diversify_one(data: Dict[str, Any], max_variants: int, rng=random) -> List[Dict[str, Any]]:
     out = []
     base_sections = data.get("ir", {}).get("sections") or []
     parser = load_parser(CONFIG["EXTRACTOR_PATH"])
@@ -113,10 +115,10 @@ def diversify_one(data: Dict[str, Any], max_variants: int) -> List[Dict[str, Any
         if not candidates:
             continue
 
-        s_idx, l_idx = random.choice(candidates)
+        s_idx, l_idx = rng.choice(candidates)
         item = sections[s_idx]["lines"][l_idx]
         raw = item.get("raw")
-        new_raw, did = jitter_line(raw, CONFIG["JITTER_REL"])
+        new_raw, did = jitter_line(raw, CONFIG["JITTER_REL"], rng)
         if did:
             item["raw"] = new_raw
         source_code = parser.render_sif({"sections": sections})
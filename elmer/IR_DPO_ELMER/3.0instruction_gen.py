@@ -147,9 +147,7 @@ def truncate_soft(text: str, limit: int) -> str:
     return text[:limit].rstrip() + "…"
 
 
-def process_file(path_in: str, out_dir: str, nvar: int) -> Tuple[int, str]:
-    with open(path_in, "r", encoding="utf-8") as f:
-        data = json.load(f)
+def attach_alpaca_records(data: Dict[str, Any], nvar: int) -> Dict[str, Any]:
     ir = data.get("ir") or {}
 
     records = []
@@ -165,6 +163,14 @@ def process_file(path_in: str, out_dir: str, nvar: int) -> Tuple[int, str]:
 
     out_data = dict(data)
     out_data["alpaca_records"] = records
+    return out_data
+
+
+def process_file(path_in: str, out_dir: str, nvar: int) -> Tuple[int, str]:
+    with open(path_in, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    out_data = attach_alpaca_records(data, nvar)
+    records = out_data["alpaca_records"]
 
     ensure_dir(out_dir)
     out_path = os.path.join(out_dir, os.path.basename(path_in))
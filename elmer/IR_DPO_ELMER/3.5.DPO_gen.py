@@ -3,14 +3,36 @@
 
 """
 Elmer DPO negative sample generator.
+
+Two engines:
+- "ir" (default): typed mutations on the parsed IR sections (solver Procedure
+  swap, dropped End, wrong Target Boundaries index, unit-scale error,
+  duplicated section id, omitted key line). Candidate sites are enumerated once
+  per record and N_MUTATIONS are sampled in bulk; each mutation re-renders only
+  the section it touches. `chosen` is the IR re-render (inline comments dropped,
+  globals grouped), recorded as dpo_pairs.chosen_source = "ir_render".
+- "text": the original raw-text numeric/omit-line variants; chosen_source = "source".
+Both engines keep at most MAX_REJECTED_PER_REC pairs per record.
+
+unit_scale only touches float quantities: values typed Real, or untyped float
+literals, outside quotes, tables and id / index / list keys.
+
+Usage:
+  python 3.5.DPO_gen.py --in-dir elmer_alpaca_out --out-dir dpo_pairs_elmer
+  python 3.5.DPO_gen.py --check-gold   # every unit_scale rejection of the gold decks must reparse
 """
 
 import os
 import re
+import sys
 import json
 import random
 import argparse
-from typing import Any, Dict, List, Optional
+import functools
+import importlib.util
+from typing import Any, Dict, List, Optional, Tuple
+
+HERE = os.path.dirname(os.path.abspath(__file__))
 
 CONFIG = {
     "IN_DIR": "elmer_alpaca_out",
@@ -18,6 +40,10 @@ CONFIG = {
     "SEED": 20250102,
     "N_NUMERIC": 2,
     "MAX_REJECTED_PER_REC": 4,
+    "ENGINE": "ir",
+    "N_MUTATIONS": 24,
+    "EXTRACTOR_PATH": os.path.join(HERE, "1.IR_batch.py"),
+    "GOLD_SET": os.path.join(HERE, "..", "code_test", "elmer_eval_set_20_v2", "elmer_eval_20_v2.jsonl"),
 }
 
 NUM_RE = re.compile(r"(?<![\w/.-])[-+]?\d+(?:\.\d+)?(?:[eE][+-]?\d+)?(?![\w/.-])")
@@ -41,54 +67,354 @@ def pick_chosen_code(data: dict) -> str:
     return code
 
 
-def mutate_numeric(code: str) -> Optional[str]:
+def mutate_numeric(code: str, rng=random) -> Optional[str]:
     matches = list(NUM_RE.finditer(code))
     if not matches:
         return None
-    m = random.choice(matches)
+    m = rng.choice(matches)
     try:
         val = float(m.group(0))
     except Exception:
         return None
-    factor = random.choice([10.0, 0.1, 1.1, 0.9])
+    factor = rng.choice([10.0, 0.1, 1.1, 0.9])
     new_val = f"{val * factor:.6g}"
     return code[:m.start()] + new_val + code[m.end():]
 
 
 def omit_line(code: str, key: str) -> Optional[str]:
+    return omit_lines(code, [key]).get(key)
+
+
+def omit_lines(code: str, keys: List[str]) -> Dict[str, str]:
+    """For each key, drop the first line containing it (case-insensitive). One pass over the lines."""
     lines = code.splitlines()
+    wanted = [(k, k.lower()) for k in keys]
+    found: Dict[str, int] = {}
     for i, ln in enumerate(lines):
-        if key.lower() in ln.lower():
-            return "\n".join(lines[:i] + lines[i + 1:]) + "\n"
-    return None
+        low = ln.lower()
+        for k, klow in wanted:
+            if k not in found and klow in low:
+                found[k] = i
+        if len(found) == len(wanted):
+            break
+    return {k: "\n".join(lines[:i] + lines[i + 1:]) + "\n" for k, i in found.items()}
+
+
+OMIT_KEYS = [
+    ("Mesh DB", "omit_meshdb"),
+    ("Output File", "omit_output"),
+    ("Procedure", "omit_procedure"),
+]
 
 
-def build_rejected_variants(code: str) -> List[Dict[str, str]]:
+def build_rejected_variants(code: str, rng=random) -> List[Dict[str, str]]:
     out = []
-    num = mutate_numeric(code)
+    num = mutate_numeric(code, rng)
     if num:
         out.append({"type": "numeric", "code": num})
-    for key, t in [
-        ("Mesh DB", "omit_meshdb"),
-        ("Output File", "omit_output"),
-        ("Procedure", "omit_procedure"),
-    ]:
-        cand = omit_line(code, key)
+    omitted = omit_lines(code, [k for k, _ in OMIT_KEYS])
+    for key, t in OMIT_KEYS:
+        cand = omitted.get(key)
         if cand:
             out.append({"type": t, "code": cand})
     return out
 
 
-def process_file(path_in: str, out_dir: str) -> None:
-    with open(path_in, "r", encoding="utf-8") as f:
-        data = json.load(f)
+# ---------------------------------------------------------------------------
+# IR mutation engine
+# ---------------------------------------------------------------------------
+
+KNOWN_PROCEDURES = [
+    '"HeatSolve" "HeatSolver"',
+    '"StressSolve" "StressSolver"',
+    '"FlowSolve" "FlowSolver"',
+    '"StatElecSolve" "StatElecSolver"',
+    '"MagnetoDynamics" "WhitneyAVSolver"',
+    '"ResultOutputSolve" "ResultOutputSolver"',
+    '"SaveData" "SaveScalars"',
+    '"AdvectionDiffusion" "AdvectionDiffusionSolver"',
+]
+
+UNIT_FACTORS = [1e3, 1e-3, 1e6, 1e-6, 1e2, 1e-2]
+
+# Keys whose numbers are ids, counts, orders, indices or lists rather than physical quantities.
+NON_PHYSICAL_KEY_RE = re.compile(
+    r"target|active solvers|equation|material|body|initial condition|procedure|"
+    r"dofs|order|intervals|iterations|output|exec|mesh levels|restart|variable|"
+    r"mapping|solvers\b|\bbc\b|boundar|mortar|element|index|mask|component|\(\s*\d+\s*\)",
+    flags=re.IGNORECASE,
+)
+
+# Explicit value type; only Real (or untyped) values are quantities that can carry a unit error.
+VALUE_TYPE_RE = re.compile(r"^\s*(real|integer|logical|string|file|variable)\b", flags=re.IGNORECASE)
+FLOAT_LITERAL_RE = re.compile(r"[.eE]")
+QUOTED_RE = re.compile(r'"[^"]*"')
+
+OMIT_KEY_TYPES = {k.lower(): t for k, t in OMIT_KEYS}
+
+
+@functools.lru_cache(maxsize=None)
+def load_parser(path: str):
+    spec = importlib.util.spec_from_file_location("elmer_ir", path)
+    mod = importlib.util.module_from_spec(spec)
+    assert spec and spec.loader, f"Cannot load parser: {path}"
+    spec.loader.exec_module(mod)  # type: ignore
+    return mod
+
+
+def _value_numbers(raw: str) -> List[Tuple[int, int, float]]:
+    eq = raw.find("=")
+    if eq < 0:
+        return []
+    out = []
+    for m in NUM_RE.finditer(raw, eq + 1):
+        try:
+            out.append((m.start(), m.end(), float(m.group(0))))
+        except Exception:
+            continue
+    return out
+
+
+def _value_type(value: Optional[str]) -> Optional[str]:
+    m = VALUE_TYPE_RE.match(value or "")
+    return m.group(1).lower() if m else None
+
+
+def _unit_scale_sites(item: Dict[str, Any], key: str, nums: List[Tuple[int, int, float]]) -> List[Tuple[int, int, float]]:
+    """Float literals of a Real or untyped value; tables, MATC, element specs (p:1) and index keys are skipped."""
+    value = (item.get("value") or "").strip()
+    vtype = _value_type(value)
+    if item.get("cont") or vtype not in (None, "real") or NON_PHYSICAL_KEY_RE.search(key):
+        return []
+    if value.startswith("$") or "matc" in value.lower():
+        return []
+    raw = item.get("raw") or ""
+    out = []
+    for start, end, val in _outside_quotes(raw, nums):
+        if val == 0.0 or raw[start - 1:start] == ":":
+            continue
+        if vtype is None and not FLOAT_LITERAL_RE.search(raw[start:end]):
+            continue
+        out.append((start, end, val))
+    return out
+
+
+def _outside_quotes(raw: str, nums: List[Tuple[int, int, float]]) -> List[Tuple[int, int, float]]:
+    """Drop numbers inside "..." (variable names, MATC / file strings such as "t[d:2 p:1]")."""
+    spans = [m.span() for m in QUOTED_RE.finditer(raw)]
+    return [n for n in nums if not any(a <= n[0] < b for a, b in spans)]
+
+
+def _replace_span(raw: str, start: int, end: int, text: str) -> str:
+    return raw[:start] + text + raw[end:]
+
+
+def _with_line(sec: Dict[str, Any], l_idx: int, raw: Optional[str]) -> Dict[str, Any]:
+    lines = list(sec.get("lines") or [])
+    if raw is None:
+        del lines[l_idx]
+    else:
+        item = dict(lines[l_idx])
+        item["raw"] = raw
+        lines[l_idx] = item
+    out = dict(sec)
+    out["lines"] = lines
+    return out
 
+
+def enumerate_sites(sections: List[Dict[str, Any]]) -> Dict[str, List[Tuple]]:
+    """All candidate mutation sites of a record, by mutation type."""
+    sites: Dict[str, List[Tuple]] = {
+        "swap_procedure": [],
+        "drop_end": [],
+        "wrong_target_boundaries": [],
+        "unit_scale": [],
+        "duplicate_section_id": [],
+        "omit_key": [],
+    }
+    procedures: List[str] = []
+    for s_idx, sec in enumerate(sections):
+        name = sec.get("name") or ""
+        if name == "Global":
+            continue
+        sites["drop_end"].append((s_idx,))
+        if (sec.get("tag") or "").isdigit():
+            sites["duplicate_section_id"].append((s_idx,))
+        for l_idx, item in enumerate(sec.get("lines") or []):
+            key = (item.get("key") or "").lower()
+            raw = item.get("raw") or ""
+            if key == "__comment__":
+                continue
+            # Loose lines such as `Mesh DB "." "x"` carry no parsed key.
+            head = key or raw.strip().lower()
+            for okey, otype in OMIT_KEY_TYPES.items():
+                if head == okey or head.startswith(okey + " "):
+                    sites["omit_key"].append((s_idx, l_idx, otype))
+                    break
+            if not key:
+                continue
+            if name == "Solver" and key == "procedure":
+                procedures.append((item.get("value") or "").strip())
+                sites["swap_procedure"].append((s_idx, l_idx))
+                continue
+            nums = _value_numbers(raw)
+            if key.startswith("target boundaries"):
+                for start, end, _ in nums:
+                    sites["wrong_target_boundaries"].append((s_idx, l_idx, start, end))
+                continue
+            for start, end, val in _unit_scale_sites(item, key, nums):
+                sites["unit_scale"].append((s_idx, l_idx, start, end, val))
+    sites["_procedures"] = [(p,) for p in procedures]
+    return sites
+
+
+def _boundary_ids(sections: List[Dict[str, Any]]) -> List[int]:
+    ids = set()
+    for sec in sections:
+        for item in sec.get("lines") or []:
+            if (item.get("key") or "").lower().startswith("target boundaries"):
+                for _, _, v in _value_numbers(item.get("raw") or ""):
+                    if v.is_integer():
+                        ids.add(int(v))
+    return sorted(ids)
+
+
+def apply_mutation(
+    mtype: str,
+    site: Tuple,
+    sections: List[Dict[str, Any]],
+    chunks: List[str],
+    render_section,
+    ctx: Dict[str, Any],
+    rng,
+) -> Optional[Tuple[str, str]]:
+    """Return (subtype, rejected code) or None if the site yields no change."""
+    new_chunks = list(chunks)
+    subtype = mtype
+    if mtype == "drop_end":
+        (s_idx,) = site
+        chunk = chunks[s_idx].rstrip("\n")
+        if not chunk.endswith("End"):
+            return None
+        new_chunks[s_idx] = chunk[: -len("End")].rstrip("\n") + "\n"
+    elif mtype == "swap_procedure":
+        s_idx, l_idx = site
+        item = sections[s_idx]["lines"][l_idx]
+        cur = (item.get("value") or "").strip()
+        pool = [p for p in ctx["procedures"] + KNOWN_PROCEDURES if p and p != cur]
+        if not pool:
+            return None
+        raw = item.get("raw") or ""
+        eq = raw.find("=")
+        new_raw = raw[: eq + 1] + " " + rng.choice(pool)
+        new_chunks[s_idx] = render_section(_with_line(sections[s_idx], l_idx, new_raw))
+    elif mtype == "wrong_target_boundaries":
+        s_idx, l_idx, start, end = site
+        raw = sections[s_idx]["lines"][l_idx].get("raw") or ""
+        known = ctx["boundary_ids"]
+        cur = int(float(raw[start:end]))
+        choices = [v for v in (cur - 1, cur + 1) if v > 0 and v not in known]
+        choices.append((max(known) if known else cur) + rng.randint(1, 5))
+        new_raw = _replace_span(raw, start, end, str(rng.choice(choices)))
+        new_chunks[s_idx] = render_section(_with_line(sections[s_idx], l_idx, new_raw))
+    elif mtype == "unit_scale":
+        s_idx, l_idx, start, end, val = site
+        raw = sections[s_idx]["lines"][l_idx].get("raw") or ""
+        new_raw = _replace_span(raw, start, end, f"{val * rng.choice(UNIT_FACTORS):.6g}")
+        new_chunks[s_idx] = render_section(_with_line(sections[s_idx], l_idx, new_raw))
+    elif mtype == "duplicate_section_id":
+        (s_idx,) = site
+        sec = sections[s_idx]
+        siblings = [
+            s.get("tag") for s in sections
+            if s.get("name") == sec.get("name") and (s.get("tag") or "") != (sec.get("tag") or "")
+            and (s.get("tag") or "").isdigit()
+        ]
+        if siblings:
+            clone = dict(sec)
+            clone["tag"] = rng.choice(siblings)
+            new_chunks[s_idx] = render_section(clone)
+        else:
+            # Only one section of this kind: emit it twice under the same id.
+            new_chunks[s_idx] = chunks[s_idx] + "\n" + chunks[s_idx]
+    elif mtype == "omit_key":
+        s_idx, l_idx, subtype = site
+        new_chunks[s_idx] = render_section(_with_line(sections[s_idx], l_idx, None))
+    else:
+        raise ValueError(f"unknown mutation type: {mtype}")
+    return subtype, "\n".join(new_chunks).strip()
+
+
+def sample_sites(sites: Dict[str, List[Tuple]], n: int, rng) -> List[Tuple[str, Tuple]]:
+    """Pick up to n (type, site) pairs, round-robin over types so rare types are not starved."""
+    pools = []
+    for mtype, lst in sites.items():
+        if mtype.startswith("_") or not lst:
+            continue
+        lst = list(lst)
+        rng.shuffle(lst)
+        pools.append((mtype, lst))
+    rng.shuffle(pools)
+    out: List[Tuple[str, Tuple]] = []
+    while pools and len(out) < n:
+        nxt = []
+        for mtype, lst in pools:
+            if len(out) >= n:
+                break
+            out.append((mtype, lst.pop()))
+            if lst:
+                nxt.append((mtype, lst))
+        pools = nxt
+    return out
+
+
+def build_ir_rejected_variants(ir: Dict[str, Any], n: int, rng=random) -> Tuple[str, List[Dict[str, str]]]:
+    """Return (chosen code rendered from the IR, typed rejected variants)."""
+    parser = load_parser(CONFIG["EXTRACTOR_PATH"])
+    sections = ir.get("sections") or []
+
+    def render_section(sec: Dict[str, Any]) -> str:
+        return parser.render_sif({"sections": [sec]})
+
+    chunks = [render_section(sec) for sec in sections]
+    chosen = "\n".join(chunks).strip()
+    sites = enumerate_sites(sections)
+    ctx = {
+        "procedures": [p for (p,) in sites["_procedures"]],
+        "boundary_ids": _boundary_ids(sections),
+    }
+
+    out: List[Dict[str, str]] = []
+    seen = {chosen}
+    # Oversample a little: some sites produce no change or duplicate code.
+    for mtype, site in sample_sites(sites, n * 2, rng):
+        if len(out) >= n:
+            break
+        res = apply_mutation(mtype, site, sections, chunks, render_section, ctx, rng)
+        if not res:
+            continue
+        subtype, code = res
+        if code in seen:
+            continue
+        seen.add(code)
+        out.append({"type": subtype, "code": code})
+    return chosen, out
+
+
+def attach_dpo_pairs(data: Dict[str, Any], rng=random) -> Optional[Dict[str, Any]]:
     chosen = pick_chosen_code(data)
     if not chosen:
-        return
+        return None
 
-    rejected_candidates = build_rejected_variants(chosen)
-    random.shuffle(rejected_candidates)
+    sections = (data.get("ir") or {}).get("sections")
+    if CONFIG["ENGINE"] == "ir" and sections:
+        # Chosen is re-rendered from the IR so each pair differs only at the mutation site.
+        chosen, rejected_candidates = build_ir_rejected_variants(data["ir"], CONFIG["N_MUTATIONS"], rng)
+        chosen_source = "ir_render"
+    else:
+        rejected_candidates = build_rejected_variants(chosen, rng)
+        chosen_source = "source"
+    rng.shuffle(rejected_candidates)
     rejected_candidates = rejected_candidates[:CONFIG["MAX_REJECTED_PER_REC"]]
 
     dpo_pairs = []
@@ -100,7 +426,18 @@ def process_file(path_in: str, out_dir: str) -> None:
         })
 
     out = dict(data)
-    out["dpo_pairs"] = {"code": dpo_pairs}
+    out["dpo_pairs"] = {"code": dpo_pairs, "chosen_source": chosen_source}
+    return out
+
+
+def process_file(path_in: str, out_dir: str) -> None:
+    with open(path_in, "r", encoding="utf-8") as f:
+        data = json.load(f)
+
+    out = attach_dpo_pairs(data)
+    if out is None:
+        return
+    dpo_pairs = out["dpo_pairs"]["code"]
 
     ensure_dir(out_dir)
     out_path = os.path.join(out_dir, os.path.basename(path_in))
@@ -109,12 +446,83 @@ def process_file(path_in: str, out_dir: str) -> None:
     print(f"[OK] {os.path.basename(path_in)} -> {out_path} pairs={len(dpo_pairs)}")
 
 
+def _structure(ir: Dict[str, Any]) -> List[Tuple[str, str, List[str]]]:
+    return [(s.get("name") or "", s.get("tag") or "", [(i.get("key") or "").lower() for i in s.get("lines") or []])
+            for s in ir.get("sections") or []]
+
+
+def _check_unit_scale(chosen: str, rejected: str) -> Optional[str]:
+    """None if rejected differs from chosen in exactly one float literal; else the reason."""
+    a, b = chosen.splitlines(), rejected.splitlines()
+    if len(a) != len(b):
+        return "line count changed"
+    diff = [(x, y) for x, y in zip(a, b) if x != y]
+    if len(diff) != 1:
+        return f"{len(diff)} lines changed"
+    x, y = diff[0]
+    nx, ny = NUM_RE.findall(x), NUM_RE.findall(y)
+    if len(nx) != len(ny) or NUM_RE.sub("#", x) != NUM_RE.sub("#", y):
+        return f"not a literal swap: {x.strip()!r} -> {y.strip()!r}"
+    changed = [(u, v) for u, v in zip(nx, ny) if u != v]
+    if len(changed) != 1:
+        return f"{len(changed)} literals changed: {y.strip()!r}"
+    u, v = changed[0]
+    value = x.split("=", 1)[1] if "=" in x else ""
+    if _value_type(value) != "real" and not FLOAT_LITERAL_RE.search(u):
+        return f"non-float literal {u} scaled: {x.strip()!r}"
+    return None
+
+
+def check_gold(path: str) -> bool:
+    """Apply every unit_scale site of every gold deck; each rejection must reparse to the same
+    section/key structure and differ only in one float literal."""
+    parser = load_parser(CONFIG["EXTRACTOR_PATH"])
+    rng = random.Random(CONFIG["SEED"])
+    n_decks = n_sites = bad = 0
+    with open(path, "r", encoding="utf-8") as f:
+        rows = [json.loads(line) for line in f if line.strip()]
+    for r in rows:
+        text = r.get("gold_sif")
+        if not text:
+            continue
+        n_decks += 1
+        ir = parser.parse_to_lite_ir(text, r.get("id") or "gold")
+        sections = ir["sections"]
+
+        def render_section(sec: Dict[str, Any]) -> str:
+            return parser.render_sif({"sections": [sec]})
+
+        chunks = [render_section(sec) for sec in sections]
+        chosen = "\n".join(chunks).strip()
+        want = _structure(parser.parse_to_lite_ir(chosen, "chosen"))
+        for site in enumerate_sites(sections)["unit_scale"]:
+            n_sites += 1
+            _, rejected = apply_mutation("unit_scale", site, sections, chunks, render_section, {}, rng)
+            reason = _check_unit_scale(chosen, rejected)
+            if reason is None and _structure(parser.parse_to_lite_ir(rejected, "rejected")) != want:
+                reason = "structure changed on reparse"
+            if reason:
+                bad += 1
+                print(f"[Error] {r.get('id')}: {reason}")
+    print(f"[{'OK' if not bad else 'Error'}] unit_scale sites on {n_decks} gold decks: {n_sites - bad}/{n_sites} clean")
+    return bad == 0
+
+
 def main() -> None:
     ap = argparse.ArgumentParser()
     ap.add_argument("--in-dir", default=CONFIG["IN_DIR"])
     ap.add_argument("--out-dir", default=CONFIG["OUT_DIR"])
+    ap.add_argument("--engine", choices=["ir", "text"], default=CONFIG["ENGINE"])
+    ap.add_argument("--n-mutations", type=int, default=CONFIG["N_MUTATIONS"])
+    ap.add_argument("--check-gold", nargs="?", const=CONFIG["GOLD_SET"], default=None,
+                    help="regression check of unit_scale on an eval set's gold_sif decks")
     args = ap.parse_args()
 
+    if args.check_gold:
+        sys.exit(0 if check_gold(args.check_gold) else 1)
+
+    CONFIG["ENGINE"] = args.engine
+    CONFIG["N_MUTATIONS"] = args.n_mutations
     random.seed(CONFIG["SEED"])
     files = list_json_files(args.in_dir)
     if not files:
@@ -63,18 +63,21 @@ def summarize_code(code: str) -> str:
     return " ".join(parts)
 
 
-def process_file(path_in: str, out_dir: str) -> None:
-    with open(path_in, "r", encoding="utf-8") as f:
-        data = json.load(f)
-
+def attach_cot(data: Dict[str, Any]) -> Dict[str, Any]:
     pairs = (data.get("dpo_pairs") or {}).get("code") or []
     for p in pairs:
         chosen = p.get("chosen") or ""
         summary = summarize_code(chosen)
         p["chosen_cot"] = summary
         p["rejected_cot"] = summary
+    return dict(data)
+
+
+def process_file(path_in: str, out_dir: str) -> None:
+    with open(path_in, "r", encoding="utf-8") as f:
+        data = json.load(f)
 
-    out = dict(data)
+    out = attach_cot(data)
     ensure_dir(out_dir)
     out_path = os.path.join(out_dir, os.path.basename(path_in))
     with open(out_path, "w", encoding="utf-8") as f:
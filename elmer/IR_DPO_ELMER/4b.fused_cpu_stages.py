@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Fused CPU stages: 3.0 instruction gen + 3.5 DPO gen + 4 COT in one pass.
+
+Each record is read once, gets `alpaca_records`, `dpo_pairs` and `chosen_cot`
+in memory, and only the final document is written (same layout as the output
+of 4.COT_out_gen.py). Records are spread over a process pool.
+
+Usage:
+  python 4b.fused_cpu_stages.py --in-dir elmer_augmented_IR --out-dir dpo_pairs_elmer_cot --workers 8
+"""
+
+import os
+import json
+import random
+import argparse
+import importlib.util
+from collections import deque
+from concurrent.futures import Executor, ProcessPoolExecutor
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+CONFIG = {
+    "IN_DIR": "elmer_augmented_IR",
+    "OUT_DIR": "dpo_pairs_elmer_cot",
+    "NUM_VARIANTS_PER_FILE": 1,
+    "WORKERS": os.cpu_count() or 4,
+    "CHUNKSIZE": 16,
+}
+
+_STAGES: Dict[str, Any] = {}
+
+
+def load_module(name: str, path: str):
+    spec = importlib.util.spec_from_file_location(name, path)
+    mod = importlib.util.module_from_spec(spec)
+    assert spec and spec.loader, f"Cannot load module: {path}"
+    spec.loader.exec_module(mod)  # type: ignore
+    return mod
+
+
+def _init_worker(nvar: int) -> None:
+    _STAGES["instruction"] = load_module("elmer_instruction_gen", os.path.join(HERE, "3.0instruction_gen.py"))
+    _STAGES["dpo"] = load_module("elmer_dpo_gen", os.path.join(HERE, "3.5.DPO_gen.py"))
+    _STAGES["cot"] = load_module("elmer_cot_gen", os.path.join(HERE, "4.COT_out_gen.py"))
+    _STAGES["nvar"] = nvar
+
+
+def record_rng(seed: int, name: str) -> random.Random:
+    return random.Random(f"{seed}:{name}")
+
+
+def fuse_record(name: str, data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    if not _STAGES:
+        _init_worker(CONFIG["NUM_VARIANTS_PER_FILE"])
+    data = _STAGES["instruction"].attach_alpaca_records(data, _STAGES["nvar"])
+    dpo = _STAGES["dpo"]
+    data = dpo.attach_dpo_pairs(data, record_rng(dpo.CONFIG["SEED"], name))
+    if data is None:
+        return None
+    return _STAGES["cot"].attach_cot(data)
+
+
+def _fuse_item(item: Tuple[str, Dict[str, Any]]) -> Tuple[str, Optional[Dict[str, Any]]]:
+    name, data = item
+    return name, fuse_record(name, data)
+
+
+def _fuse_file(args: Tuple[str, str, int]) -> Tuple[str, int]:
+    path_in, out_dir, indent = args
+    name = os.path.basename(path_in)
+    with open(path_in, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    out = fuse_record(name, data)
+    if out is None:
+        return name, -1
+    out_path = os.path.join(out_dir, name)
+    with open(out_path, "w", encoding="utf-8") as f:
+        json.dump(out, f, ensure_ascii=False, indent=indent or None)
+    return name, len(out["dpo_pairs"]["code"])
+
+
+def bounded_map(ex: Executor, fn, items: Iterable[Any], window: int) -> Iterator[Any]:
+    """Like ex.map, but pulls from `items` lazily with at most `window` futures in flight (input order kept).
+
+    Executor.map submits the whole iterable up front, which would hold the entire
+    upstream corpus in memory and defeat the streaming DAG.
+    """
+    pending: deque = deque()
+    for item in items:
+        pending.append(ex.submit(fn, item))
+        if len(pending) >= window:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
+def fused_map(records: Iterable[Tuple[str, Dict[str, Any]]], nvar: int, workers: int) -> Iterator[Tuple[str, Dict[str, Any]]]:
+    """Stream (name, data) through the fused stages on a process pool, keeping input order."""
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(nvar,)) as ex:
+        for name, out in bounded_map(ex, _fuse_item, records, window=max(1, workers) * CONFIG["CHUNKSIZE"]):
+            if out is not None:
+                yield name, out
+
+
+def list_json_files(root: str) -> List[str]:
+    out = []
+    for dp, _, fns in os.walk(root):
+        for fn in fns:
+            if fn.lower().endswith(".json"):
+                out.append(os.path.join(dp, fn))
+    return sorted(out)
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--in-dir", default=CONFIG["IN_DIR"])
+    ap.add_argument("--out-dir", default=CONFIG["OUT_DIR"])
+    ap.add_argument("--num-variants", type=int, default=CONFIG["NUM_VARIANTS_PER_FILE"])
+    ap.add_argument("--workers", type=int, default=CONFIG["WORKERS"])
+    ap.add_argument("--indent", type=int, default=2, help="0 writes compact JSON")
+    args = ap.parse_args()
+
+    files = list_json_files(args.in_dir)
+    if not files:
+        print(f"[Error] no IR files in {args.in_dir}")
+        return
+    os.makedirs(args.out_dir, exist_ok=True)
+
+    total_pairs = 0
+    written = 0
+    jobs = [(p, args.out_dir, args.indent) for p in files]
+    with ProcessPoolExecutor(max_workers=args.workers, initializer=_init_worker, initargs=(args.num_variants,)) as ex:
+        for name, n in ex.map(_fuse_file, jobs, chunksize=CONFIG["CHUNKSIZE"]):
+            if n < 0:
+                continue
+            written += 1
+            total_pairs += n
+    print(f"[Done] files={written}/{len(files)} pairs={total_pairs} -> {args.out_dir}")
+
+
+if __name__ == "__main__":
+    main()
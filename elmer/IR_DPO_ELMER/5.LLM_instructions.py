@@ -15,16 +15,16 @@ from concurrent.futures import ThreadPoolExecutor, as_completed
 
 INPUT_FOLDER = "outputs/dpo_pairs_elmer_cot_full_v3"
 OUTPUT_FOLDER = "outputs/instruction_aug_elmer_dpo_full_v7"
-os.makedirs(OUTPUT_FOLDER, exist_ok=True)
 
 MODEL_NAME = "deepseek-chat"
 MAX_WORKERS = 128
 MAX_RETRY = 5
 RETRY_BASE_DELAY = 1.6
 
+# DEEPSEEK_BASE_URL / DEEPSEEK_API_KEY override the endpoint (e.g. common/mock_llm_server.py).
 client = openai.Client(
-    api_key="sk-REDACTED",
-    base_url="https://api.deepseek.com"
+    api_key=os.environ.get("DEEPSEEK_API_KEY", "sk-REDACTED"),
+    base_url=os.environ.get("DEEPSEEK_BASE_URL", "https://api.deepseek.com")
 )
 
 NUM_TOKEN = re.compile(r"(?<![\w/.-])-?\d+(?:\.\d+)?(?:[eE][+-]?\d+)?(?![\w/.-])")
@@ -158,22 +158,27 @@ def process_file(path_in: str, out_dir: str) -> None:
     print(f"[OK] {os.path.basename(path_in)} -> {out_path}")
 
 
-def main() -> None:
+def run(input_folder: str, output_folder: str) -> None:
+    os.makedirs(output_folder, exist_ok=True)
     files = []
-    for dp, _, fns in os.walk(INPUT_FOLDER):
+    for dp, _, fns in os.walk(input_folder):
         for fn in fns:
             if fn.lower().endswith(".json"):
                 files.append(os.path.join(dp, fn))
     files.sort()
     if not files:
-        print(f"[Error] no files in {INPUT_FOLDER}")
+        print(f"[Error] no files in {input_folder}")
         return
 
     with ThreadPoolExecutor(max_workers=MAX_WORKERS) as ex:
-        futures = [ex.submit(process_file, p, OUTPUT_FOLDER) for p in files]
+        futures = [ex.submit(process_file, p, output_folder) for p in files]
         for f in as_completed(futures):
             f.result()
 
 
+def main() -> None:
+    run(INPUT_FOLDER, OUTPUT_FOLDER)
+
+
 if __name__ == "__main__":
     main()
@@ -38,35 +38,44 @@ def normalize_variant(text: str) -> str:
     return s.strip()
 
 
-def main() -> None:
-    os.makedirs(OUTPUT_FOLDER, exist_ok=True)
+def clean_record(data: dict) -> dict:
+    recs = data.get("alpaca_records") or []
+    if recs:
+        variants = recs[0].get("instruction_variants") or []
+        if variants:
+            recs[0]["instruction_variants"] = [normalize_variant(v) for v in variants]
+        for p in (data.get("dpo_pairs") or {}).get("code") or []:
+            if p.get("instruction_variants"):
+                p["instruction_variants"] = [normalize_variant(v) for v in p["instruction_variants"]]
+    data["alpaca_records"] = recs
+    return data
+
+
+def run(input_folder: str, output_folder: str) -> None:
+    os.makedirs(output_folder, exist_ok=True)
     files = []
-    for dp, _, fns in os.walk(INPUT_FOLDER):
+    for dp, _, fns in os.walk(input_folder):
         for fn in fns:
             if fn.lower().endswith(".json"):
                 files.append(os.path.join(dp, fn))
     files.sort()
     if not files:
-        print(f"[Error] no files in {INPUT_FOLDER}")
+        print(f"[Error] no files in {input_folder}")
         return
 
     for path in files:
-        out_path = os.path.join(OUTPUT_FOLDER, os.path.basename(path))
+        out_path = os.path.join(output_folder, os.path.basename(path))
         with open(path, "r", encoding="utf-8") as f:
             data = json.load(f)
-        recs = data.get("alpaca_records") or []
-        if recs:
-            variants = recs[0].get("instruction_variants") or []
-            if variants:
-                recs[0]["instruction_variants"] = [normalize_variant(v) for v in variants]
-            for p in (data.get("dpo_pairs") or {}).get("code") or []:
-                if p.get("instruction_variants"):
-                    p["instruction_variants"] = [normalize_variant(v) for v in p["instruction_variants"]]
-        data["alpaca_records"] = recs
+        data = clean_record(data)
         with open(out_path, "w", encoding="utf-8") as f:
             json.dump(data, f, ensure_ascii=False, indent=2)
         print(f"[OK] {os.path.basename(path)} -> {out_path}")
 
 
+def main() -> None:
+    run(INPUT_FOLDER, OUTPUT_FOLDER)
+
+
 if __name__ == "__main__":
     main()
@@ -3,21 +3,32 @@
 
 """
 Finalize Elmer DPO dataset (similar format to tcad_coder).
+
+OUTPUT_FORMAT "flat" appends conversations/chosen/rejected records to OUTPUT_JSONL;
+"compact" writes the normalized layout of 6b.compact_dataset.py to
+<OUTPUT_JSONL stem>.compact/ (expand it back with `6b.compact_dataset.py expand`).
 """
 
 import os
 import json
 import time
+import sqlite3
 import hashlib
+import argparse
 import threading
+import importlib.util
 import openai
 from concurrent.futures import ThreadPoolExecutor, as_completed
 
 INPUT_FOLDER = "outputs/instruction_aug_elmer_dpo_full_v8"
 OUTPUT_FOLDER = "outputs/cot_aug_elmer_dpo_full_v8"
-os.makedirs(OUTPUT_FOLDER, exist_ok=True)
 
 OUTPUT_JSONL = os.path.join(OUTPUT_FOLDER, "dpo_elmer_dataset_full_v8.jsonl")
+OUTPUT_FORMAT = "flat"  # or "compact"
+# Persistent UID index next to the JSONL (<jsonl>.uidx.sqlite, Bloom filter in <...>.bloom).
+USE_BLOOM_FILTER = True
+BLOOM_BITS = 1 << 27  # 16 MiB, ~1% false positives at 14M uids
+BLOOM_HASHES = 7
 
 MODEL_NAME = "deepseek-chat"
 MAX_WORKERS = 128
@@ -29,6 +40,21 @@ client = openai.Client(
     base_url="https://api.deepseek.com"
 )
 
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def load_module(name: str, path: str):
+    spec = importlib.util.spec_from_file_location(name, path)
+    mod = importlib.util.module_from_spec(spec)
+    assert spec and spec.loader, f"Cannot load module: {path}"
+    spec.loader.exec_module(mod)  # type: ignore
+    return mod
+
+
+compact = load_module("elmer_compact_dataset", os.path.join(HERE, "6b.compact_dataset.py"))
+inflight_memo = load_module("inflight_memo", os.path.join(HERE, "..", "..", "common", "inflight_memo.py"))
+assemble_response = compact.assemble_response
+
 
 def build_prompt(instruction_text: str) -> str:
     return f"""
@@ -59,42 +85,205 @@ def call_api(instruction_text: str) -> str:
     return ""
 
 
-def assemble_response(text: str, code: str) -> str:
-    parts = []
-    if text:
-        parts.append(text)
-        parts.append("")
-    if code:
-        parts.append("#### 完整代码\n")
-        parts.append("```plaintext\n" + code.strip() + "\n```")
-    return "\n".join(parts).rstrip()
+def normalize_instruction(text: str) -> str:
+    return " ".join((text or "").split())
 
 
-def uid_for_pair(inst: str, chosen: str, rejected: str) -> str:
-    raw = (inst or "") + "\n" + (chosen or "") + "\n" + (rejected or "")
-    return hashlib.md5(raw.encode("utf-8", "ignore")).hexdigest()
+class ParagraphMemo(inflight_memo.InflightMemo):
+    """
+    Cross-file memo of call_api results keyed on the normalized instruction text.
 
+    Augmented siblings (__aug1, __aug2, ...) and normalized variants often share the
+    same instruction; each distinct one is summarized once. Concurrent requests for
+    a key that is already in flight wait for that call instead of issuing another.
+    Empty paragraphs (failed calls) are not kept, so later requests retry.
+    """
 
-def load_existing_uids(path: str) -> set:
+    def get(self, inst: str) -> str:  # type: ignore[override]
+        return super().get(normalize_instruction(inst), lambda: call_api(inst), failed=lambda p: not p)
+
+
+def uid_prefix(inst: str):
+    h = hashlib.md5((inst or "").encode("utf-8", "ignore"))
+    h.update(b"\n")
+    return h
+
+
+def uid_for_pair(inst: str, chosen: str, rejected: str, prefix=None) -> str:
+    # Same digest as md5(inst + "\n" + chosen + "\n" + rejected), without building the joined string.
+    h = (prefix or uid_prefix(inst)).copy()
+    h.update((chosen or "").encode("utf-8", "ignore"))
+    h.update(b"\n")
+    h.update((rejected or "").encode("utf-8", "ignore"))
+    return h.hexdigest()
+
+
+def iter_existing_uids(path: str):
     if not os.path.exists(path):
-        return set()
-    uids = set()
+        return
     with open(path, "r", encoding="utf-8") as f:
         for line in f:
             line = line.strip()
             if not line:
                 continue
             try:
-                obj = json.loads(line)
-                uid = obj.get("_uid")
-                if uid:
-                    uids.add(uid)
+                uid = json.loads(line).get("_uid")
             except Exception:
                 continue
-    return uids
+            if uid:
+                yield uid
+
+
+def load_existing_uids(path: str) -> set:
+    return set(iter_existing_uids(path))
+
+
+class BloomFilter:
+    def __init__(self, n_bits: int, n_hashes: int) -> None:
+        self.n_bits = n_bits
+        self.n_hashes = n_hashes
+        self.bits = bytearray((n_bits + 7) // 8)
+
+    def _positions(self, key: bytes):
+        # Double hashing over the (already uniform) 16-byte md5 key.
+        h1 = int.from_bytes(key[:8], "little")
+        h2 = int.from_bytes(key[8:16], "little") | 1
+        for i in range(self.n_hashes):
+            yield (h1 + i * h2) % self.n_bits
+
+    def add(self, key: bytes) -> None:
+        for pos in self._positions(key):
+            self.bits[pos >> 3] |= 1 << (pos & 7)
+
+    def __contains__(self, key: bytes) -> bool:
+        return all(self.bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(key))
+
+    def save(self, path: str, count: int) -> None:
+        tmp = path + ".tmp"
+        with open(tmp, "wb") as f:
+            f.write(self.n_bits.to_bytes(8, "little"))
+            f.write(self.n_hashes.to_bytes(4, "little"))
+            f.write(count.to_bytes(8, "little"))
+            f.write(self.bits)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path: str, n_bits: int, n_hashes: int):
+        """Return (filter, count) or (None, -1) if missing or built with other parameters."""
+        if not os.path.exists(path):
+            return None, -1
+        with open(path, "rb") as f:
+            head = f.read(20)
+            if len(head) != 20:
+                return None, -1
+            if int.from_bytes(head[:8], "little") != n_bits or int.from_bytes(head[8:12], "little") != n_hashes:
+                return None, -1
+            bf = cls(n_bits, n_hashes)
+            data = f.read()
+            if len(data) != len(bf.bits):
+                return None, -1
+            bf.bits[:] = data
+        return bf, int.from_bytes(head[12:20], "little")
+
+
+class UidIndex:
+    """
+    On-disk set of 16-byte pair uids (SQLite, WITHOUT ROWID) with an optional Bloom filter in front.
+
+    Opening is O(1) in the dataset size once the index exists; the first open next to
+    an existing JSONL imports its `_uid`s once. Every commit records the JSONL's
+    inode and size; if the file is missing, truncated or replaced on the next open,
+    the index no longer describes it and is rebuilt from the file.
+    """
+
+    def __init__(self, jsonl_path: str, use_bloom: bool = USE_BLOOM_FILTER) -> None:
+        self.jsonl_path = jsonl_path
+        self.db_path = jsonl_path + ".uidx.sqlite"
+        self.bloom_path = self.db_path + ".bloom"
+        self.conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS uids (uid BLOB PRIMARY KEY) WITHOUT ROWID")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS meta (k TEXT PRIMARY KEY, v TEXT)")
+        rebuilt = False
+        if self._meta("initialized") is not None and self._meta("jsonl_stamp") != self._jsonl_stamp():
+            print(f"[Warn] {self.db_path} does not match {jsonl_path} (missing/truncated/replaced); rebuilding")
+            self.conn.execute("DELETE FROM uids")
+            self.conn.execute("DELETE FROM meta")
+        if self._meta("initialized") is None:
+            self._import_jsonl(jsonl_path)
+            rebuilt = True
+        self.count = int(self._meta("count") or 0)
+        self.bloom = None
+        if use_bloom:
+            bf, saved = BloomFilter.load(self.bloom_path, BLOOM_BITS, BLOOM_HASHES)
+            if bf is None or rebuilt or saved != self.count:
+                # Missing or stale after an unclean exit: rebuild from the index.
+                bf = BloomFilter(BLOOM_BITS, BLOOM_HASHES)
+                for (uid,) in self.conn.execute("SELECT uid FROM uids"):
+                    bf.add(uid)
+            self.bloom = bf
+
+    def _meta(self, k: str):
+        row = self.conn.execute("SELECT v FROM meta WHERE k = ?", (k,)).fetchone()
+        return row[0] if row else None
+
+    def _set_meta(self, k: str, v) -> None:
+        self.conn.execute("INSERT OR REPLACE INTO meta (k, v) VALUES (?, ?)", (k, str(v)))
+
+    def _jsonl_stamp(self) -> str:
+        try:
+            st = os.stat(self.jsonl_path)
+        except FileNotFoundError:
+            return "missing"
+        return f"{st.st_ino}:{st.st_size}"
+
+    def _import_jsonl(self, jsonl_path: str) -> None:
+        batch = []
+        for uid in iter_existing_uids(jsonl_path):
+            try:
+                batch.append((bytes.fromhex(uid),))
+            except ValueError:
+                continue
+            if len(batch) >= 50000:
+                self.conn.executemany("INSERT OR IGNORE INTO uids (uid) VALUES (?)", batch)
+                batch = []
+        if batch:
+            self.conn.executemany("INSERT OR IGNORE INTO uids (uid) VALUES (?)", batch)
+        count = self.conn.execute("SELECT COUNT(*) FROM uids").fetchone()[0]
+        self._set_meta("count", count)
+        self._set_meta("jsonl_stamp", self._jsonl_stamp())
+        self._set_meta("initialized", 1)
+        self.conn.commit()
+
+    def __contains__(self, uid: str) -> bool:
+        key = bytes.fromhex(uid)
+        if self.bloom is not None and key not in self.bloom:
+            return False
+        return self.conn.execute("SELECT 1 FROM uids WHERE uid = ?", (key,)).fetchone() is not None
+
+    def add(self, uid: str) -> None:
+        key = bytes.fromhex(uid)
+        cur = self.conn.execute("INSERT OR IGNORE INTO uids (uid) VALUES (?)", (key,))
+        if cur.rowcount:
+            self.count += 1
+            if self.bloom is not None:
+                self.bloom.add(key)
+
+    def commit(self) -> None:
+        """Call after the writer flushed, so the recorded size covers every added uid."""
+        self._set_meta("count", self.count)
+        self._set_meta("jsonl_stamp", self._jsonl_stamp())
+        self.conn.commit()
+
+    def close(self) -> None:
+        self.commit()
+        if self.bloom is not None:
+            self.bloom.save(self.bloom_path, self.count)
+        self.conn.close()
 
 
-def process_file(path_in: str) -> list:
+def process_file(path_in: str, memo: ParagraphMemo = None) -> list:
     with open(path_in, "r", encoding="utf-8") as f:
         data = json.load(f)
 
@@ -109,53 +298,90 @@ def process_file(path_in: str) -> list:
 
     out_items = []
     for inst in inst_list:
-        paragraph = call_api(inst)
+        paragraph = memo.get(inst) if memo is not None else call_api(inst)
+        prefix = uid_prefix(inst)
         for pair in (data.get("dpo_pairs") or {}).get("code") or []:
             chosen = pair.get("chosen") or ""
             rejected = pair.get("rejected") or ""
-            uid = uid_for_pair(inst, chosen, rejected)
-            out_items.append({
-                "_uid": uid,
-                "conversations": [{"from": "human", "value": inst}],
-                "chosen": {"from": "gpt", "value": assemble_response(paragraph, chosen)},
-                "rejected": {"from": "gpt", "value": assemble_response(paragraph, rejected)},
-            })
+            uid = uid_for_pair(inst, chosen, rejected, prefix)
+            out_items.append((uid, inst, paragraph, chosen, rejected))
     return out_items
 
 
-def main() -> None:
+class FlatWriter:
+    def __init__(self, path: str) -> None:
+        self.f = open(path, "a", encoding="utf-8")
+
+    def write(self, uid: str, inst: str, paragraph: str, chosen: str, rejected: str) -> None:
+        rec = compact.to_flat_record(uid, inst, paragraph, chosen, rejected)
+        self.f.write(json.dumps(rec, ensure_ascii=False) + "\n")
+
+    def flush(self) -> None:
+        self.f.flush()
+
+    def close(self) -> None:
+        self.f.close()
+
+
+def compact_dir_for(output_jsonl: str) -> str:
+    return os.path.splitext(output_jsonl)[0] + ".compact"
+
+
+def run(input_folder: str, output_jsonl: str, output_format: str = OUTPUT_FORMAT) -> None:
+    os.makedirs(os.path.dirname(output_jsonl) or ".", exist_ok=True)
     files = []
-    for dp, _, fns in os.walk(INPUT_FOLDER):
+    for dp, _, fns in os.walk(input_folder):
         for fn in fns:
             if fn.lower().endswith(".json"):
                 files.append(os.path.join(dp, fn))
     files.sort()
     if not files:
-        print(f"[Error] no files in {INPUT_FOLDER}")
+        print(f"[Error] no files in {input_folder}")
         return
 
-    existing_uids = load_existing_uids(OUTPUT_JSONL)
+    if output_format == "compact":
+        target = compact_dir_for(output_jsonl)
+        writer = compact.CompactWriter(target)
+        existing_uids = UidIndex(writer.pairs_path)
+    elif output_format == "flat":
+        target = output_jsonl
+        writer = FlatWriter(output_jsonl)
+        existing_uids = UidIndex(output_jsonl)
+    else:
+        raise ValueError(f"unknown output format: {output_format}")
+    memo = ParagraphMemo()
     lock = threading.Lock()
     written = 0
 
-    with open(OUTPUT_JSONL, "a", encoding="utf-8") as out_f:
-        with ThreadPoolExecutor(max_workers=MAX_WORKERS) as ex:
-            futures = [ex.submit(process_file, p) for p in files]
-            for f in as_completed(futures):
-                items = f.result()
-                if not items:
-                    continue
-                with lock:
-                    for item in items:
-                        uid = item.get("_uid")
-                        if uid and uid in existing_uids:
-                            continue
-                        out_f.write(json.dumps(item, ensure_ascii=False) + "\n")
-                        if uid:
-                            existing_uids.add(uid)
-                        written += 1
-
-    print(f"[Done] appended={written} -> {OUTPUT_JSONL}")
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as ex:
+        futures = [ex.submit(process_file, p, memo) for p in files]
+        for f in as_completed(futures):
+            items = f.result()
+            if not items:
+                continue
+            with lock:
+                for uid, inst, paragraph, chosen, rejected in items:
+                    if uid in existing_uids:
+                        continue
+                    writer.write(uid, inst, paragraph, chosen, rejected)
+                    existing_uids.add(uid)
+                    written += 1
+                writer.flush()
+                existing_uids.commit()
+    writer.close()
+    existing_uids.close()
+
+    print(f"[Memo] instructions={memo.lookups} api_calls={memo.calls} saved={memo.saved}")
+    print(f"[Done] appended={written} -> {target}")
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--in-dir", default=INPUT_FOLDER)
+    ap.add_argument("--out-jsonl", default=OUTPUT_JSONL)
+    ap.add_argument("--format", choices=["flat", "compact"], default=OUTPUT_FORMAT)
+    args = ap.parse_args()
+    run(args.in_dir, args.out_jsonl, args.format)
 
 
 if __name__ == "__main__":
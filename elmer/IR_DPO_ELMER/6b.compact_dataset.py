@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Compact (normalized) storage for the final Elmer DPO dataset.
+
+Instead of repeating the COT paragraph and the full .sif in every chosen/rejected
+response, a compact dataset directory holds:
+  paragraphs.jsonl  {"id", "text"}              one row per distinct paragraph
+  codes.jsonl       {"id", "code"}              one row per distinct chosen code
+  pairs.jsonl       {"_uid", "instruction", "paragraph", "chosen", "rejected_diff"}
+where rejected_diff is a line diff against the chosen code.
+
+`expand` rebuilds the flat conversations/chosen/rejected JSONL written by
+6.finla_alpaca.py.
+
+Usage:
+  python 6b.compact_dataset.py expand --in-dir outputs/cot_aug_elmer_dpo_full_v8/dpo.compact --out dpo_flat.jsonl
+"""
+
+import os
+import json
+import difflib
+import hashlib
+import argparse
+from typing import Any, Dict, Iterator, List
+
+PARAGRAPHS = "paragraphs.jsonl"
+CODES = "codes.jsonl"
+PAIRS = "pairs.jsonl"
+
+
+def assemble_response(text: str, code: str) -> str:
+    parts = []
+    if text:
+        parts.append(text)
+        parts.append("")
+    if code:
+        parts.append("#### 完整代码\n")
+        parts.append("```plaintext\n" + code.strip() + "\n```")
+    return "\n".join(parts).rstrip()
+
+
+def to_flat_record(uid: str, inst: str, paragraph: str, chosen: str, rejected: str) -> Dict[str, Any]:
+    return {
+        "_uid": uid,
+        "conversations": [{"from": "human", "value": inst}],
+        "chosen": {"from": "gpt", "value": assemble_response(paragraph, chosen)},
+        "rejected": {"from": "gpt", "value": assemble_response(paragraph, rejected)},
+    }
+
+
+def text_id(text: str) -> str:
+    return hashlib.sha1((text or "").encode("utf-8", "ignore")).hexdigest()[:16]
+
+
+def diff_code(chosen: str, rejected: str) -> List[list]:
+    """Line ops [i1, i2, replacement] that turn chosen into rejected."""
+    a = chosen.splitlines(keepends=True)
+    b = rejected.splitlines(keepends=True)
+    ops = []
+    for tag, i1, i2, j1, j2 in difflib.SequenceMatcher(None, a, b, autojunk=False).get_opcodes():
+        if tag != "equal":
+            ops.append([i1, i2, "".join(b[j1:j2])])
+    return ops
+
+
+def patch_code(chosen: str, ops: List[list]) -> str:
+    a = chosen.splitlines(keepends=True)
+    out = []
+    pos = 0
+    for i1, i2, repl in ops:
+        out.extend(a[pos:i1])
+        out.append(repl)
+        pos = i2
+    out.extend(a[pos:])
+    return "".join(out)
+
+
+def _iter_jsonl(path: str) -> Iterator[Dict[str, Any]]:
+    if not os.path.exists(path):
+        return
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                yield json.loads(line)
+
+
+class CompactWriter:
+    """Append-only writer for a compact dataset directory. Not thread-safe; callers hold a lock."""
+
+    def __init__(self, out_dir: str) -> None:
+        os.makedirs(out_dir, exist_ok=True)
+        self.out_dir = out_dir
+        self.pairs_path = os.path.join(out_dir, PAIRS)
+        # Only the (small) shared tables are scanned; pairs are never re-read.
+        self.paragraph_ids = {r["id"] for r in _iter_jsonl(os.path.join(out_dir, PARAGRAPHS))}
+        self.code_ids = {r["id"] for r in _iter_jsonl(os.path.join(out_dir, CODES))}
+        self.f_par = open(os.path.join(out_dir, PARAGRAPHS), "a", encoding="utf-8")
+        self.f_code = open(os.path.join(out_dir, CODES), "a", encoding="utf-8")
+        self.f_pairs = open(self.pairs_path, "a", encoding="utf-8")
+
+    def write(self, uid: str, inst: str, paragraph: str, chosen: str, rejected: str) -> None:
+        pid = text_id(paragraph)
+        if pid not in self.paragraph_ids:
+            self.f_par.write(json.dumps({"id": pid, "text": paragraph}, ensure_ascii=False) + "\n")
+            self.paragraph_ids.add(pid)
+        cid = text_id(chosen)
+        if cid not in self.code_ids:
+            self.f_code.write(json.dumps({"id": cid, "code": chosen}, ensure_ascii=False) + "\n")
+            self.code_ids.add(cid)
+        row = {
+            "_uid": uid,
+            "instruction": inst,
+            "paragraph": pid,
+            "chosen": cid,
+            "rejected_diff": diff_code(chosen, rejected),
+        }
+        self.f_pairs.write(json.dumps(row, ensure_ascii=False) + "\n")
+
+    def flush(self) -> None:
+        # Tables first so a flushed pair never points at a missing row.
+        self.f_par.flush()
+        self.f_code.flush()
+        self.f_pairs.flush()
+
+    def close(self) -> None:
+        self.flush()
+        for f in (self.f_par, self.f_code, self.f_pairs):
+            f.close()
+
+
+def iter_expanded(in_dir: str) -> Iterator[Dict[str, Any]]:
+    paragraphs = {r["id"]: r["text"] for r in _iter_jsonl(os.path.join(in_dir, PARAGRAPHS))}
+    codes = {r["id"]: r["code"] for r in _iter_jsonl(os.path.join(in_dir, CODES))}
+    for row in _iter_jsonl(os.path.join(in_dir, PAIRS)):
+        chosen = codes[row["chosen"]]
+        rejected = patch_code(chosen, row["rejected_diff"])
+        yield to_flat_record(row["_uid"], row["instruction"], paragraphs[row["paragraph"]], chosen, rejected)
+
+
+def expand(in_dir: str, out_path: str) -> int:
+    n = 0
+    with open(out_path, "w", encoding="utf-8") as f:
+        for rec in iter_expanded(in_dir):
+            f.write(json.dumps(rec, ensure_ascii=False) + "\n")
+            n += 1
+    return n
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    ex = sub.add_parser("expand", help="rebuild the flat conversations/chosen/rejected JSONL")
+    ex.add_argument("--in-dir", required=True)
+    ex.add_argument("--out", required=True)
+    args = ap.parse_args()
+
+    if args.cmd == "expand":
+        n = expand(args.in_dir, args.out)
+        print(f"[Done] expanded={n} -> {args.out}")
+
+
+if __name__ == "__main__":
+    main()
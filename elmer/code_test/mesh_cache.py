@@ -0,0 +1,314 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Content-addressed ElmerGrid mesh cache for the code-eval runner (run_sif_eval.py).
+
+elmerfem test cases generate their meshes at test time, e.g. in runtest.cmake:
+  execute_process(COMMAND ${ELMERGRID_BIN} 1 2 angle -nooverwrite)
+Each such command is keyed by sha1(ElmerGrid args + relative name and content of
+the grid input files), built once in a staging dir and stored as
+<root>/objects/<key>/<mesh dirs>. Sample scratch dirs get the mesh files
+hardlinked (symlinked across filesystems) into fresh directories, so solver
+output written next to the mesh never reaches the cache. Cached mesh files are
+made read-only on publish, so a solver rewriting e.g. mesh.nodes in place fails
+instead of corrupting the shared entry; as root (permission bits do not apply)
+the files are copied instead of linked.
+
+Entries carry meta.json; its mtime is the LRU clock (touched on every use), and
+evict() removes least recently used entries until the cache fits the size budget.
+
+Usage:
+  python elmer/code_test/mesh_cache.py --root ~/.cache/elmer_mesh --stats
+  python elmer/code_test/mesh_cache.py --root ~/.cache/elmer_mesh --evict --max-gb 5
+  python elmer/code_test/mesh_cache.py --root ~/.cache/elmer_mesh --build /path/to/elmerfem/fem/tests/*/
+"""
+
+import os
+import re
+import json
+import time
+import shutil
+import hashlib
+import argparse
+import tempfile
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+
+CONFIG = {
+    "ROOT": os.path.join(os.path.expanduser("~"), ".cache", "tcadgpt", "elmer_mesh"),
+    "ELMERGRID": os.environ.get("ELMER_GRID", "ElmerGrid"),
+    "MAX_BYTES": 20 * 1024 ** 3,
+    "BUILD_TIMEOUT_S": 900,
+    "WORKERS": max(1, (os.cpu_count() or 2) // 2),
+}
+
+CMAKE_FILES = ("runtest.cmake", "CMakeLists.txt")
+ELMERGRID_RE = re.compile(r"\$\{ELMERGRID_BIN\}\s+([^)]*)\)")
+CMAKE_KEYWORDS = {"OUTPUT_QUIET", "ERROR_QUIET", "OUTPUT_VARIABLE", "ERROR_VARIABLE", "WORKING_DIRECTORY",
+                  "RESULT_VARIABLE"}
+
+
+# ---------------- plan ----------------
+
+def elmergrid_commands(case_dir: str) -> List[List[str]]:
+    """ElmerGrid argument lists from the case's runtest.cmake / CMakeLists.txt, in order."""
+    cmds: List[List[str]] = []
+    for name in CMAKE_FILES:
+        path = os.path.join(case_dir, name)
+        if not os.path.exists(path):
+            continue
+        with open(path, "r", encoding="utf-8", errors="replace") as f:
+            text = re.sub(r"#[^\n]*", "", f.read())
+        for m in ELMERGRID_RE.finditer(text):
+            args = []
+            for tok in re.findall(r'"([^"]*)"|(\S+)', m.group(1)):
+                tok = tok[0] or tok[1]
+                if tok in CMAKE_KEYWORDS:
+                    break
+                tok = re.sub(r"\$\{CMAKE_CURRENT_(SOURCE|BINARY)_DIR\}/?", "", tok)
+                if tok and "${" not in tok:
+                    args.append(tok)
+            if len(args) >= 3 and args not in cmds:
+                cmds.append(args)
+        if cmds:
+            break
+    return cmds
+
+
+def grid_inputs(case_dir: str, args: List[str]) -> List[str]:
+    """Relative paths of the files ElmerGrid reads: args[2] itself, <args[2]>.*, or a directory's files."""
+    base = args[2]
+    path = os.path.join(case_dir, base)
+    out = []
+    if os.path.isdir(path):
+        for dp, _, files in os.walk(path):
+            out += [os.path.relpath(os.path.join(dp, fn), case_dir) for fn in files]
+    elif os.path.isfile(path):
+        out.append(base)
+    else:
+        d, stem = os.path.split(path)
+        if os.path.isdir(d or "."):
+            out += [os.path.relpath(os.path.join(d, fn), case_dir) for fn in os.listdir(d or ".")
+                    if fn.startswith(stem + ".") and os.path.isfile(os.path.join(d, fn))]
+    return sorted(out)
+
+
+def cache_key(case_dir: str, args: List[str], inputs: List[str]) -> str:
+    h = hashlib.sha1()
+    h.update(("\x00".join(args)).encode("utf-8") + b"\x01")
+    for rel in inputs:
+        h.update(rel.encode("utf-8") + b"\x00")
+        with open(os.path.join(case_dir, rel), "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                h.update(chunk)
+        h.update(b"\x01")
+    return h.hexdigest()
+
+
+# ---------------- cache ----------------
+
+def _dir_bytes(path: str) -> int:
+    total = 0
+    for dp, _, files in os.walk(path):
+        for fn in files:
+            try:
+                total += os.lstat(os.path.join(dp, fn)).st_size
+            except OSError:
+                pass
+    return total
+
+
+def _make_read_only(root: str) -> None:
+    for dp, _, files in os.walk(root):
+        for fn in files:
+            path = os.path.join(dp, fn)
+            os.chmod(path, os.stat(path).st_mode & ~0o222)
+
+
+def _mesh_dirs(root: str) -> List[str]:
+    return sorted(os.path.relpath(dp, root) for dp, _, files in os.walk(root) if "mesh.header" in files)
+
+
+class MeshCache:
+    def __init__(self, root: str = CONFIG["ROOT"], elmergrid: str = CONFIG["ELMERGRID"],
+                 max_bytes: int = CONFIG["MAX_BYTES"], timeout_s: float = CONFIG["BUILD_TIMEOUT_S"]) -> None:
+        self.root = root
+        self.elmergrid = elmergrid
+        self.max_bytes = max_bytes
+        self.timeout_s = timeout_s
+        # root ignores the read-only bits, so a hardlink would not protect the cache entry
+        self.copy_files = hasattr(os, "geteuid") and os.geteuid() == 0
+        os.makedirs(os.path.join(root, "objects"), exist_ok=True)
+        os.makedirs(os.path.join(root, "tmp"), exist_ok=True)
+
+    def obj_dir(self, key: str) -> str:
+        return os.path.join(self.root, "objects", key)
+
+    def has(self, key: str) -> bool:
+        return os.path.exists(os.path.join(self.obj_dir(key), "meta.json"))
+
+    def plan(self, case_dir: str) -> List[Tuple[str, List[str], List[str]]]:
+        """(key, args, inputs) for every ElmerGrid command of the case."""
+        out = []
+        for args in elmergrid_commands(case_dir):
+            inputs = grid_inputs(case_dir, args)
+            out.append((cache_key(case_dir, args, inputs), args, inputs))
+        return out
+
+    def build(self, case_dir: str, key: str, args: List[str], inputs: List[str]) -> Dict[str, Any]:
+        """Run ElmerGrid in a staging dir and publish the produced mesh dirs under objects/<key>."""
+        if self.has(key):
+            return {"key": key, "built": False, "error": None}
+        stage = tempfile.mkdtemp(prefix=f"{key[:12]}.", dir=os.path.join(self.root, "tmp"))
+        try:
+            work = os.path.join(stage, "work")
+            os.makedirs(work)
+            for rel in inputs:
+                dst = os.path.join(work, rel)
+                os.makedirs(os.path.dirname(dst), exist_ok=True)
+                shutil.copy2(os.path.join(case_dir, rel), dst)
+            before = set(_mesh_dirs(work))
+            start = time.perf_counter()
+            r = subprocess.run([self.elmergrid] + args, cwd=work, capture_output=True, text=True,
+                               timeout=self.timeout_s)
+            produced = [d for d in _mesh_dirs(work) if d not in before]
+            if r.returncode != 0 or not produced:
+                tail = (r.stdout + r.stderr)[-2000:]
+                return {"key": key, "built": False, "error": f"ElmerGrid rc={r.returncode}, meshes={produced}\n{tail}"}
+            obj = os.path.join(stage, "obj")
+            os.makedirs(obj)
+            for d in produced:
+                if d == ".":
+                    raise RuntimeError("ElmerGrid wrote the mesh into the working dir itself")
+                shutil.move(os.path.join(work, d), os.path.join(obj, d))
+            _make_read_only(obj)  # shared by every later case: hardlinks must not be writable
+            meta = {"key": key, "args": args, "inputs": inputs, "meshes": produced, "case_dir": case_dir,
+                    "bytes": _dir_bytes(obj), "build_seconds": round(time.perf_counter() - start, 3)}
+            with open(os.path.join(obj, "meta.json"), "w", encoding="utf-8") as f:
+                json.dump(meta, f, ensure_ascii=False, indent=2)
+            try:
+                os.rename(obj, self.obj_dir(key))  # atomic publish; a concurrent builder may have won
+            except OSError:
+                if not self.has(key):
+                    raise
+            return {"key": key, "built": True, "error": None}
+        except Exception as e:
+            return {"key": key, "built": False, "error": f"{type(e).__name__}: {e}"}
+        finally:
+            shutil.rmtree(stage, ignore_errors=True)
+
+    def build_many(self, cases: List[str], workers: int = CONFIG["WORKERS"]) -> Dict[str, Dict[str, Any]]:
+        """Plan every case and build the missing keys in parallel. Returns case_dir -> {keys, errors}."""
+        plans = {c: self.plan(c) for c in cases}
+        todo: Dict[str, Tuple[str, List[str], List[str]]] = {}
+        for c, plan in plans.items():
+            for key, args, inputs in plan:
+                if not self.has(key) and key not in todo:
+                    todo[key] = (c, args, inputs)
+        with ThreadPoolExecutor(max_workers=workers) as ex:
+            results = {k: r for k, r in zip(todo, ex.map(lambda kv: self.build(kv[1][0], kv[0], kv[1][1], kv[1][2]),
+                                                      todo.items()))}
+        out = {}
+        for c, plan in plans.items():
+            errors = [results[k]["error"] for k, _, _ in plan if k in results and results[k]["error"]]
+            out[c] = {"keys": [k for k, _, _ in plan], "errors": errors}
+        built = sum(1 for r in results.values() if r["built"])
+        print(f"[OK] mesh cache: {len(cases)} cases, {sum(len(p) for p in plans.values())} ElmerGrid commands, "
+              f"{built} built, {len(todo) - built} failed, rest cached")
+        return out
+
+    def link_into(self, key: str, dst_root: str) -> List[str]:
+        """Materialize the cached mesh dirs of key under dst_root; returns their relative names."""
+        obj = self.obj_dir(key)
+        with open(os.path.join(obj, "meta.json"), "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        os.utime(os.path.join(obj, "meta.json"))  # LRU touch
+        for d in meta["meshes"]:
+            src_dir, dst_dir = os.path.join(obj, d), os.path.join(dst_root, d)
+            if os.path.lexists(dst_dir):
+                shutil.rmtree(dst_dir, ignore_errors=True)
+            for dp, _, files in os.walk(src_dir):
+                out_dp = os.path.join(dst_dir, os.path.relpath(dp, src_dir))
+                os.makedirs(out_dp, exist_ok=True)
+                for fn in files:
+                    src, dst = os.path.join(dp, fn), os.path.join(out_dp, fn)
+                    if self.copy_files:
+                        shutil.copyfile(src, dst)
+                        continue
+                    mode = os.stat(src).st_mode
+                    if mode & 0o222:  # entry published before files were made read-only
+                        os.chmod(src, mode & ~0o222)
+                    try:
+                        os.link(src, dst)
+                    except OSError:
+                        os.symlink(os.path.abspath(src), dst)
+        return list(meta["meshes"])
+
+    def entries(self) -> List[Dict[str, Any]]:
+        out = []
+        objects = os.path.join(self.root, "objects")
+        for key in os.listdir(objects):
+            meta_path = os.path.join(objects, key, "meta.json")
+            try:
+                with open(meta_path, "r", encoding="utf-8") as f:
+                    meta = json.load(f)
+                meta["last_used"] = os.path.getmtime(meta_path)
+            except (OSError, ValueError):
+                continue
+            out.append(meta)
+        return out
+
+    def evict(self, max_bytes: Optional[int] = None, protect: Optional[set] = None) -> Tuple[int, int]:
+        """Drop least recently used entries (except `protect`) until total size <= max_bytes."""
+        limit = self.max_bytes if max_bytes is None else max_bytes
+        entries = sorted(self.entries(), key=lambda m: m["last_used"])
+        total = sum(m["bytes"] for m in entries)
+        removed = freed = 0
+        for m in entries:
+            if total <= limit:
+                break
+            if protect and m["key"] in protect:
+                continue
+            # rename first so a concurrent link_into never sees a half-deleted entry
+            trash = os.path.join(self.root, "tmp", f"evict.{m['key']}.{os.getpid()}")
+            try:
+                os.rename(self.obj_dir(m["key"]), trash)
+            except OSError:
+                continue
+            shutil.rmtree(trash, ignore_errors=True)
+            total -= m["bytes"]
+            freed += m["bytes"]
+            removed += 1
+        return removed, freed
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--root", default=CONFIG["ROOT"])
+    ap.add_argument("--elmergrid", default=CONFIG["ELMERGRID"])
+    ap.add_argument("--max-gb", type=float, default=CONFIG["MAX_BYTES"] / 1024 ** 3)
+    ap.add_argument("--workers", type=int, default=CONFIG["WORKERS"])
+    ap.add_argument("--build", nargs="*", default=None, help="case dirs to pre-build")
+    ap.add_argument("--evict", action="store_true")
+    ap.add_argument("--stats", action="store_true")
+    args = ap.parse_args()
+
+    cache = MeshCache(args.root, args.elmergrid, int(args.max_gb * 1024 ** 3))
+    if args.build:
+        for case, res in cache.build_many(args.build, args.workers).items():
+            for err in res["errors"]:
+                print(f"[Error] {case}: {err.splitlines()[0] if err else ''}")
+    if args.evict:
+        removed, freed = cache.evict()
+        print(f"[OK] evicted {removed} entries, freed {freed / 1024 ** 2:.1f} MB")
+    if args.stats or not (args.build or args.evict):
+        entries = cache.entries()
+        total = sum(m["bytes"] for m in entries)
+        print(f"[OK] {args.root}: {len(entries)} entries, {total / 1024 ** 2:.1f} MB "
+              f"(budget {cache.max_bytes / 1024 ** 2:.0f} MB)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,437 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Sandboxed parallel ElmerSolver runner for generated .sif samples.
+
+For every sample in the *_pass1.jsonl files (id, model, k, samples, code,
+source_path, source_rel, mesh_name) this:
+  1. copies the sample's case directory (case_dir from elmer_eval_20_v2.json,
+     else dirname(source_rel) under --elmerfem) into a scratch dir
+     (cp --reflink=auto, i.e. copy-on-write where the filesystem supports it);
+  2. links the case's ElmerGrid-built meshes in from the mesh cache
+     (mesh_cache.py: built once per grid input + args, in parallel across cases),
+     writes the generated .sif under the original file name and rewrites the
+     Header `Mesh DB` to a mesh directory that exists in the scratch copy;
+  3. runs the solver binary with a per-job timeout and address-space limit,
+     at most --workers jobs at a time;
+  4. records exit code, TEST.PASSED and timing, and reports run@k / pass@k
+     per model (unbiased estimator over the k samples of each case).
+
+With --static-check, samples that fail the static .sif pre-screen
+(IR_DPO_ELMER/1.6.sif_static_check.py: unbalanced End, unknown sections,
+dangling Solver/Equation/Material references, ...) are recorded as
+`static_fail` with their error codes and never reach the solver.
+
+run  = solver exited with code 0 within the timeout
+pass = run and TEST.PASSED contains 1 (the elmerfem test-suite marker)
+
+The solver is any executable called as `<solver> <case.sif>` in the scratch
+dir, so the harness can be exercised with a stub, e.g.
+  printf '#!/bin/sh\\necho 1 > TEST.PASSED\\nexit 0\\n' > /tmp/stub && chmod +x /tmp/stub
+
+Usage:
+  python elmer/code_test/run_sif_eval.py --elmerfem /path/to/elmerfem \
+      --pass1 elmer/code_test/elmer_eval_set_20_v2/*_pass1.jsonl --out sif_runs.jsonl --workers 8
+  python elmer/code_test/run_sif_eval.py --solver /tmp/stub --elmerfem /path/to/elmerfem ...
+"""
+
+import os
+import re
+import sys
+import json
+import glob
+import time
+import shutil
+import signal
+import argparse
+import tempfile
+import subprocess
+import importlib.util
+from math import comb
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Any, Dict, List, Optional, Tuple
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def load_module(name: str, path: str):
+    spec = importlib.util.spec_from_file_location(name, path)
+    mod = importlib.util.module_from_spec(spec)
+    assert spec and spec.loader, f"Cannot load module: {path}"
+    spec.loader.exec_module(mod)  # type: ignore
+    return mod
+
+
+mesh_cache = load_module("mesh_cache", os.path.join(HERE, "mesh_cache.py"))
+STATIC_CHECK_PATH = os.path.join(HERE, "..", "IR_DPO_ELMER", "1.6.sif_static_check.py")
+
+CONFIG = {
+    "SOLVER": os.environ.get("ELMER_SOLVER", "ElmerSolver"),
+    "EVAL_SET": os.path.join(HERE, "elmer_eval_set_20_v2", "elmer_eval_20_v2.json"),
+    "PASS1_GLOB": os.path.join(HERE, "elmer_eval_set_20_v2", "*_pass1.jsonl"),
+    "WORKERS": max(1, (os.cpu_count() or 2) // 2),
+    "TIMEOUT_S": 600,
+    "MEM_LIMIT_MB": 4096,
+    "LOG_TAIL_LINES": 40,
+    "K_LIST": [1],
+}
+
+MESH_DB_RE = re.compile(r'^\s*Mesh\s+DB\s+(.*)$', re.IGNORECASE)
+FENCE_RE = re.compile(r"```[a-zA-Z]*\n(.*?)```", re.S)
+
+
+# ---------------- samples ----------------
+
+def load_case_dirs(eval_set_path: str) -> Dict[str, str]:
+    if not eval_set_path or not os.path.exists(eval_set_path):
+        return {}
+    with open(eval_set_path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    return {d["id"]: d["case_dir"] for d in data if d.get("case_dir")}
+
+
+def load_samples(paths: List[str]) -> List[Dict[str, Any]]:
+    rows = []
+    for path in paths:
+        with open(path, "r", encoding="utf-8") as f:
+            rows.extend(json.loads(line) for line in f if line.strip())
+    return rows
+
+
+def clean_sif(text: str) -> str:
+    """Drop Markdown around the generated .sif (fenced block wins if present)."""
+    m = FENCE_RE.search(text or "")
+    return (m.group(1) if m else text or "").strip() + "\n"
+
+
+def sample_codes(row: Dict[str, Any]) -> List[str]:
+    samples = list(row.get("samples") or [])
+    if row.get("code"):
+        samples = [row["code"]] + samples[1:]  # `code` is the cleaned first sample
+    return [clean_sif(s) for s in samples]
+
+
+def resolve_case_dir(row: Dict[str, Any], case_dirs: Dict[str, str], elmerfem: Optional[str],
+                     base: str) -> Optional[str]:
+    cands = []
+    if elmerfem:
+        cands.append(os.path.join(elmerfem, os.path.dirname(row.get("source_rel", ""))))
+    if row.get("id") in case_dirs:
+        cands.append(os.path.join(base, case_dirs[row["id"]]))
+    if row.get("source_path"):
+        cands.append(os.path.join(base, os.path.dirname(row["source_path"])))
+    for c in cands:
+        if os.path.isdir(c):
+            return c
+    return None
+
+
+# ---------------- scratch + mesh ----------------
+
+def copy_case(src: str, dst: str) -> None:
+    """Copy-on-write copy where supported (reflink), plain copy otherwise."""
+    # A reused --scratch-root may still hold a kept (failed) job: cp would nest into dst/<basename>/
+    shutil.rmtree(dst, ignore_errors=True)
+    os.makedirs(os.path.dirname(dst), exist_ok=True)
+    if sys.platform.startswith("linux") and shutil.which("cp"):
+        r = subprocess.run(["cp", "-a", "--reflink=auto", src, dst], capture_output=True)
+        if r.returncode == 0:
+            return
+        shutil.rmtree(dst, ignore_errors=True)
+    shutil.copytree(src, dst, symlinks=True)
+
+
+def find_meshes(root: str, max_depth: int = 3) -> List[str]:
+    """Mesh directories (containing mesh.header) relative to root; "." for the root itself."""
+    out = []
+    for dp, dirs, files in os.walk(root):
+        rel = os.path.relpath(dp, root)
+        depth = 0 if rel == "." else rel.count(os.sep) + 1
+        if depth >= max_depth:
+            dirs[:] = []
+        if "mesh.header" in files:
+            out.append(rel)
+    return sorted(out, key=lambda p: (p.count(os.sep), p))
+
+
+def _mesh_db_target(args: str) -> Optional[str]:
+    parts = re.findall(r'"([^"]*)"|(\S+)', args)
+    vals = [a or b for a, b in parts]
+    if not vals:
+        return None
+    return os.path.normpath(os.path.join(*vals[:2])) if len(vals) > 1 else os.path.normpath(vals[0])
+
+
+def referenced_mesh(sif_text: str) -> Optional[str]:
+    for line in sif_text.splitlines():
+        m = MESH_DB_RE.match(line)
+        if m:
+            return _mesh_db_target(m.group(1).split("!")[0])
+    return None
+
+
+def choose_mesh(scratch: str, mesh_name: str, generated: str, original: str) -> Optional[str]:
+    meshes = find_meshes(scratch)
+    if not meshes:
+        return None
+    for want in (mesh_name, referenced_mesh(generated), referenced_mesh(original)):
+        if not want:
+            continue
+        want = os.path.normpath(want)
+        for m in meshes:
+            if m == want or os.path.basename(m) == os.path.basename(want):
+                return m
+    return meshes[0]
+
+
+def rewrite_mesh_db(sif_text: str, mesh_rel: str) -> str:
+    """Point Header/Mesh DB at mesh_rel; adds a Header section if there is none."""
+    mesh_line = '  Mesh DB "." "."' if mesh_rel == "." else f'  Mesh DB "." "{mesh_rel}"'
+    lines = sif_text.splitlines()
+    out: List[str] = []
+    in_header = False
+    has_header = False
+    for line in lines:
+        stripped = line.split("!")[0].strip()
+        if not in_header and stripped.lower() == "header":
+            in_header = has_header = True
+            out.append(line)
+            out.append(mesh_line)
+            continue
+        if in_header and stripped.lower() == "end":
+            in_header = False
+        if MESH_DB_RE.match(line.split("!")[0]):
+            continue  # drop every live Mesh DB; the Header one was re-added above
+        out.append(line)
+    if not has_header:
+        out = ["Header", mesh_line, "End", ""] + out
+    return "\n".join(out) + "\n"
+
+
+# ---------------- run ----------------
+
+def limited_cmd(cmd: List[str], mem_mb: int) -> List[str]:
+    """Address-space cap applied by a wrapper process (preexec_fn is not safe from worker threads)."""
+    if mem_mb <= 0 or os.name != "posix":
+        return cmd
+    if shutil.which("prlimit"):
+        return ["prlimit", f"--as={mem_mb * 1024 * 1024}", "--"] + cmd
+    return ["sh", "-c", f'ulimit -v {mem_mb * 1024} && exec "$@"', "sh"] + cmd
+
+
+def _tail(path: str, n: int) -> str:
+    try:
+        with open(path, "r", encoding="utf-8", errors="replace") as f:
+            return "".join(f.readlines()[-n:])
+    except OSError:
+        return ""
+
+
+def read_test_passed(scratch: str) -> Optional[bool]:
+    path = os.path.join(scratch, "TEST.PASSED")
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8", errors="replace") as f:
+        return f.read().strip().startswith("1")
+
+
+def run_job(job: Dict[str, Any], solver: str, timeout_s: float, mem_mb: int, keep: str,
+            cache: Optional[Any] = None) -> Dict[str, Any]:
+    res = {k: job[k] for k in ("id", "model", "sample")}
+    res.update({"status": "error", "exit_code": None, "test_passed": None, "seconds": 0.0, "mesh": None,
+                "scratch": job["scratch"], "log_tail": ""})
+    scratch = job["scratch"]
+    try:
+        static = job.get("static")
+        if static is not None and not static["ok"]:
+            res["status"] = "static_fail"
+            res["static_errors"] = [e["code"] for e in static["errors"]]
+            res["log_tail"] = "\n".join(f"{e['code']} line={e['line']} {e['msg']}" for e in static["errors"])
+            return res
+        if not job["case_dir"]:
+            res["status"] = "case_missing"
+            return res
+        copy_case(job["case_dir"], scratch)
+        if cache is not None:
+            for key in job.get("mesh_keys", []):
+                if cache.has(key):
+                    cache.link_into(key, scratch)
+        sif_name = os.path.basename(job["source_rel"]) or "case.sif"
+        sif_path = os.path.join(scratch, sif_name)
+        original = ""
+        if os.path.exists(sif_path):
+            with open(sif_path, "r", encoding="utf-8", errors="replace") as f:
+                original = f.read()
+        for stale in ("TEST.PASSED", "TEST.FAILED"):
+            if os.path.exists(os.path.join(scratch, stale)):
+                os.remove(os.path.join(scratch, stale))
+
+        mesh = choose_mesh(scratch, job["mesh_name"], job["code"], original)
+        res["mesh"] = mesh
+        if mesh is None:
+            res["status"] = "mesh_build_failed" if job.get("mesh_errors") else "mesh_missing"
+            res["log_tail"] = "\n".join(job.get("mesh_errors", []))[-4000:]
+            return res
+        with open(sif_path, "w", encoding="utf-8") as f:
+            f.write(rewrite_mesh_db(job["code"], mesh))
+        with open(os.path.join(scratch, "ELMERSOLVER_STARTINFO"), "w", encoding="utf-8") as f:
+            f.write(sif_name + "\n")
+
+        log_path = os.path.join(scratch, "solver.log")
+        env = dict(os.environ, OMP_NUM_THREADS=os.environ.get("OMP_NUM_THREADS", "1"))
+        start = time.perf_counter()
+        with open(log_path, "wb") as log:
+            proc = subprocess.Popen(limited_cmd([solver, sif_name], mem_mb), cwd=scratch, stdout=log,
+                                    stderr=subprocess.STDOUT, stdin=subprocess.DEVNULL, env=env,
+                                    start_new_session=True)
+            try:
+                rc = proc.wait(timeout=timeout_s)
+                res["status"] = "ok" if rc == 0 else "failed"
+                res["exit_code"] = rc
+            except subprocess.TimeoutExpired:
+                os.killpg(proc.pid, signal.SIGKILL)
+                proc.wait()
+                res["status"] = "timeout"
+        res["seconds"] = round(time.perf_counter() - start, 3)
+        res["test_passed"] = read_test_passed(scratch)
+        res["log_tail"] = _tail(log_path, CONFIG["LOG_TAIL_LINES"])
+    except Exception as e:
+        res["status"] = "error"
+        res["log_tail"] = f"{type(e).__name__}: {e}"
+    finally:
+        passed = res["status"] == "ok" and res["test_passed"] is True
+        if keep == "none" or (keep == "failed" and passed):
+            shutil.rmtree(scratch, ignore_errors=True)
+            res["scratch"] = None
+    return res
+
+
+# ---------------- pass@k ----------------
+
+def pass_at_k(n: int, c: int, k: int) -> float:
+    if n - c < k:
+        return 1.0
+    return 1.0 - comb(n - c, k) / comb(n, k)
+
+
+def summarize(results: List[Dict[str, Any]], ks: List[int]) -> List[Dict[str, Any]]:
+    groups: Dict[Tuple[str, str], List[Dict[str, Any]]] = {}
+    for r in results:
+        groups.setdefault((r["model"], r["id"]), []).append(r)
+    models = sorted({m for m, _ in groups})
+    table = []
+    header = f"{'model':<16}{'cases':>7}{'samples':>9}" + "".join(f"{f'run@{k}':>9}{f'pass@{k}':>9}" for k in ks)
+    print(header + "  status counts")
+    for model in models:
+        cases = [rs for (m, _), rs in groups.items() if m == model]
+        row: Dict[str, Any] = {"model": model, "cases": len(cases), "samples": sum(len(rs) for rs in cases)}
+        for k in ks:
+            usable = [rs for rs in cases if len(rs) >= k]
+            run_k = [pass_at_k(len(rs), sum(r["status"] == "ok" for r in rs), k) for rs in usable]
+            pas_k = [pass_at_k(len(rs), sum(r["status"] == "ok" and r["test_passed"] is True for r in rs), k)
+                     for rs in usable]
+            row[f"run@{k}"] = sum(run_k) / len(run_k) if run_k else None
+            row[f"pass@{k}"] = sum(pas_k) / len(pas_k) if pas_k else None
+        status: Dict[str, int] = {}
+        for rs in cases:
+            for r in rs:
+                status[r["status"]] = status.get(r["status"], 0) + 1
+        row["status"] = status
+        table.append(row)
+        cells = "".join(
+            f"{(row[f'run@{k}'] if row[f'run@{k}'] is not None else float('nan')):>9.3f}"
+            f"{(row[f'pass@{k}'] if row[f'pass@{k}'] is not None else float('nan')):>9.3f}" for k in ks)
+        print(f"{model:<16}{row['cases']:>7}{row['samples']:>9}{cells}  {status}")
+    return table
+
+
+# ---------------- main ----------------
+
+def build_jobs(rows: List[Dict[str, Any]], case_dirs: Dict[str, str], elmerfem: Optional[str], base: str,
+               scratch_root: str) -> List[Dict[str, Any]]:
+    jobs = []
+    for row in rows:
+        case_dir = resolve_case_dir(row, case_dirs, elmerfem, base)
+        for j, code in enumerate(sample_codes(row)):
+            jobs.append({
+                "id": row["id"], "model": row.get("model", "unknown"), "sample": j, "code": code,
+                "case_dir": case_dir, "source_rel": row.get("source_rel", ""), "mesh_name": row.get("mesh_name", ""),
+                "scratch": os.path.join(scratch_root, row.get("model", "unknown"), f"{row['id']}__s{j}"),
+            })
+    return jobs
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--pass1", nargs="+", default=None, help=f"sample files (default: {CONFIG['PASS1_GLOB']})")
+    ap.add_argument("--eval-set", default=CONFIG["EVAL_SET"], help="eval set JSON with id -> case_dir")
+    ap.add_argument("--elmerfem", default=None, help="elmerfem checkout; case dir = <elmerfem>/dirname(source_rel)")
+    ap.add_argument("--base", default=".", help="base for case_dir / source_path when --elmerfem is not given")
+    ap.add_argument("--solver", default=CONFIG["SOLVER"], help="solver binary or stub (env ELMER_SOLVER)")
+    ap.add_argument("--workers", type=int, default=CONFIG["WORKERS"])
+    ap.add_argument("--timeout", type=float, default=CONFIG["TIMEOUT_S"])
+    ap.add_argument("--mem-mb", type=int, default=CONFIG["MEM_LIMIT_MB"], help="address-space limit, 0 = none")
+    ap.add_argument("--k", type=int, nargs="+", default=CONFIG["K_LIST"])
+    ap.add_argument("--scratch-root", default=None)
+    ap.add_argument("--keep", choices=["none", "failed", "all"], default="failed", help="which scratch dirs to keep")
+    ap.add_argument("--elmergrid", default=mesh_cache.CONFIG["ELMERGRID"], help="ElmerGrid binary (env ELMER_GRID)")
+    ap.add_argument("--mesh-cache", default=mesh_cache.CONFIG["ROOT"], help="mesh cache dir")
+    ap.add_argument("--mesh-cache-gb", type=float, default=mesh_cache.CONFIG["MAX_BYTES"] / 1024 ** 3)
+    ap.add_argument("--no-mesh-cache", action="store_true", help="only use meshes already present in the case dirs")
+    ap.add_argument("--static-check", action="store_true", help="skip samples failing the static .sif pre-screen")
+    ap.add_argument("--out", default="sif_runs.jsonl")
+    ap.add_argument("--summary-json", default=None)
+    args = ap.parse_args()
+
+    solver = shutil.which(args.solver) or (args.solver if os.path.exists(args.solver) else None)
+    if solver is None:
+        raise SystemExit(f"[Error] solver not found: {args.solver} (use --solver or ELMER_SOLVER)")
+    rows = load_samples(args.pass1 or sorted(glob.glob(CONFIG["PASS1_GLOB"])))
+    scratch_root = args.scratch_root or tempfile.mkdtemp(prefix="elmer_runs_")
+    jobs = build_jobs(rows, load_case_dirs(args.eval_set), args.elmerfem, args.base, scratch_root)
+    print(f"[OK] {len(rows)} cases, {len(jobs)} jobs, solver={solver}, workers={args.workers}, "
+          f"timeout={args.timeout}s, mem={args.mem_mb}MB, scratch={scratch_root}")
+
+    if args.static_check:
+        checker = load_module("sif_static_check", STATIC_CHECK_PATH)
+        for j in jobs:
+            j["static"] = checker.check_sif(j["code"])
+        n_bad = sum(not j["static"]["ok"] for j in jobs)
+        print(f"[OK] static check: {n_bad}/{len(jobs)} samples rejected before the solver")
+
+    cache = None
+    if not args.no_mesh_cache:
+        cache = mesh_cache.MeshCache(args.mesh_cache, args.elmergrid, int(args.mesh_cache_gb * 1024 ** 3))
+        runnable = [j for j in jobs if j.get("static") is None or j["static"]["ok"]]
+        plans = cache.build_many(sorted({j["case_dir"] for j in runnable if j["case_dir"]}), args.workers)
+        for j in jobs:
+            plan = plans.get(j["case_dir"], {"keys": [], "errors": []})
+            j["mesh_keys"], j["mesh_errors"] = plan["keys"], plan["errors"]
+        removed, freed = cache.evict(protect={k for p in plans.values() for k in p["keys"]})
+        if removed:
+            print(f"[OK] mesh cache evicted {removed} entries ({freed / 1024 ** 2:.1f} MB)")
+
+    results = []
+    with ThreadPoolExecutor(max_workers=args.workers) as ex:  # each worker thread drives one solver process
+        futures = [ex.submit(run_job, j, solver, args.timeout, args.mem_mb, args.keep, cache) for j in jobs]
+        for done, fut in enumerate(as_completed(futures), 1):
+            r = fut.result()
+            results.append(r)
+            print(f"[{done}/{len(jobs)}] {r['model']:<12} {r['id']} s{r['sample']} -> {r['status']}"
+                  f" rc={r['exit_code']} passed={r['test_passed']} {r['seconds']}s")
+
+    results.sort(key=lambda r: (r["model"], r["id"], r["sample"]))
+    with open(args.out, "w", encoding="utf-8") as f:
+        for r in results:
+            f.write(json.dumps(r, ensure_ascii=False) + "\n")
+    print(f"[Done] -> {args.out}")
+    table = summarize(results, args.k)
+    if args.summary_json:
+        with open(args.summary_json, "w", encoding="utf-8") as f:
+            json.dump(table, f, ensure_ascii=False, indent=2)
+        print(f"[Done] -> {args.summary_json}")
+
+
+if __name__ == "__main__":
+    main()
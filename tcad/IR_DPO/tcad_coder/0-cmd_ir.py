@@ -0,0 +1,834 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+TCAD .cmd 结构化 IR 提取（与 Elmer 侧 1.IR_batch.py 的 parse_to_lite_ir / render_sif 对应）。
+
+支持三种方言（按 SWB 文件名后缀判断，判断不出时看内容）：
+  sde       SDE Scheme（*_dvs.cmd）：S 表达式 -> 顶层 form、命令、(define ...) 变量
+  sdevice   sdevice 段落（*_des.cmd）：File/Electrode/Physics/Plot/Math/Solve 等花括号块
+  tcl       sprocess / inspect 等 Tcl 脚本（*_fps.cmd 等）：逐条命令、key=value 参数、控制结构嵌套
+IR 统一包含 commands（命令+参数）、sections（逻辑分段，可直接用于本地切块）、
+parameters、numbers，以及 SWB 预处理指令（#if/#endif ...）。
+
+render_cmd(ir) 从 IR 重新生成脚本；fidelity(src, rendered) 比较两者去掉注释后的 token 序列，
+exact=True 表示 IR 无损。批量模式用进程池遍历 Applications_Library，每个文件输出一个 JSON。
+
+用法：
+  python 0-cmd_ir.py --in-dir /data/sources/Applications_Library --out-dir /data/processed_json/v13/cmd_ir
+  python 0-cmd_ir.py --check tcad/code_test/1.cmd      # 打印 IR 摘要、渲染结果与保真度
+  python 0-cmd_ir.py --check-samples                   # tcad/code_test 全部样例的往返保真度，有损则退出码 1
+
+tcad/code_test/*.cmd 全是 SDE；sdevice / sprocess 的用例在 tcad/code_test/ir_samples/。
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import argparse
+import difflib
+from concurrent.futures import ProcessPoolExecutor
+
+SAMPLES_DIR = os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "code_test"))
+
+DIRECTIVE_RE = re.compile(r"^\s*#\s*(if|ifdef|ifndef|elif|else|endif|define|undef|include|includeext|set|setdep|rem|noexec)\b.*$")
+NUMBER_RE = re.compile(r"^[-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?$")
+NUM_IN_TEXT_RE = re.compile(r"(?<![\w@.])[-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?(?![\w@])")
+FIDELITY_TOKEN_RE = re.compile(r'"(?:\\.|[^"\\])*"|[{}()\[\]=]|[^\s{}()\[\]="]+')
+
+SDE_TOKEN_RE = re.compile(r"""(?P<ws>\s+)|(?P<comment>;[^\n]*)|(?P<str>"(?:\\.|[^"\\])*")|(?P<open>\()|(?P<close>\))"""
+                          r"""|(?P<quote>,@|['`,])|(?P<atom>[^\s()";'`,]+)""")
+# sdevice 注释：# 到行尾；行首或空白之后的 * 到行尾（a*b 这类 token 内的 * 不算）
+DES_TOKEN_RE = re.compile(r"""(?P<ws>\s+)|(?P<comment>\#[^\n]*|(?<!\S)\*[^\n]*)|(?P<str>"(?:\\.|[^"\\])*")"""
+                          r"""|(?P<punct>[{}()\[\]=])|(?P<atom>[^\s{}()\[\]="\#]+)""")
+DES_SECTION_RE = re.compile(r"^\s*(File|Electrode|Physics|Plot|Math|Solve|Device|System|CurrentPlot|Thermode)\s*[{(]", re.M)
+SPROCESS_CMD_RE = re.compile(r"^\s*(init|implant|diffuse|deposit|etch|line\s+[xyz]|region|mask|photo|struct)\b", re.M)
+
+# SDE 命令 -> 逻辑类别（按顺序匹配）
+SDE_CATEGORIES = [
+    (re.compile(r"^sdegeo:.*contact|^sdegeo:set-contact"), "contacts"),
+    (re.compile(r"^sdegeo:|^sdepe:"), "geometry"),
+    (re.compile(r"^sdedr:.*(refine|multibox)"), "mesh_refinement"),
+    (re.compile(r"^sdedr:"), "doping"),
+    (re.compile(r"^sde:build-mesh|^sdesnmesh:|^sdeaxisaligned:|^sdenoffset:"), "mesh"),
+    (re.compile(r"^sdeio:"), "io"),
+    (re.compile(r"^(define|set!|let\*?)$"), "variables"),
+    (re.compile(r"^sde:"), "setup"),
+]
+# sprocess / Tcl 命令 -> 逻辑类别
+TCL_CATEGORIES = [
+    (re.compile(r"^(line|region|init)$"), "grid_init"),
+    (re.compile(r"^(refinebox|grid|mgoals|pdbSet|math|SetPlxList|AdvancedCalibration|SetTemp|option)$"), "setup"),
+    (re.compile(r"^(mask|photo|deposit|etch|strip|polish|transform)$"), "deposit_etch"),
+    (re.compile(r"^implant$"), "implant"),
+    (re.compile(r"^(diffuse|temp_ramp|gas_flow)$"), "anneal"),
+    (re.compile(r"^(struct|contact|select|plot\.1d|plot\.2d|layers|WritePlx)$"), "output"),
+    (re.compile(r"^(set|proc|fproc|if|elseif|else|foreach|for|while|switch|puts|source|expr|return|catch)$"), "control"),
+]
+TCL_SCRIPT_CMDS = {"if", "elseif", "else", "foreach", "for", "while", "proc", "fproc", "catch", "switch"}
+
+
+def categorize(name, table):
+    for pat, cat in table:
+        if pat.search(name):
+            return cat
+    return "other"
+
+
+def detect_dialect(path, text):
+    """按 SWB 后缀判断方言，否则看内容"""
+    base = os.path.basename(path).lower()
+    if base.endswith(("_dvs.cmd", ".scm")):
+        return "sde"
+    if base.endswith("_des.cmd"):
+        return "sdevice"
+    if base.endswith(("_fps.cmd", "_ins.cmd", ".tcl", "_vis.cmd")):
+        return "tcl"
+    # 多数非注释行以 "(" 开头即视为 Scheme（允许个别裸行，如 13.cmd 首行）
+    lines = [l.strip() for l in text.splitlines()
+             if l.strip() and not l.strip().startswith((";", "#")) and not DIRECTIVE_RE.match(l)]
+    if lines and sum(l.startswith("(") for l in lines) * 2 > len(lines):
+        return "sde"
+    if DES_SECTION_RE.search(text):
+        return "sdevice"
+    return "tcl"
+
+
+def to_number(tok):
+    if NUMBER_RE.match(tok):
+        try:
+            return float(tok)
+        except ValueError:
+            return None
+    return None
+
+
+def numbers_in(text):
+    out = []
+    for m in NUM_IN_TEXT_RE.finditer(text):
+        try:
+            out.append(float(m.group(0)))
+        except ValueError:
+            continue
+    return out
+
+
+def split_directives(text):
+    """SWB 预处理指令行单独取出（它们不属于任何方言的语法）；返回 (行号->指令, 去掉指令后的文本)"""
+    directives = {}
+    lines = text.splitlines()
+    for i, line in enumerate(lines):
+        if DIRECTIVE_RE.match(line):
+            directives[i + 1] = line.strip()
+            lines[i] = ""
+    return directives, "\n".join(lines)
+
+
+def _line_of(text, pos, starts):
+    # starts: 每行起始偏移，二分查找行号
+    lo, hi = 0, len(starts)
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if starts[mid] <= pos:
+            lo = mid + 1
+        else:
+            hi = mid
+    return lo
+
+
+def _line_starts(text):
+    starts = [0]
+    for m in re.finditer("\n", text):
+        starts.append(m.end())
+    return starts
+
+
+def _attach_directives(items, directives):
+    """把指令按行号插回顶层 items（items 需带 line）"""
+    out = []
+    pending = sorted(directives.items())
+    for it in items:
+        while pending and pending[0][0] < it.get("line", 0):
+            ln, d = pending.pop(0)
+            out.append({"directive": d, "line": ln})
+        out.append(it)
+    out.extend({"directive": d, "line": ln} for ln, d in pending)
+    return out
+
+
+# ---------------- SDE (Scheme) ----------------
+
+def parse_sde(text):
+    directives, body = split_directives(text)
+    starts = _line_starts(body)
+    stack = [[]]
+    quotes = [[]]  # 每层待附加的引号前缀
+    line_stack = []
+    items, errors = [], []
+    prev_end_line = 0
+    for m in SDE_TOKEN_RE.finditer(body):
+        kind, tok = m.lastgroup, m.group(0)
+        if kind == "ws":
+            continue
+        line = _line_of(body, m.start(), starts)
+        if kind == "comment":
+            if len(stack) == 1 and line != prev_end_line:
+                items.append({"comment": tok, "line": line})
+            continue
+        if kind == "quote":
+            quotes[-1].append(tok)
+            continue
+        if kind == "open":
+            stack.append([])
+            quotes.append([])
+            line_stack.append(line)
+            continue
+        if kind == "close":
+            if len(stack) == 1:
+                errors.append(f"line {line}: 多余的 ')'")
+                continue
+            node = stack.pop()
+            quotes.pop()
+            start_line = line_stack.pop()
+            _push_sde(stack, quotes, node, items, start_line)
+            prev_end_line = line
+            continue
+        _push_sde(stack, quotes, tok, items, line)
+        prev_end_line = line
+    while len(stack) > 1:
+        node = stack.pop()
+        quotes.pop()
+        start_line = line_stack.pop()
+        errors.append(f"line {start_line}: 括号未闭合")
+        _push_sde(stack, quotes, node, items, start_line)
+
+    forms = _attach_directives(items, directives)
+    commands, variables, numbers = [], {}, []
+    for idx, it in enumerate(forms):
+        if "form" not in it:
+            continue
+        f = it["form"]
+        _collect_numbers_sde(f, numbers)
+        if isinstance(f, list) and f and isinstance(f[0], str):
+            name = f[0]
+            args = [render_sde_node(a) for a in f[1:]]
+            cat = categorize(name, SDE_CATEGORIES)
+            commands.append({"name": name, "args": args, "line": it["line"], "item": idx, "category": cat})
+            if name == "define" and len(f) >= 3:
+                target = f[1][0] if isinstance(f[1], list) and f[1] else f[1]
+                if isinstance(target, str):
+                    variables[target] = " ".join(args[1:])
+    return {
+        "dialect": "sde",
+        "items": forms,
+        "commands": commands,
+        "variables": variables,
+        "sections": _group_sections(commands),
+        "numbers": sorted(set(numbers)),
+        "errors": errors,
+    }
+
+
+def _push_sde(stack, quotes, node, items, line):
+    while quotes[-1]:
+        node = {"q": quotes[-1].pop(), "x": node}
+    if len(stack) == 1:
+        items.append({"form": node, "line": line})
+    else:
+        stack[-1].append(node)
+
+
+def _collect_numbers_sde(node, out):
+    if isinstance(node, list):
+        for x in node:
+            _collect_numbers_sde(x, out)
+    elif isinstance(node, dict):
+        _collect_numbers_sde(node["x"], out)
+    else:
+        v = to_number(node)
+        if v is not None:
+            out.append(v)
+
+
+def render_sde_node(node):
+    if isinstance(node, list):
+        return "(" + " ".join(render_sde_node(x) for x in node) + ")"
+    if isinstance(node, dict):
+        return node["q"] + render_sde_node(node["x"])
+    return node
+
+
+def _group_sections(commands):
+    """连续同类命令合并成一个逻辑段"""
+    sections = []
+    for c in commands:
+        if sections and sections[-1]["name"] == c["category"]:
+            sections[-1]["commands"].append(c["item"])
+            sections[-1]["end_line"] = c["line"]
+        else:
+            sections.append({"name": c["category"], "commands": [c["item"]], "start_line": c["line"],
+                             "end_line": c["line"]})
+    return sections
+
+
+# ---------------- sdevice ----------------
+
+def _lex_des(text):
+    directives, body = split_directives(text)
+    starts = _line_starts(body)
+    toks = []
+    last_line = 0
+    for m in DES_TOKEN_RE.finditer(body):
+        kind, tok = m.lastgroup, m.group(0)
+        if kind == "ws":
+            continue
+        line = _line_of(body, m.start(), starts)
+        if kind == "comment":
+            if line != last_line:  # 只保留整行注释，行尾注释丢弃
+                toks.append(("comment", tok, line))
+            continue
+        toks.append((kind, tok, line))
+        last_line = line
+    for ln, d in directives.items():
+        toks.append(("directive", d, ln))
+    toks.sort(key=lambda t: t[2])
+    return toks
+
+
+class _DesParser:
+    CLOSE = {"{": "}", "(": ")", "[": "]"}
+
+    def __init__(self, toks):
+        self.toks = toks
+        self.i = 0
+        self.errors = []
+
+    def peek(self):
+        return self.toks[self.i] if self.i < len(self.toks) else (None, None, None)
+
+    def group(self, opener):
+        closer = self.CLOSE[opener]
+        items = self.items(closer)
+        if self.peek()[1] == closer:
+            self.i += 1
+        else:
+            self.errors.append(f"'{opener}' 未闭合")
+        return items
+
+    def value(self):
+        kind, tok, _ = self.peek()
+        if tok in self.CLOSE and kind == "punct":
+            self.i += 1
+            key = {"{": "body", "(": "args", "[": "list"}[tok]
+            return {key: self.group(tok)}
+        self.i += 1
+        return tok
+
+    def items(self, closer=None):
+        out = []
+        while self.i < len(self.toks):
+            kind, tok, line = self.peek()
+            if kind == "punct" and tok == closer:
+                return out
+            if kind in ("comment", "directive"):
+                out.append({kind: tok, "line": line})
+                self.i += 1
+                continue
+            if kind == "punct":
+                if tok in self.CLOSE:
+                    self.i += 1
+                    key = {"{": "body", "(": "args", "[": "list"}[tok]
+                    out.append({key: self.group(tok), "line": line})
+                else:
+                    self.errors.append(f"line {line}: 多余的 '{tok}'")
+                    self.i += 1
+                continue
+            self.i += 1
+            nxt = self.peek()
+            if nxt[0] == "punct" and nxt[1] == "=":
+                self.i += 1
+                out.append({"k": tok, "v": self.value(), "line": line})
+                continue
+            node = {"name": tok, "line": line}
+            if self.peek()[0] == "punct" and self.peek()[1] == "(":
+                self.i += 1
+                node["args"] = self.group("(")
+            if self.peek()[0] == "punct" and self.peek()[1] == "{":
+                self.i += 1
+                node["body"] = self.group("{")
+            out.append(node)
+        return out
+
+
+def render_des_inline(items):
+    parts = []
+    for it in items:
+        if isinstance(it, str):
+            parts.append(it)
+        elif "comment" in it or "directive" in it:
+            continue
+        elif "k" in it:
+            v = it["v"]
+            parts.append(f"{it['k']}=" + (v if isinstance(v, str) else render_des_inline([v])))
+        elif "name" in it:
+            s = it["name"]
+            if "args" in it:
+                s += "(" + render_des_inline(it["args"]) + ")"
+            if "body" in it:
+                s += " {" + render_des_inline(it["body"]) + "}"
+            parts.append(s)
+        elif "args" in it:
+            parts.append("(" + render_des_inline(it["args"]) + ")")
+        elif "list" in it:
+            parts.append("[" + render_des_inline(it["list"]) + "]")
+        elif "body" in it:
+            parts.append("{ " + render_des_inline(it["body"]) + " }")
+    return " ".join(parts)
+
+
+def _des_simple(items):
+    return all(isinstance(x, str) or "k" in x or ("name" in x and "body" not in x) for x in items)
+
+
+def render_des(items, indent=0):
+    pad = "  " * indent
+    lines = []
+    for it in items:
+        if "comment" in it:
+            lines.append(pad + it["comment"])
+        elif "directive" in it:
+            lines.append(it["directive"])
+        elif "name" in it and "body" in it:
+            head = it["name"] + ("(" + render_des_inline(it["args"]) + ")" if "args" in it else "")
+            lines.append(pad + head + " {")
+            lines.extend(render_des(it["body"], indent + 1))
+            lines.append(pad + "}")
+        elif "body" in it and "name" not in it and not _des_simple(it["body"]):
+            lines.append(pad + "{")
+            lines.extend(render_des(it["body"], indent + 1))
+            lines.append(pad + "}")
+        else:
+            lines.append(pad + render_des_inline([it]))
+    return lines
+
+
+def parse_sdevice(text):
+    p = _DesParser(_lex_des(text))
+    items = p.items()
+    sections, commands, parameters, numbers = [], [], [], []
+
+    def walk(nodes, path):
+        for it in nodes:
+            if isinstance(it, str):
+                v = to_number(it)
+                if v is not None:
+                    numbers.append(v)
+                elif not it.startswith('"'):
+                    commands.append({"path": "/".join(path), "name": it})
+                continue
+            if "k" in it:
+                v = it["v"]
+                val = v if isinstance(v, str) else render_des_inline([v])
+                parameters.append({"path": "/".join(path), "key": it["k"], "value": val})
+                numbers.extend(numbers_in(val))
+                if not isinstance(v, str):
+                    walk(next(iter(v.values())), path + [it["k"]])
+                continue
+            if "name" in it:
+                commands.append({"path": "/".join(path), "name": it["name"], "line": it.get("line")})
+                label = it["name"] + ("(" + render_des_inline(it["args"]) + ")" if "args" in it else "")
+                walk(it.get("args", []), path + [label])
+                walk(it.get("body", []), path + [label])
+                continue
+            for key in ("args", "list", "body"):
+                if key in it:
+                    walk(it[key], path)
+
+    for idx, it in enumerate(items):
+        if isinstance(it, dict) and "name" in it:
+            sections.append({"name": it["name"], "args": render_des_inline(it.get("args", [])), "item": idx,
+                             "start_line": it.get("line")})
+    walk(items, [])
+    return {
+        "dialect": "sdevice",
+        "items": items,
+        "commands": commands,
+        "parameters": parameters,
+        "sections": sections,
+        "numbers": sorted(set(numbers)),
+        "errors": p.errors,
+    }
+
+
+# ---------------- sprocess / Tcl ----------------
+
+def _read_braced(text, i, open_ch, close_ch):
+    """从 text[i]==open_ch 读到配对的 close_ch（含），支持反斜杠转义"""
+    depth, j = 0, i
+    while j < len(text):
+        c = text[j]
+        if c == "\\":
+            j += 2
+            continue
+        if c == open_ch:
+            depth += 1
+        elif c == close_ch:
+            depth -= 1
+            if depth == 0:
+                return j + 1
+        j += 1
+    return len(text)
+
+
+def _read_quoted(text, i):
+    j = i + 1
+    while j < len(text):
+        if text[j] == "\\":
+            j += 2
+            continue
+        if text[j] == '"':
+            return j + 1
+        j += 1
+    return len(text)
+
+
+def _tcl_commands(text, base_line=1):
+    """把 Tcl 脚本切成命令 [(words, line)] 与注释，word 保留原文"""
+    out = []
+    i, n = 0, len(text)
+    line = base_line
+    while i < n:
+        c = text[i]
+        if c in " \t;\r":
+            i += 1
+            continue
+        if c == "\n":
+            line += 1
+            i += 1
+            continue
+        if c == "\\" and i + 1 < n and text[i + 1] == "\n":
+            i += 2
+            line += 1
+            continue
+        if c == "#":
+            j = text.find("\n", i)
+            j = n if j < 0 else j
+            out.append(({"comment": text[i:j].rstrip()}, line))
+            i = j
+            continue
+        words, start_line = [], line
+        while i < n and text[i] not in "\n;":
+            c = text[i]
+            if c in " \t\r":
+                i += 1
+                continue
+            if c == "\\" and i + 1 < n and text[i + 1] == "\n":
+                i += 2
+                line += 1
+                continue
+            j = i
+            if c == "{":
+                j = _read_braced(text, i, "{", "}")
+            elif c == '"':
+                j = _read_quoted(text, i)
+            else:
+                while j < n and text[j] not in " \t\r\n;":
+                    if text[j] == "[":
+                        j = _read_braced(text, j, "[", "]")
+                    elif text[j] == '"':
+                        j = _read_quoted(text, j)
+                    elif text[j] == "\\" and j + 1 < n:
+                        if text[j + 1] == "\n":
+                            break
+                        j += 2
+                    else:
+                        j += 1
+            word = text[i:j]
+            line += word.count("\n")
+            words.append(word)
+            i = j
+        if words:
+            out.append((words, start_line))
+    return out
+
+
+def parse_tcl_script(text, base_line=1):
+    items = []
+    for words, line in _tcl_commands(text, base_line):
+        if isinstance(words, dict):
+            words["line"] = line
+            items.append(words)
+            continue
+        parsed = []
+        for w in words:
+            if words[0] in TCL_SCRIPT_CMDS and w.startswith("{") and "\n" in w:
+                parsed.append({"script": parse_tcl_script(w[1:-1], line + w[:1].count("\n"))})
+            else:
+                parsed.append(w)
+        items.append({"words": parsed, "line": line})
+    return items
+
+
+def _tcl_params(words):
+    params, flags = {}, []
+    k = 1
+    while k < len(words):
+        w = words[k]
+        if isinstance(w, dict):
+            k += 1
+            continue
+        if w.endswith("=") and len(w) > 1 and k + 1 < len(words) and isinstance(words[k + 1], str):
+            params[w[:-1]] = words[k + 1]  # sprocess 常见 "location= 0.0" 写法
+            k += 2
+            continue
+        if "=" in w and not w.startswith(("{", '"', "[", "$")):
+            key, val = w.split("=", 1)
+            params[key] = val
+        else:
+            flags.append(w)
+        k += 1
+    return params, flags
+
+
+def parse_tcl(text):
+    directives, body = split_directives(text)
+    items = _attach_directives(parse_tcl_script(body), directives)
+    commands, numbers = [], []
+
+    def walk(nodes, depth, top_idx):
+        for idx, it in enumerate(nodes):
+            if "words" not in it:
+                continue
+            t = top_idx if top_idx is not None else idx
+            words = it["words"]
+            name = words[0] if isinstance(words[0], str) else ""
+            params, flags = _tcl_params(words)
+            for w in words[1:]:
+                if isinstance(w, str):
+                    numbers.extend(numbers_in(w))
+            commands.append({"name": name, "params": params, "flags": flags, "line": it["line"], "depth": depth,
+                             "item": t, "category": categorize(name, TCL_CATEGORIES)})
+            for w in words:
+                if isinstance(w, dict):
+                    walk(w["script"], depth + 1, t)
+
+    walk(items, 0, None)
+    top = [c for c in commands if c["depth"] == 0]
+    dialect = "sprocess" if SPROCESS_CMD_RE.search(body) else "tcl"
+    return {
+        "dialect": dialect,
+        "items": items,
+        "commands": commands,
+        "sections": _group_sections(top),
+        "numbers": sorted(set(numbers)),
+        "errors": [],
+    }
+
+
+def render_tcl(items, indent=0):
+    pad = "    " * indent
+    lines = []
+    for it in items:
+        if "comment" in it:
+            lines.append(pad + it["comment"])
+        elif "directive" in it:
+            lines.append(it["directive"])
+        else:
+            parts = []
+            for w in it["words"]:
+                if isinstance(w, dict):
+                    inner = render_tcl(w["script"], indent + 1)
+                    parts.append("{\n" + "\n".join(inner) + ("\n" if inner else "") + pad + "}")
+                else:
+                    parts.append(w)
+            lines.append(pad + " ".join(parts))
+    return lines
+
+
+# ---------------- 统一入口 ----------------
+
+def parse_cmd(text, path=""):
+    dialect = detect_dialect(path, text)
+    if dialect == "sde":
+        ir = parse_sde(text)
+    elif dialect == "sdevice":
+        ir = parse_sdevice(text)
+    else:
+        ir = parse_tcl(text)
+    ir["meta"] = {
+        "source_file": path,
+        "command_count": len(ir["commands"]),
+        "section_names": [s["name"] for s in ir["sections"]],
+        "swb_params": sorted(set(re.findall(r"@[\w:|.-]+@", text))),
+    }
+    return ir
+
+
+def render_cmd(ir):
+    d = ir["dialect"]
+    if d == "sde":
+        lines = []
+        for it in ir["items"]:
+            if "form" in it:
+                lines.append(render_sde_node(it["form"]))
+            else:
+                lines.append(it.get("comment") or it.get("directive"))
+    elif d == "sdevice":
+        lines = render_des(ir["items"])
+    else:
+        lines = render_tcl(ir["items"])
+    return "\n".join(lines).rstrip() + "\n"
+
+
+def fidelity_tokens(text, dialect):
+    """去掉注释 / 续行 / 分号后的 token 序列；SWB 指令整行算一个 token"""
+    toks = []
+    for line in text.replace("\\\n", " ").splitlines():
+        if DIRECTIVE_RE.match(line):
+            toks.append(" ".join(line.split()))
+            continue
+        s = line.strip()
+        if dialect == "sde":
+            line = SDE_TOKEN_RE.sub(lambda m: "" if m.lastgroup == "comment" else m.group(0), line)
+            line = re.sub(r"(,@|['`,])", r" \1 ", line)
+        elif dialect == "sdevice":
+            line = DES_TOKEN_RE.sub(lambda m: "" if m.lastgroup == "comment" else m.group(0), line)
+        else:
+            if s.startswith("#"):
+                continue
+            line = re.sub(r";\s*(#.*)?$", "", line).replace(";", " ")
+        toks.extend(FIDELITY_TOKEN_RE.findall(line))
+    return toks
+
+
+def fidelity(src, rendered, dialect):
+    dialect = dialect if dialect in ("sde", "sdevice") else "tcl"  # sprocess 按 Tcl 分词
+    a, b = fidelity_tokens(src, dialect), fidelity_tokens(rendered, dialect)
+    if a == b:
+        return {"exact": True, "ratio": 1.0, "tokens": len(a)}
+    ratio = difflib.SequenceMatcher(None, a, b, autojunk=False).ratio()
+    return {"exact": False, "ratio": round(ratio, 4), "tokens": len(a)}
+
+
+def build_record(path):
+    with open(path, "r", encoding="utf-8", errors="ignore") as f:
+        text = f.read()
+    ir = parse_cmd(text, path)
+    return {"source_code": text, "ir": ir, "fidelity": fidelity(text, render_cmd(ir), ir["dialect"])}
+
+
+def get_relative_path_filename(input_dir, file_path):
+    rel_path = os.path.relpath(file_path, input_dir)
+    return rel_path.replace(os.sep, '_').replace('.cmd', '.json')
+
+
+def process_one(args):
+    """进程池任务：解析单个文件并写出 JSON，返回摘要"""
+    path, in_dir, out_dir = args
+    try:
+        rec = build_record(path)
+    except Exception as e:
+        return {"file": path, "ok": False, "error": f"{type(e).__name__}: {e}"}
+    out_path = os.path.join(out_dir, get_relative_path_filename(in_dir, path))
+    with open(out_path, "w", encoding="utf-8") as f:
+        json.dump(rec, f, ensure_ascii=False, indent=2)
+    return {"file": path, "ok": True, "dialect": rec["ir"]["dialect"], "exact": rec["fidelity"]["exact"],
+            "ratio": rec["fidelity"]["ratio"], "errors": len(rec["ir"]["errors"])}
+
+
+def collect_cmd_files(in_dir):
+    files = []
+    for dp, _, fns in os.walk(in_dir):
+        for fn in fns:
+            if fn.endswith((".cmd", ".tcl", ".scm")):
+                files.append(os.path.join(dp, fn))
+    return sorted(files)
+
+
+def summarize(results):
+    """按方言打印无损往返数与平均 token 保真度"""
+    by_dialect = {}
+    for r in results:
+        d = by_dialect.setdefault(r["dialect"], {"files": 0, "exact": 0, "ratio": 0.0})
+        d["files"] += 1
+        d["exact"] += int(r["exact"])
+        d["ratio"] += r["ratio"]
+    for name, d in sorted(by_dialect.items()):
+        print(f"  {name:<9} 文件 {d['files']:>5}  无损往返 {d['exact']:>5}  平均 token 保真度 {d['ratio'] / d['files']:.4f}")
+
+
+def check_samples(sample_dir):
+    """逐个样例跑 build_record（不写文件）；三种方言都要覆盖，且除源文件本身有解析错误（如括号未闭合）外全部无损"""
+    files = collect_cmd_files(sample_dir)
+    results = []
+    for path in files:
+        rec = build_record(path)
+        results.append({"file": path, "dialect": rec["ir"]["dialect"], "exact": rec["fidelity"]["exact"],
+                        "ratio": rec["fidelity"]["ratio"], "errors": len(rec["ir"]["errors"])})
+    summarize(results)
+    ok = True
+    for r in results:
+        if r["exact"]:
+            continue
+        if r["errors"]:
+            print(f"  [Skip] {r['file']} ratio={r['ratio']} parse_errors={r['errors']}（源文件本身不完整）")
+        else:
+            print(f"  [Lossy] {r['file']} ratio={r['ratio']}")
+            ok = False
+    missing = {"sde", "sdevice", "sprocess"} - {r["dialect"] for r in results}
+    if missing:
+        print(f"[Error] {sample_dir} 缺少方言样例: {', '.join(sorted(missing))}")
+        ok = False
+    print(f"[{'OK' if ok else 'Error'}] {len(results)} 个样例")
+    return ok
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--in-dir", default='/data/sources/Applications_Library')
+    ap.add_argument("--out-dir", default='/data/processed_json/v13/cmd_ir')
+    ap.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    ap.add_argument("--check", default=None, help="只解析单个文件，打印 IR 摘要、渲染结果与保真度")
+    ap.add_argument("--check-samples", nargs="?", const=SAMPLES_DIR, default=None,
+                    help="对样例目录（默认 tcad/code_test，含 ir_samples/）做往返保真度检查")
+    args = ap.parse_args()
+
+    if args.check_samples:
+        sys.exit(0 if check_samples(args.check_samples) else 1)
+
+    if args.check:
+        rec = build_record(args.check)
+        ir = rec["ir"]
+        print(f"方言: {ir['dialect']}  命令数: {len(ir['commands'])}  数值: {len(ir['numbers'])}  错误: {ir['errors']}")
+        print("逻辑段: " + " | ".join(f"{s['name']}@{s.get('start_line')}" for s in ir["sections"]))
+        print("----- 渲染结果 -----")
+        print(render_cmd(ir))
+        print(f"保真度: {rec['fidelity']}")
+        return
+
+    files = collect_cmd_files(args.in_dir)
+    if not files:
+        print(f"[Error] {args.in_dir} 下没有 .cmd 文件")
+        return
+    os.makedirs(args.out_dir, exist_ok=True)
+    start = time.time()
+    results = []
+    with ProcessPoolExecutor(max_workers=args.workers) as ex:
+        tasks = [(p, args.in_dir, args.out_dir) for p in files]
+        for r in ex.map(process_one, tasks, chunksize=max(1, len(tasks) // (args.workers * 4) or 1)):
+            results.append(r)
+            if not r["ok"]:
+                print(f"[Error] {r['file']}: {r['error']}")
+
+    ok = [r for r in results if r["ok"]]
+    print(f"[Done] {len(ok)}/{len(files)} 个文件 -> {args.out_dir}，用时 {time.time() - start:.1f}s")
+    summarize(ok)
+    lossy = [r for r in ok if not r["exact"]]
+    for r in lossy[:10]:
+        print(f"  [Lossy] {r['file']} ratio={r['ratio']} parse_errors={r['errors']}")
+
+
+if __name__ == "__main__":
+    main()
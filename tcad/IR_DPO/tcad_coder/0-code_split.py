@@ -5,7 +5,9 @@ import openai
 from concurrent.futures import ThreadPoolExecutor, as_completed
 
 # Initialize DeepSeek client
-client = openai.Client(api_key='sk-REDACTED', base_url="https://api.deepseek.com")
+# DEEPSEEK_BASE_URL / DEEPSEEK_API_KEY 可覆盖（例如指向 common/mock_llm_server.py 做离线压测）
+client = openai.Client(api_key=os.environ.get("DEEPSEEK_API_KEY", 'sk-REDACTED'),
+                       base_url=os.environ.get("DEEPSEEK_BASE_URL", "https://api.deepseek.com"))
 
 
 def read_cmd_file(file_path):
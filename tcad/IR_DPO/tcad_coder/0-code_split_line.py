@@ -1,6 +1,10 @@
 import os
 import json
 import time
+import argparse
+import shutil
+import tempfile
+import importlib.util
 import openai
 from tqdm import tqdm
 from concurrent.futures import ThreadPoolExecutor, as_completed
@@ -8,6 +12,16 @@ from concurrent.futures import ThreadPoolExecutor, as_completed
 # 初始化 DeepSeek 客户端
 client = openai.Client(api_key='sk-REDACTED', base_url="https://api.deepseek.com")
 
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def load_task_table():
+    path = os.path.join(HERE, "..", "..", "..", "common", "task_table.py")
+    spec = importlib.util.spec_from_file_location("task_table", path)
+    mod = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(mod)
+    return mod
+
 
 def extract_valuable_lines(block_content):
     """提取非空、非注释、有意义的代码行"""
@@ -53,6 +67,21 @@ def annotate_lines_with_model(block_content, lines):
             retry += 1
     return []
 
+def annotate_block(block):
+    """标注单个逻辑块；无有效代码行时返回 None"""
+    block_content = block.get("block_content", "")
+    explanation = block.get("description", "")
+    lines = extract_valuable_lines(block_content)
+    if not lines:
+        return None
+    annotations = annotate_lines_with_model(block_content, lines)
+    return {
+        "block_description": explanation,
+        "block_content": block_content,
+        "annotated_lines": annotations
+    }
+
+
 def process_json_file(json_path, output_path):
     """读取原始JSON，逐块处理每行标注"""
     try:
@@ -66,17 +95,9 @@ def process_json_file(json_path, output_path):
     annotated_blocks = []
 
     for block in logical_blocks:
-        block_content = block.get("block_content", "")
-        explanation = block.get("description", "")
-        lines = extract_valuable_lines(block_content)
-        if not lines:
-            continue
-        annotations = annotate_lines_with_model(block_content, lines)
-        annotated_blocks.append({
-            "block_description": explanation,
-            "block_content": block_content,
-            "annotated_lines": annotations
-        })
+        annotated = annotate_block(block)
+        if annotated is not None:
+            annotated_blocks.append(annotated)
 
     result = {
         "original_file": data.get("original_file"),
@@ -136,7 +157,117 @@ def walk_and_process_all(input_dir, output_dir, max_workers=20):
 
 
 
+# ---------------- 多机分片模式 ----------------
+# 任务粒度为 (文件, 逻辑块)，由共享文件系统上的 SQLite 任务表分配；
+# 每个块的结果写入 <输出>.parts/，同一文件的所有块完成后由最后完成的 worker 合并成原格式输出，
+# 合并只读本次入队的块（payload["blocks"]），合并成功后删除 .parts/，避免下次运行混入旧碎片。
+
+def parts_dir_for(output_path):
+    return output_path + ".parts"
+
+
+def write_json_atomic(path, obj):
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path) or ".", suffix=".tmp")
+    with os.fdopen(fd, 'w', encoding='utf-8') as f:
+        json.dump(obj, f, ensure_ascii=False, indent=2)
+    os.replace(tmp, path)
+
+
+def enqueue_shard_tasks(table, input_dir, output_dir):
+    """扫描输入目录，为每个未完成文件的每个有效块建任务（重复执行不会重复入队）"""
+    tasks = []
+    for root, _, files in os.walk(input_dir):
+        for file in files:
+            if not file.endswith('.json') or file == 'failed_files.md':
+                continue
+            input_path = os.path.join(root, file)
+            relative = os.path.relpath(input_path, input_dir)
+            output_path = os.path.join(output_dir, relative)
+            if is_already_processed(output_path):
+                continue
+            try:
+                with open(input_path, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+            except Exception as e:
+                print(f"读取失败 {input_path}: {e}")
+                continue
+            blocks = data.get("logical_blocks", [])
+            idxs = [idx for idx, block in enumerate(blocks)
+                    if extract_valuable_lines(block.get("block_content", ""))]
+            for idx in idxs:
+                payload = {"input_path": input_path, "output_path": output_path, "block_index": idx, "blocks": idxs}
+                tasks.append((f"{relative}#{idx:05d}", relative, payload))
+    added = table.add_tasks(tasks)
+    print(f"入队 {added} 个新任务（共扫描 {len(tasks)} 个块）")
+
+
+def process_block_task(task):
+    p = task.payload
+    with open(p["input_path"], 'r', encoding='utf-8') as f:
+        block = json.load(f)["logical_blocks"][p["block_index"]]
+    annotated = annotate_block(block)
+    if annotated is None:
+        raise RuntimeError("块中没有有效代码行")
+    # 标注为空（模型多次失败）与非分片模式一致：保留该块、annotated_lines 为空，不阻塞整文件合并
+    parts = parts_dir_for(p["output_path"])
+    os.makedirs(parts, exist_ok=True)
+    write_json_atomic(os.path.join(parts, f"{p['block_index']:05d}.json"), annotated)
+
+
+def assemble_output(table, task):
+    """同一文件的块全部完成后合并输出。多个 worker 可能同时合并：内容相同、原子覆盖；
+    读到一半发现块文件已被删除，说明别的 worker 已合并完并清理，直接返回"""
+    if not table.group_done(task.grp):
+        return
+    p = task.payload
+    with open(p["input_path"], 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    parts = parts_dir_for(p["output_path"])
+    if "blocks" in p:
+        names = [f"{idx:05d}.json" for idx in p["blocks"]]
+    elif os.path.isdir(parts):  # 旧任务表里的任务没有 blocks 字段
+        names = sorted(fn for fn in os.listdir(parts) if fn.endswith(".json"))
+    else:
+        return
+    annotated_blocks = []
+    try:
+        for fn in names:
+            with open(os.path.join(parts, fn), 'r', encoding='utf-8') as f:
+                annotated_blocks.append(json.load(f))
+    except FileNotFoundError:
+        return
+    result = {
+        "original_file": data.get("original_file"),
+        "original_path": data.get("original_path"),
+        "annotated_blocks": annotated_blocks,
+        "success": len(annotated_blocks) > 0
+    }
+    write_json_atomic(p["output_path"], result)
+    shutil.rmtree(parts, ignore_errors=True)
+
+
+def run_shard_worker(db_path, input_dir, output_dir, max_workers, lease_seconds, enqueue):
+    task_table = load_task_table()
+    table = task_table.TaskTable(db_path, lease_seconds=lease_seconds)
+    if enqueue:
+        enqueue_shard_tasks(table, input_dir, output_dir)
+    print(f"任务表状态：{table.stats()}")
+    task_table.run_worker(table, process_block_task, threads=max_workers,
+                          on_done=lambda t: assemble_output(table, t))
+    print(f"任务表状态：{table.stats()}")
+
+
 if __name__ == "__main__":
-    input_json_dir = '/data/processed_json/v13/split_cmd_code/code_block'
-    output_annotated_dir = '/data/processed_json/v13/split_cmd_code/code_line'
-    walk_and_process_all(input_json_dir, output_annotated_dir, max_workers=200)
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--in-dir", default='/data/processed_json/v13/split_cmd_code/code_block')
+    ap.add_argument("--out-dir", default='/data/processed_json/v13/split_cmd_code/code_line')
+    ap.add_argument("--workers", type=int, default=200)
+    ap.add_argument("--shard-db", default=None, help="共享文件系统上的任务表路径；指定后进入多机分片模式")
+    ap.add_argument("--enqueue", action="store_true", help="分片模式下先扫描输入目录入队（可在任意节点重复执行）")
+    ap.add_argument("--lease", type=float, default=300.0, help="租约秒数，超时未续约的任务会被其他 worker 接管")
+    args = ap.parse_args()
+
+    if args.shard_db:
+        run_shard_worker(args.shard_db, args.in_dir, args.out_dir, args.workers, args.lease, args.enqueue)
+    else:
+        walk_and_process_all(args.in_dir, args.out_dir, max_workers=args.workers)
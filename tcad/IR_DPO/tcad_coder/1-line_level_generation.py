@@ -2,23 +2,41 @@ import os
 import json
 import re
 import time
+import argparse
+import importlib.util
 import openai
 from concurrent.futures import ThreadPoolExecutor, as_completed
 
-client = openai.Client(api_key='sk-REDACTED', base_url="https://api.deepseek.com")
+# DEEPSEEK_BASE_URL / DEEPSEEK_API_KEY 可覆盖（例如指向 common/mock_llm_server.py 做离线压测）
+client = openai.Client(api_key=os.environ.get("DEEPSEEK_API_KEY", 'sk-REDACTED'),
+                       base_url=os.environ.get("DEEPSEEK_BASE_URL", "https://api.deepseek.com"))
 
 input_folder = "/Users/wddddds/TcadGPT/TcadGPT/data/processed_json/v13/split_cmd_code/code_line"  # 替换为你的输入路径
 output_folder = "/Users/wddddds/TcadGPT/TcadGPT/data/processed_json/v13/code_enhance/1-line_generation"  # 替换为你的输出路径
-os.makedirs(output_folder, exist_ok=True)
+
+# 批量模式：同一文件内按顺序每 BATCH_SIZE 行合并为一次请求（1 = 逐行请求的旧模式）
+BATCH_SIZE = 30
+# 批量结果中缺失/不合法的行只重发这些行，重试 BATCH_RETRIES 轮后仍缺失的行退回逐行请求
+BATCH_RETRIES = 2
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def load_module(name, path):
+    spec = importlib.util.spec_from_file_location(name, path)
+    mod = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(mod)
+    return mod
+
+
+prompt_templates = load_module("prompt_templates", os.path.join(HERE, "..", "..", "..", "common", "prompt_templates.py"))
 
 def clean_json_response(text):
     return re.sub(r'```(json)?', '', text, flags=re.IGNORECASE).strip()
 
-def generate_line_qa(code_line):
-    prompt = f"""
-你是一个专业的 TCAD 训练数据构造专家，下面是一段 TCAD 脚本中的单行代码：
-
-{code_line}
+# 指令部分逐字节固定在前、代码行放在最后，使所有请求共享同一段可缓存前缀
+LINE_QA_INSTRUCTION = """
+你是一个专业的 TCAD 训练数据构造专家，消息末尾给出一段 TCAD 脚本中的单行代码。
 
 请为这段代码反向构造一个 Alpaca 格式的问答对。
 要求如下：
@@ -30,14 +48,22 @@ def generate_line_qa(code_line):
 - 输出格式是 JSON 对象，字段为 instruction, input, output。
 - 请用中文输出。
 """
+
+LINE_QA_TEMPLATE = prompt_templates.PromptTemplate(
+    name="line_qa",
+    system="你是一个训练数据生成专家，输出必须是结构化 JSON。",
+    instruction=LINE_QA_INSTRUCTION,
+    fields=[("code_line：", "code_line")],
+)
+cache_stats = prompt_templates.CacheStats()
+
+def generate_line_qa(code_line):
     try:
         response = client.chat.completions.create(
             model="deepseek-chat",
-            messages=[
-                {"role": "system", "content": "你是一个训练数据生成专家，输出必须是结构化 JSON。"},
-                {"role": "user", "content": prompt}
-            ]
+            messages=LINE_QA_TEMPLATE.messages(code_line=code_line)
         )
+        cache_stats.record(getattr(response, "usage", None))
         raw = response.choices[0].message.content.strip()
         cleaned = clean_json_response(raw)
         obj = json.loads(cleaned)
@@ -47,7 +73,87 @@ def generate_line_qa(code_line):
     except:
         return None
 
-def process_file(file_path, file_idx, total_files):
+# 批量版本：同样的固定指令前缀，代码行带编号放在最后，要求按编号返回 JSON 数组
+LINE_QA_BATCH_INSTRUCTION = """
+你是一个专业的 TCAD 训练数据构造专家，消息末尾按顺序给出同一个 TCAD 脚本中的若干行代码，每行前面的 [编号] 是行号。
+
+请为每一行代码分别反向构造一个 Alpaca 格式的问答对。
+要求如下：
+- instruction 是根据该行代码生成的一段真实科研用户可能会提的要求，描述他们想完成的任务。
+- input 留空。
+- output 是根据该行代码写的 代码，注释，以及对这行代码每个参数的解释（注释一般写在;符号后面），并且在最后尽量添加物理意义或原理的详细解释，
+解释这行代码是干啥的，在整体起到什么作用？前后行只作为上下文参考，每个问答对只针对自己那一行。
+- 如果某行代码是注释、空行、花括号、或者语义不完整的代码（例如某段字符串的一部分），该行返回 {"index": 编号, "skip": true}。
+- 输出格式是 JSON 数组，每个给出的编号恰好对应一个元素，元素字段为 index, instruction, input, output。
+- 只输出 JSON 数组，不要有任何其他文字。
+- 请用中文输出。
+"""
+
+LINE_QA_BATCH_TEMPLATE = prompt_templates.PromptTemplate(
+    name="line_qa_batch",
+    system="你是一个训练数据生成专家，输出必须是结构化 JSON。",
+    instruction=LINE_QA_BATCH_INSTRUCTION,
+    fields=[("代码行（按编号）：", "numbered_lines")],
+)
+
+
+def _valid_record(obj):
+    return (isinstance(obj, dict) and isinstance(obj.get("instruction"), str) and obj["instruction"].strip()
+            and isinstance(obj.get("output"), str) and obj["output"].strip())
+
+
+def request_line_qa_batch(indexed_lines):
+    """一次请求生成多行问答；返回 {编号: 问答对 或 None(跳过)}，只包含结果合法的编号"""
+    numbered = "\n".join(f"[{i}] {code}" for i, code in indexed_lines)
+    try:
+        response = client.chat.completions.create(
+            model="deepseek-chat",
+            messages=LINE_QA_BATCH_TEMPLATE.messages(numbered_lines=numbered)
+        )
+        cache_stats.record(getattr(response, "usage", None))
+        items = json.loads(clean_json_response(response.choices[0].message.content.strip()))
+    except Exception:
+        return {}
+    if isinstance(items, dict):  # 兼容 {"编号": {...}} 形式
+        items = [dict(v, index=k) for k, v in items.items() if isinstance(v, dict)]
+    if not isinstance(items, list):
+        return {}
+
+    wanted = {i for i, _ in indexed_lines}
+    resolved = {}
+    for item in items:
+        if not isinstance(item, dict):
+            continue
+        try:
+            idx = int(item.get("index"))
+        except (TypeError, ValueError):
+            continue
+        if idx not in wanted or idx in resolved:
+            continue
+        if item.get("skip") is True:
+            resolved[idx] = None
+        elif _valid_record(item):
+            resolved[idx] = {"instruction": item["instruction"], "input": item.get("input") or "",
+                             "output": item["output"]}
+    return resolved
+
+
+def generate_line_qa_batch(codes, batch_size=BATCH_SIZE, retries=BATCH_RETRIES):
+    """按批生成 codes 中每一行的问答对，只重发缺失的行；返回与 codes 对齐的列表（None 表示跳过/失败）"""
+    results = {}
+    pending = list(enumerate(codes))
+    for _ in range(retries + 1):
+        if not pending:
+            break
+        for k in range(0, len(pending), batch_size):
+            results.update(request_line_qa_batch(pending[k:k + batch_size]))
+        pending = [(i, code) for i, code in pending if i not in results]
+    for i, code in pending:  # 多轮仍缺失的行退回逐行请求
+        results[i] = generate_line_qa(code)
+    return [results.get(i) for i in range(len(codes))]
+
+
+def process_file(file_path, file_idx, total_files, batch_size=BATCH_SIZE):
     filename = os.path.basename(file_path)
     output_path = os.path.join(output_folder, filename.replace(".json", "_lineqa.jsonl"))
     if os.path.exists(output_path) and os.path.getsize(output_path) > 0:
@@ -59,15 +165,18 @@ def process_file(file_path, file_idx, total_files):
     except:
         return 0, 1
 
-    output_records = []
+    codes = []
     for block in data.get("annotated_blocks", []):
         for line in block.get("annotated_lines", []):
             code = line.get("code_line", "").strip()
             if not code or code.startswith(";") or code.startswith("//") or code in ["{", "}"]:
                 continue
-            result = generate_line_qa(code)
-            if result:
-                output_records.append(result)
+            codes.append(code)
+
+    if batch_size > 1:
+        output_records = [r for r in generate_line_qa_batch(codes, batch_size) if r]
+    else:
+        output_records = [r for r in map(generate_line_qa, codes) if r]
 
     if output_records:
         with open(output_path, 'w', encoding='utf-8') as f:
@@ -77,7 +186,8 @@ def process_file(file_path, file_idx, total_files):
     print(f"[{file_idx:3d}/{total_files:3d}] {filename:<50} -> {len(output_records)} lines")
     return len(output_records), 0
 
-def process_all(max_workers=200):
+def process_all(max_workers=200, batch_size=BATCH_SIZE):
+    os.makedirs(output_folder, exist_ok=True)
     files = []
     for root, _, filenames in os.walk(input_folder):
         for f in filenames:
@@ -87,10 +197,10 @@ def process_all(max_workers=200):
     total_files = len(files)
     results = []
     start = time.time()
-    print(f"[START] Processing {total_files} files with {max_workers} threads")
+    print(f"[START] Processing {total_files} files with {max_workers} threads, batch_size={batch_size}")
 
     with ThreadPoolExecutor(max_workers=max_workers) as executor:
-        futures = [executor.submit(process_file, f, i+1, total_files) for i, f in enumerate(files)]
+        futures = [executor.submit(process_file, f, i+1, total_files, batch_size) for i, f in enumerate(files)]
         for future in as_completed(futures):
             results.append(future.result())
 
@@ -102,6 +212,11 @@ def process_all(max_workers=200):
     print(f"  Total lines:   {total_lines}")
     print(f"  Failed files:  {failed}")
     print(f"  Time elapsed:  {elapsed:.1f}s")
+    print(f"  {cache_stats.summary()}")
 
 if __name__ == "__main__":
-    process_all()
\ No newline at end of file
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--workers", type=int, default=200)
+    ap.add_argument("--batch-size", type=int, default=BATCH_SIZE, help="每次请求包含的代码行数，1 为逐行请求")
+    args = ap.parse_args()
+    process_all(max_workers=args.workers, batch_size=args.batch_size)
\ No newline at end of file
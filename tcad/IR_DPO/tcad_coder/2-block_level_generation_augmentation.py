@@ -2,10 +2,24 @@ import os
 import json
 import re
 import time
+import importlib.util
 import openai
 from datetime import timedelta, datetime
 from concurrent.futures import ThreadPoolExecutor, as_completed
 
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def load_common(name):
+    path = os.path.join(HERE, "..", "..", "..", "common", f"{name}.py")
+    spec = importlib.util.spec_from_file_location(name, path)
+    mod = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(mod)
+    return mod
+
+
+inflight_memo = load_common("inflight_memo")
+
 # 初始化 DeepSeek 客户端
 client = openai.Client(api_key='sk-REDACTED', base_url="https://api.deepseek.com")
 
@@ -70,12 +84,22 @@ def enhance_output_with_comments(output_code):
         print(f"[ERROR] 增强output失败: {e}")
         return output_code
 
+
+# ---------------- 按代码去重 ----------------
+# 同一段代码只调用一次模型，其余样本复用结果；并发下同一代码的后到线程等待首个线程的结果。
+# 失败结果不缓存，之后遇到同一代码的样本会重新请求。
+
+enhance_memo = inflight_memo.InflightMemo()
+
+
 def augment_single_qa(example, index=None, total=None, start_time=None):
     instruction = example["instruction"].strip()
     output_code = example["output"].strip()
 
     new_instructions = generate_alternative_instructions(instruction, output_code)
-    enhanced_output = enhance_output_with_comments(output_code)
+    enhanced_output = enhance_memo.get(inflight_memo.text_key(output_code),
+                                       lambda: enhance_output_with_comments(output_code),
+                                       failed=lambda r: r == output_code)
 
     new_examples = []
     for new_inst in new_instructions:
@@ -101,6 +125,8 @@ def process_all(input_path, output_path, max_workers=1000):
         data = json.load(f)
 
     total = len(data)
+    unique = len({inflight_memo.text_key(item["output"]) for item in data})
+    print(f"共 {total} 条样本，{unique} 段唯一代码")
     start_time = time.time()
     all_augmented = []
 
@@ -113,6 +139,8 @@ def process_all(input_path, output_path, max_workers=1000):
         json.dump(all_augmented, f, ensure_ascii=False, indent=2)
 
     print(f"增强完成，共生成样本数：{len(all_augmented)}")
+    print(f"[Dedup] 注释增强：样本 {enhance_memo.lookups}，实际调用 {enhance_memo.calls}，"
+          f"节省 {enhance_memo.saved} 次（{enhance_memo.saved_rate:.1%}）")
 
 if __name__ == "__main__":
     process_all(input_path, output_path)
\ No newline at end of file
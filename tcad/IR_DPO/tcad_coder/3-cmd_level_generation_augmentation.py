@@ -2,10 +2,24 @@ import os
 import json
 import re
 import time
+import importlib.util
 import openai
 from datetime import timedelta, datetime
 from concurrent.futures import ThreadPoolExecutor, as_completed
 
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def load_common(name):
+    path = os.path.join(HERE, "..", "..", "..", "common", f"{name}.py")
+    spec = importlib.util.spec_from_file_location(name, path)
+    mod = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(mod)
+    return mod
+
+
+inflight_memo = load_common("inflight_memo")
+
 # 初始化 DeepSeek 客户端
 client = openai.Client(api_key='sk-REDACTED', base_url="https://api.deepseek.com")
 
@@ -46,11 +60,29 @@ Output:
         print(f"[ERROR] 生成instruction失败: {e}")
         return []
 
+
+# ---------------- 按 (instruction, 代码) 去重 ----------------
+# 改写结果同时依赖 instruction 与代码，同一组合只调用一次模型，其余样本复用结果；并发下同一组合的后到线程等待首个线程的结果。
+# 失败结果不缓存，之后遇到同一组合的样本会重新请求。
+
+# 3-cmd_level_generation.py 的 output 为「原始 .cmd 代码 + 固定分隔 + 模型解释」，代码部分只取原始 .cmd
+EXPLANATION_MARK = "\n\n; 以下是对上述 TCAD 脚本的总结和解释：\n"
+
+
+def cmd_body(output_code):
+    return output_code.split(EXPLANATION_MARK, 1)[0]
+
+
+instruction_memo = inflight_memo.InflightMemo()
+
+
 def augment_single_qa(example, index=None, total=None, start_time=None):
     instruction = example["instruction"].strip()
     output_code = example["output"].strip()
 
-    new_instructions = generate_alternative_instructions(instruction, output_code)
+    new_instructions = instruction_memo.get(inflight_memo.text_key(instruction, cmd_body(output_code)),
+                                            lambda: generate_alternative_instructions(instruction, output_code),
+                                            failed=lambda r: not r)
 
     new_examples = []
     for new_inst in new_instructions:
@@ -76,6 +108,8 @@ def process_all(input_path, output_path, max_workers=200):
         data = [json.loads(line) for line in f if line.strip()]
 
     total = len(data)
+    unique = len({inflight_memo.text_key(item["instruction"], cmd_body(item["output"])) for item in data})
+    print(f"共 {total} 条样本，{unique} 组唯一 (instruction, 代码)")
     start_time = time.time()
     all_augmented = []
 
@@ -88,6 +122,8 @@ def process_all(input_path, output_path, max_workers=200):
         json.dump(all_augmented, f, ensure_ascii=False, indent=2)
 
     print(f"增强完成，共生成样本数：{len(all_augmented)}")
+    print(f"[Dedup] instruction 改写：样本 {instruction_memo.lookups}，实际调用 {instruction_memo.calls}，"
+          f"节省 {instruction_memo.saved} 次（{instruction_memo.saved_rate:.1%}）")
 
 if __name__ == "__main__":
     process_all(input_path, output_path)
@@ -0,0 +1,25 @@
+* sdevice 样例：0-cmd_ir.py --check-samples 的保真度用例
+File {
+  Grid= "@tdr@"      * 行尾 * 注释
+  Plot= "@tdrdat@"
+  Current= "@plot@"  # 行尾 # 注释
+}
+Electrode {
+  { Name="source" Voltage= 0.0 }
+  { Name="drain"  Voltage= 0.05 Resist= 1e3 }
+}
+#if "@Type@" == "nMOS"
+Physics {
+  Mobility( DopingDep HighFieldSat Enormal )
+  EffectiveIntrinsicDensity( OldSlotboom )
+}
+#endif
+Physics (Region="channel") { Recombination( SRH( DopingDep ) ) }
+Plot { eDensity hDensity ElectricField/Vector "Doping*Donor" }
+Math { Extrapolate Iterations=20 Digits=5 RelErrControl }
+Solve {
+  * 先解 Poisson
+  Coupled { Poisson }
+  Quasistationary ( InitialStep=1e-3 MaxStep=0.05
+    Goal { Name="drain" Voltage=@Vd@ } ) { Coupled { Poisson Electron Hole } }
+}
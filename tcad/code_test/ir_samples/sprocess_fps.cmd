@@ -0,0 +1,15 @@
+# sprocess 样例：0-cmd_ir.py --check-samples 的保真度用例
+line x location= 0.0 spacing= 0.01<um> tag=top
+line x location=1.0 spacing=0.1 tag=bot
+region Silicon xlo=top xhi=bot
+init concentration=1e15<cm-3> field=Boron
+set Lg 0.1 ; set Tox 2e-3
+foreach e {10 20} {
+    implant Arsenic dose=1e15 energy=$e tilt=0
+    if {$e > 10} {
+        diffuse temperature=1000 time=10<s>
+    }
+}
+deposit material= {Oxide} type=isotropic thickness=[expr $Tox*2] \
+   steps=1
+struct tdr=n@node@_fps
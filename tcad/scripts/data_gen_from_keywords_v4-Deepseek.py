@@ -1,22 +1,36 @@
 import os
 import json
 import time
+import importlib.util
 import openai
 from concurrent.futures import ThreadPoolExecutor, as_completed
 
 # 初始化 DeepSeek 客户端
 # client = openai.Client(api_key='sk-REDACTED', base_url="https://api.deepseek.com")
-client = openai.Client(api_key='sk-REDACTED', base_url="https://api.deepseek.com")
+# DEEPSEEK_BASE_URL / DEEPSEEK_API_KEY 可覆盖（例如指向 common/mock_llm_server.py 做离线压测）
+client = openai.Client(api_key=os.environ.get("DEEPSEEK_API_KEY", 'sk-REDACTED'),
+                       base_url=os.environ.get("DEEPSEEK_BASE_URL", "https://api.deepseek.com"))
 
 
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def load_module(name, path):
+    spec = importlib.util.spec_from_file_location(name, path)
+    mod = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(mod)
+    return mod
+
+
+prompt_templates = load_module("prompt_templates", os.path.join(HERE, "..", "..", "common", "prompt_templates.py"))
+
 input_folder = "data/sources/tcad_V4/keyword_pair"
 output_folder = "data/sources/tcad_V4/alpaca_output"
-os.makedirs(output_folder, exist_ok=True)
 
 
-def build_prompt(paragraph, keyword):
-    return (
-        """
+# 静态部分（system + 指令）逐字节固定在前，段落、关键词依次放在最后，
+# 这样同一段落的多个关键词请求能命中服务端的前缀缓存
+QA_INSTRUCTION = """
         你的任务是：根据提供的专业段落与关键词，生成结构化的中文问答数据，用于微调 Alpaca 格式模型。
         
         输出必须为 JSON 数组，每条数据结构如下：
@@ -71,27 +85,25 @@ def build_prompt(paragraph, keyword):
         13. 务必注意不要在开头或结尾添加```json和```。
             
         """
-        f"""
-        段落内容如下：
-        {paragraph}
 
-        关键词：
-        {keyword}
-        """
-    )
+QA_TEMPLATE = prompt_templates.PromptTemplate(
+    name="keyword_qa",
+    system="你是一个高质量数据生成助手。",
+    instruction=QA_INSTRUCTION,
+    fields=[("段落内容如下：", "paragraph"), ("关键词：", "keyword")],
+)
+cache_stats = prompt_templates.CacheStats()
 
 
 def call_api(paragraph, keyword, index):
-    content = build_prompt(paragraph, keyword)
+    messages = QA_TEMPLATE.messages(paragraph=paragraph, keyword=keyword)
     for retry in range(2):
         try:
             response = client.chat.completions.create(
                 model="deepseek-chat",
-                messages=[
-                    {"role": "system", "content": "你是一个高质量数据生成助手。"},
-                    {"role": "user", "content": content}
-                ]
+                messages=messages
             )
+            cache_stats.record(getattr(response, "usage", None))
             result = response.choices[0].message.content.strip()
             print(f"\n[Thread-{index}] 关键词: {keyword}\n段落: {paragraph[:200]}...\n生成:\n{result}\n")
             return result
@@ -160,6 +172,7 @@ def process_jsonl_file(file_path, output_path, stats):
 
 
 if __name__ == "__main__":
+    os.makedirs(output_folder, exist_ok=True)
     stats = {"total_all": 0, "total_done": 0}
     jsonl_files = [f for f in os.listdir(input_folder) if f.endswith(".jsonl")]
 
@@ -196,4 +209,5 @@ if __name__ == "__main__":
         print(f"\n🚀 开始处理文件: {filename}")
         process_jsonl_file(input_path, output_path, stats)
 
-    print("\n✅ 所有处理完成！")
\ No newline at end of file
+    print("\n✅ 所有处理完成！")
+    print(cache_stats.summary())
\ No newline at end of file
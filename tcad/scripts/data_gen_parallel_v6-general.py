@@ -1,7 +1,8 @@
 import requests
 import os
 import time
-from concurrent.futures import ThreadPoolExecutor, as_completed
+import importlib.util
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
 from requests.adapters import HTTPAdapter
 from urllib3.util.retry import Retry
 
@@ -27,33 +28,33 @@ retries = Retry(
 session.mount("https://", HTTPAdapter(max_retries=retries))
 
 
-def process_md_document(file_path):
-    sections = []
-    with open(file_path, 'r', encoding='utf-8') as file:
-        content = file.readlines()
+HERE = os.path.dirname(os.path.abspath(__file__))
+MAX_WORKERS = 2
+MAX_IN_FLIGHT = MAX_WORKERS * 2
+MIN_SECTION_TOKENS = 32
+MAX_SECTION_TOKENS = 2000
+# 相邻小节打包到约 TARGET_INPUT_TOKENS 再发请求，问题数与 max_tokens 随打包大小缩放
+TARGET_INPUT_TOKENS = 2400
+TOKENIZER = "estimate"  # 或 "tiktoken:cl100k_base" / "hf:<tokenizer 路径>"
+
 
-    content = [line for line in content if not (line.startswith("![]") or line.startswith("Figure"))]
+def load_module(name, path):
+    spec = importlib.util.spec_from_file_location(name, path)
+    mod = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(mod)
+    return mod
 
-    current_section = []
-    for line in content:
-        if line.startswith('#'):
-            if current_section:
-                section_text = ' '.join(current_section).strip()
-                if len(section_text) >= 1000:
-                    sections.append(section_text)
-            current_section = [line.strip()]
-        else:
-            current_section.append(line.strip())
 
-    if current_section:
-        section_text = ' '.join(current_section).strip()
-        if len(section_text) >= 10:
-            sections.append(section_text)
+sectionizer = load_module("md_sectionizer", os.path.join(HERE, "..", "..", "common", "md_sectionizer.py"))
+packer = load_module("token_packer", os.path.join(HERE, "..", "..", "common", "token_packer.py"))
+token_len = packer.get_tokenizer(TOKENIZER)
 
-    return sections
+
+def process_md_document(file_path):
+    return sectionizer.iter_sections(file_path, MIN_SECTION_TOKENS, MAX_SECTION_TOKENS, token_len)
 
 
-def generate_task(content, index, total_docs, session):
+def generate_task(content, index, total_docs, session, qa_count=10, max_tokens=2048):
     start_time = time.time()
     print(f"线程 {index} 正在生成任务指令，处理内容:\n{content[:200]}...\n")
 
@@ -101,11 +102,11 @@ def generate_task(content, index, total_docs, session):
                         "请一定注意不要生成完全相同的问题，这点非常重要。但可以生成稍微不同的问题，比如对功能相似的指令各生成一个问题。"
                         "请用中文生成，instruction和output都必须用中文，严禁使用英文。"
                         "请一定确保content中所有的重要的信息都被某个问题提问到了，哪怕是非常相似的功能，也要分成两个问题提问，一定确保不能出现content中介绍了的功能但没有生成相关问题这种情况。"
-                        "确保尽量多的生成问题！只要有不同就可以生成。每次至少生成10个问题，可以更多不能更少，但要确保每个问题都有不同。"},
-            {"role": "user", "content": content}
+                        "确保尽量多的生成问题！只要有不同就可以生成。每次至少生成用户消息末尾要求数量的问题，可以更多不能更少，但要确保每个问题都有不同。"},
+            {"role": "user", "content": f"{content}\n\n（本段资料请至少生成 {qa_count} 个问题。）"}
         ],
         "stream": False,
-        "max_tokens": 2048,
+        "max_tokens": max_tokens,
         "temperature": 0.7,
         "top_p": 0.7,
         "top_k": 50,
@@ -148,25 +149,37 @@ def generate_task(content, index, total_docs, session):
     return generated_content
 
 
-def data_gen(doc_path):
-    docs = process_md_document(doc_path)
-    total_docs = len(docs)
-    output = []
+def data_gen(doc_path, out_file):
     finished = 0
+    stats = {"sections": 0, "requests": 0, "tokens": 0}
 
-    print(f"开始并行处理文档，总共有 {total_docs} 部分待生成任务指令。\n")
+    print("开始并行处理文档（分段按需生成）。\n")
 
-    with ThreadPoolExecutor(max_workers=2) as executor:
-        futures = {executor.submit(generate_task, content, i, total_docs, session): i for i, content in enumerate(docs, start=1)}
-
-        for future in as_completed(futures):
-            result = future.result()
-            output.append(result)
+    def _collect(done):
+        nonlocal finished
+        for future in done:
+            if finished:
+                out_file.write("\n")
+            out_file.write(future.result())
             finished += 1
-            print(f"已完成 {finished}/{total_docs}。")
-
-    print("所有部分并行生成完成。")
-    return output
+            print(f"已完成 {finished}。")
+
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+        pending = set()
+        packs = packer.pack_sections(process_md_document(doc_path), TARGET_INPUT_TOKENS, token_len)
+        for i, pack in enumerate(packs, start=1):
+            stats["sections"] += pack.n_sections
+            stats["requests"] += 1
+            stats["tokens"] += pack.tokens
+            pending.add(executor.submit(generate_task, pack.text, i, None, session, pack.qa_count, pack.max_tokens))
+            if len(pending) >= MAX_IN_FLIGHT:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                _collect(done)
+        _collect(wait(pending)[0])
+
+    print(f"所有部分并行生成完成：{stats['sections']} 个小节打包为 {stats['requests']} 个请求，"
+          f"平均输入约 {stats['tokens'] / max(1, stats['requests']):.0f} token。")
+    return finished
 
 
 if __name__ == "__main__":
@@ -176,10 +189,11 @@ if __name__ == "__main__":
     for filename in os.listdir(md_path):
         if filename.endswith(".md") and filename[:-3] + '.txt' not in os.listdir(save_path):
             file_path = os.path.join(md_path, filename)
-            output = data_gen(file_path)
-
             output_filename = filename.replace('.md', '.txt')
             output_file_path = os.path.join(save_path, output_filename)
 
-            with open(output_file_path, 'w', encoding='utf-8') as output_file:
-                output_file.write("\n".join(output))
+            # 先写 .part，完成后再改名，避免中断的文件被当作已处理跳过
+            part_path = output_file_path + ".part"
+            with open(part_path, 'w', encoding='utf-8') as output_file:
+                data_gen(file_path, output_file)
+            os.replace(part_path, output_file_path)
@@ -3,7 +3,8 @@ import os
 import time
 import json
 import re
-from concurrent.futures import ThreadPoolExecutor, as_completed
+import importlib.util
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
 from requests.adapters import HTTPAdapter
 from urllib3.util.retry import Retry
 
@@ -19,29 +20,23 @@ session.headers.update({
 retries = Retry(total=1, backoff_factor=1, status_forcelist=[500, 502, 503, 504, 408], allowed_methods=["POST"])
 session.mount("https://", HTTPAdapter(max_retries=retries))
 
+HERE = os.path.dirname(os.path.abspath(__file__))
+MAX_WORKERS = 5
+MIN_SECTION_TOKENS = 32
+MAX_SECTION_TOKENS = 1500
+MAX_IN_FLIGHT = MAX_WORKERS * 2
+
+def load_module(name, path):
+    spec = importlib.util.spec_from_file_location(name, path)
+    mod = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(mod)
+    return mod
+
+sectionizer = load_module("md_sectionizer", os.path.join(HERE, "..", "..", "common", "md_sectionizer.py"))
+
 def process_md_document(file_path):
-    sections = []
-    with open(file_path, 'r', encoding='utf-8') as file:
-        content = file.readlines()
-    content = [line for line in content if not (line.startswith("![]") or line.startswith("Figure"))]
-
-    current_section = []
-    for line in content:
-        if line.startswith('#'):
-            if current_section:
-                section_text = ' '.join(current_section).strip()
-                if len(section_text) >= 100:
-                    sections.append(section_text)
-            current_section = [line.strip()]
-        else:
-            current_section.append(line.strip())
-
-    if current_section:
-        section_text = ' '.join(current_section).strip()
-        if len(section_text) >= 100:
-            sections.append(section_text)
-
-    return sections
+    # 流式分段：小段合并到 token 预算而不是丢弃，超大文件也只占常数内存
+    return sectionizer.iter_sections(file_path, MIN_SECTION_TOKENS, MAX_SECTION_TOKENS)
 
 def safe_json_loads(text):
     try:
@@ -138,32 +133,35 @@ def generate_keywords(content, index, total_docs, session, fail_log_path):
         "success": len(keywords) > 0
     }
 
-def extract_keywords_from_file(doc_path, fail_log_path):
-    docs = process_md_document(doc_path)
-    total_docs = len(docs)
-    output = []
+def extract_keywords_from_file(doc_path, fail_log_path, out_file):
     success_count = 0
     keyword_total = 0
+    total_docs = 0
 
-    print(f"\n开始处理文件：{doc_path}（共 {total_docs} 段）")
-
-    with ThreadPoolExecutor(max_workers=5) as executor:
-        futures = {
-            executor.submit(generate_keywords, content, i, total_docs, session, fail_log_path): i
-            for i, content in enumerate(docs, start=1)
-        }
+    print(f"\n开始处理文件：{doc_path}")
 
-        for future in as_completed(futures):
+    def _collect(done):
+        nonlocal success_count, keyword_total
+        for future in done:
             result = future.result()
-            output.append(result)
+            out_file.write(json.dumps(result, ensure_ascii=False) + "\n")
             if result["success"]:
                 success_count += 1
                 keyword_total += len(result["keywords"])
 
-    fail_count = total_docs - success_count
-    print(f"\n统计结果：成功 {success_count} 段，失败 {fail_count} 段，提取关键词总数 {keyword_total}\n")
+    # 分段按需生成，在途请求数有上限，结果边完成边写出
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+        pending = set()
+        for i, content in enumerate(process_md_document(doc_path), start=1):
+            total_docs = i
+            pending.add(executor.submit(generate_keywords, content, i, None, session, fail_log_path))
+            if len(pending) >= MAX_IN_FLIGHT:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                _collect(done)
+        _collect(wait(pending)[0])
 
-    return output
+    fail_count = total_docs - success_count
+    print(f"\n统计结果：共 {total_docs} 段，成功 {success_count} 段，失败 {fail_count} 段，提取关键词总数 {keyword_total}\n")
 
 if __name__ == "__main__":
     input_md_dir = 'data/sources/tcad_V4'
@@ -184,10 +182,10 @@ if __name__ == "__main__":
                     continue
 
                 file_path = os.path.join(root, filename)
-                output = extract_keywords_from_file(file_path, fail_log_path)
-
-                with open(output_file_path, 'w', encoding='utf-8') as f:
-                    for item in output:
-                        f.write(json.dumps(item, ensure_ascii=False) + "\n")
+                # 先写 .part，完成后再改名，避免中断的文件被当作已处理跳过
+                part_path = output_file_path + ".part"
+                with open(part_path, 'w', encoding='utf-8') as f:
+                    extract_keywords_from_file(file_path, fail_log_path, f)
+                os.replace(part_path, output_file_path)
 
                 print(f"{relative_path} 提取关键词完成，结果保存在：{output_file_path}\n")